@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Model decode throughput: generated per-class decoders vs ``to_python``.
+
+Decodes a list of job payloads (100k by default) the way ``get_jobs`` does,
+once through the original ``cls()`` + ``to_python`` path and once through
+``Job.new_from_dict``, and reports the best of ``--repeat`` runs.
+
+    python benchmarks/bench_decode.py --count 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import payloads  # noqa: E402
+from xplenty import Cluster, Columns, Job, Package, Schedule  # noqa: E402
+from xplenty.xplenty_api import to_python  # noqa: E402
+
+MODELS = {
+    'jobs': Job,
+    'clusters': Cluster,
+    'packages': Package,
+    'schedules': Schedule,
+}
+
+
+def decode_to_python(cls, items):
+    return [to_python(obj=cls(), in_dict=item, str_keys=cls._strs,
+                      int_keys=cls._ints, float_keys=cls._floats,
+                      date_keys=cls._dates, bool_keys=cls._bools,
+                      dict_keys=cls._dicts, object_map=cls._map, _h=None)
+            for item in items]
+
+
+def decode_compiled(cls, items):
+    return [cls.new_from_dict(item) for item in items]
+
+
+def decode_lazy_dates(cls, items):
+    return [cls.new_from_dict(item, lazy_dates=True) for item in items]
+
+
+def decode_lazy_status(cls, items):
+    # lazy hydration, reading only the fields most callers look at
+    models = [cls.new_from_dict(item, lazy=True) for item in items]
+    for model in models:
+        model.id, model.status
+    return models
+
+
+def decode_columns(cls, items):
+    return Columns(cls, items=items)
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--resource', choices=sorted(MODELS), default='jobs')
+    parser.add_argument('--no-dates', action='store_true',
+                        help="drop date fields to isolate decoder overhead")
+    args = parser.parse_args(argv)
+
+    cls = MODELS[args.resource]
+    items = payloads.generate(args.resource, args.count)
+    if args.no_dates:
+        for item in items:
+            for key in cls._dates:
+                item.pop(key, None)
+
+    old = best_of(args.repeat, decode_to_python, cls, items)
+    new = best_of(args.repeat, decode_compiled, cls, items)
+    lazy = best_of(args.repeat, decode_lazy_dates, cls, items)
+    lazy_status = best_of(args.repeat, decode_lazy_status, cls, items)
+    columns = best_of(args.repeat, decode_columns, cls, items)
+    print("%d %s, best of %d" % (args.count, args.resource, args.repeat))
+    print("%-12s %9s %12s" % ("decoder", "seconds", "objects/s"))
+    print("%-12s %9.3f %12.0f" % ("to_python", old, args.count / old))
+    print("%-12s %9.3f %12.0f" % ("compiled", new, args.count / new))
+    print("%-12s %9.3f %12.0f" % ("lazy dates", lazy, args.count / lazy))
+    print("%-12s %9.3f %12.0f" % ("lazy id+stat", lazy_status,
+                                  args.count / lazy_status))
+    print("%-12s %9.3f %12.0f" % ("columns", columns, args.count / columns))
+    print("speedup %.2fx" % (old / new))
+
+
+if __name__ == '__main__':
+    main()
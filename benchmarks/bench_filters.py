@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Server-side listing filters vs fetching everything and filtering locally.
+
+Looks up the running jobs of one cluster twice against the fake API: once
+with ``get_jobs()`` and a list comprehension, once with
+``get_jobs(status='running', cluster_id=...)``. Reports the bytes
+transferred and the best latency of ``--repeat`` runs, and exits non-zero
+if the filtered query is not both smaller and faster.
+
+    python benchmarks/bench_filters.py --jobs 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fake_server import FakeXplentyServer  # noqa: E402
+from xplenty import XplentyClient  # noqa: E402
+
+
+def local_filter(client, cluster_id):
+    return [job for job in client.get_jobs()
+            if job.status == 'running' and job.cluster_id == cluster_id]
+
+
+def server_filter(client, cluster_id):
+    return client.get_jobs(status='running', cluster_id=cluster_id)
+
+
+def measure(server, repeat, func, *args):
+    """Returns ``(result, best seconds, bytes per call)``."""
+    best = None
+    server.reset_stats()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best, server.bytes_sent // repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="simulated server latency in seconds")
+    args = parser.parse_args(argv)
+
+    with FakeXplentyServer(jobs=args.jobs, latency=args.latency) as server:
+        running = [job for job in server.data['jobs']
+                   if job['status'] == 'running']
+        if not running:
+            print("no running jobs generated")
+            return 1
+        cluster_id = running[0]['cluster_id']
+        client = XplentyClient(server.account_id, 'key',
+                               api_url=server.api_url, rate_limiter=None)
+        client.get_jobs(limit=1)  # open the connection
+
+        local, local_time, local_bytes = measure(
+            server, args.repeat, local_filter, client, cluster_id)
+        remote, remote_time, remote_bytes = measure(
+            server, args.repeat, server_filter, client, cluster_id)
+
+    if sorted(job.id for job in local) != sorted(job.id for job in remote):
+        print("filtered results differ: %d local, %d server-side"
+              % (len(local), len(remote)))
+        return 1
+    print("%d jobs, %d running on cluster %s, best of %d"
+          % (args.jobs, len(remote), cluster_id, args.repeat))
+    print("%-12s %12s %9s" % ("filter", "bytes", "ms"))
+    print("%-12s %12d %9.2f" % ("local", local_bytes, local_time * 1000))
+    print("%-12s %12d %9.2f" % ("server-side", remote_bytes,
+                                remote_time * 1000))
+    print("%.1fx fewer bytes, %.1fx faster"
+          % (local_bytes / max(remote_bytes, 1),
+             local_time / max(remote_time, 1e-9)))
+    if remote_bytes >= local_bytes or remote_time >= local_time:
+        print("REGRESSION: server-side filtering is not smaller and faster")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
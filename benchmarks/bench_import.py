@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Import time of the package, measured in fresh interpreters.
+
+Each scenario runs ``--runs`` times in a new Python process, which times
+its own imports and reports the modules they loaded. The script exits
+non-zero if the median time of a scenario exceeds its budget, or if a
+scenario loads a module it should only load on first use.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --budget-import 5 --budget-client 60
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Heavy modules the blocking client does not need until a feature uses them.
+DEFERRED = ('asyncio', 'concurrent.futures', 'dateutil.parser', 'dateutil.tz',
+            'inspect', 'urllib.request', 'uuid')
+
+SCENARIOS = [
+    ('import xplenty', 'import xplenty', 'budget_import'),
+    ('client', "from xplenty import XplentyClient\n"
+               "XplentyClient('account', 'key')", 'budget_client'),
+]
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, %r)
+before = set(sys.modules)
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed,
+                  "modules": sorted(set(sys.modules) - before)}))
+"""
+
+
+def run_child(code):
+    out = subprocess.check_output([sys.executable, '-c', CHILD % (ROOT, code)])
+    return json.loads(out.decode('utf-8'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--budget-import', type=float, default=10.0,
+                        help="milliseconds allowed for 'import xplenty'")
+    parser.add_argument('--budget-client', type=float, default=110.0,
+                        help="milliseconds allowed to import and create a "
+                             "client")
+    args = parser.parse_args(argv)
+
+    failed = False
+    print("%-16s %9s %9s %9s %8s" % ("scenario", "median ms", "min ms",
+                                      "budget", "modules"))
+    for name, code, budget_name in SCENARIOS:
+        budget = getattr(args, budget_name)
+        results = [run_child(code) for _ in range(args.runs)]
+        times = [result['seconds'] * 1000 for result in results]
+        median = statistics.median(times)
+        loaded = set(results[-1]['modules'])
+        print("%-16s %9.2f %9.2f %9.1f %8d" % (name, median, min(times),
+                                               budget, len(loaded)))
+        if median > budget:
+            print("  REGRESSION: over the %.1f ms budget" % budget)
+            failed = True
+        eager = [module for module in DEFERRED if module in loaded]
+        if eager:
+            print("  REGRESSION: loads %s eagerly" % ', '.join(eager))
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Memory per decoded model object: ``__slots__`` models vs ``__dict__`` ones.
+
+The "dict" columns store exactly the same field values in a plain instance
+``__dict__``, which is how models were laid out before they got slots.
+"B/obj" counts everything a decoded object keeps alive (field values
+included), "shell" only the instance and its attribute storage. "columns
+B/rec" is the same records decoded into ``Columns`` instead of objects.
+
+    python benchmarks/bench_memory.py --count 20000
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import payloads  # noqa: E402
+from xplenty import (  # noqa: E402
+    AccountLimits, Cluster, Columns, Job, Package, Schedule
+)
+
+MODELS = [
+    ('jobs', Job),
+    ('clusters', Cluster),
+    ('packages', Package),
+    ('schedules', Schedule),
+]
+
+
+class DictModel(object):
+    """Plain ``__dict__``-backed object to compare against."""
+
+
+def to_dict_model(model):
+    obj = DictModel()
+    for key in model.__slots__ + ('_h',):
+        if hasattr(model, key):
+            obj.__dict__[key] = getattr(model, key)
+    return obj
+
+
+def measure(build, items):
+    """Returns bytes allocated per object kept alive by ``build``."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(item) for item in items]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    size = (after - before) / float(len(kept))
+    del kept
+    return size
+
+
+def measure_columns(cls, items):
+    """Returns bytes per record of ``items`` decoded into columns."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    columns = Columns(cls, items=items)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del columns
+    return (after - before) / float(len(items))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    rows = [(resource, cls, payloads.generate(resource, args.count))
+            for resource, cls in MODELS]
+    rows.append(('limits', AccountLimits,
+                 [{'limit': 100, 'remaining': i} for i in range(args.count)]))
+
+    print("%-14s %11s %12s %11s %12s %6s %13s" % (
+        "model", "dict B/obj", "slots B/obj", "dict shell", "slots shell",
+        "saved", "columns B/rec"))
+    for resource, cls, items in rows:
+        # one-time costs (compiling the decoder, importing dateutil.tz)
+        # must not land in the first measurement
+        warm_up = items[:100]
+        [to_dict_model(cls.new_from_dict(item)) for item in warm_up]
+        Columns(cls, items=warm_up)
+        slotted = measure(lambda item: cls.new_from_dict(item), items)
+        legacy = measure(
+            lambda item: to_dict_model(cls.new_from_dict(item)), items)
+        sample = cls.new_from_dict(items[0])
+        legacy_obj = to_dict_model(sample)
+        slots_shell = sys.getsizeof(sample)
+        dict_shell = (sys.getsizeof(legacy_obj)
+                      + sys.getsizeof(legacy_obj.__dict__))
+        columnar = measure_columns(cls, items)
+        print("%-14s %11.0f %12.0f %11d %12d %5.0f%% %13.0f" % (
+            cls.__name__, legacy, slotted, dict_shell, slots_shell,
+            100.0 * (1 - slotted / legacy), columnar))
+
+
+if __name__ == '__main__':
+    main()
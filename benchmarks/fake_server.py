@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for the Xplenty API, for benchmarks.
+
+Serves the endpoints ``XplentyClient`` uses from a seeded in-memory dataset
+built by :mod:`payloads`, over HTTP/1.1 with keep-alive. Latency and error
+injection are configurable and driven by a seeded RNG, so runs are
+reproducible::
+
+    with FakeXplentyServer(jobs=5000, latency=0.005) as server:
+        client = XplentyClient("acme", "key", api_url=server.api_url)
+"""
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import payloads
+
+SORT_FIELDS = {"created": "created_at", "updated": "updated_at"}
+FILTER_FIELDS = ("status", "cluster_id")
+ROUTE = re.compile(r"^/(?P<account>[^/]+)/api/(?P<resource>[a-z_]+)"
+                   r"(?:/(?P<id>[^/]+))?/?$")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeXplenty/1.0"
+    # headers and body go out in separate writes; without this, delayed
+    # ACKs add ~40ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, obj, extra_headers=()):
+        server = self.server.fake
+        body = json.dumps(obj).encode("utf-8")
+        encoding = None
+        accept = self.headers.get("Accept-Encoding", "")
+        if server.compress and len(body) > 1024:
+            if "gzip" in accept:
+                body, encoding = gzip.compress(body, 5), "gzip"
+            elif "deflate" in accept:
+                body, encoding = zlib.compress(body, 5), "deflate"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("X-RateLimit-Limit", str(server.rate_limit))
+        self.send_header("X-RateLimit-Remaining", str(server.rate_limit))
+        for name, value in extra_headers:
+            self.send_header(name, value)
+        self.end_headers()
+        # counted before the client can see the response
+        server.record(len(body))
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return json.loads(body) if body else {}
+
+    def _dispatch(self, method):
+        server = self.server.fake
+        url = urlsplit(self.path)
+        match = ROUTE.match(url.path)
+        body = self._read_body() if method == "POST" else None
+        server.delay()
+        injected = server.injected_error()
+        if injected:
+            return self._send_json(injected, {"message": "Injected error"},
+                                   [("Retry-After", "0")])
+        if match is None:
+            return self._send_json(404, {"message": "Not found"})
+        resource, id = match.group("resource"), match.group("id")
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        handler = getattr(self, "%s_%s" % (method.lower(),
+                                           "item" if id else "collection"))
+        handler(server, resource, id, query, body)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def get_collection(self, server, resource, id, query, body):
+        if resource == "rate_limit_status":
+            return self._send_json(200, {"limits": {
+                "limit": server.rate_limit, "remaining": server.rate_limit}})
+        items = server.data.get(resource)
+        if items is None:
+            return self._send_json(404, {"message": "Not found"})
+        items = server.select(resource, items, query)
+        self._send_json(200, items)
+
+    def get_item(self, server, resource, id, query, body):
+        item = server.find(resource, id)
+        if item is None:
+            return self._send_json(404, {"message": "Not found"})
+        etag = '"%s"' % item.get("updated_at")
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            server.record(0)
+            return self.end_headers()
+        self._send_json(200, item, [("ETag", etag)])
+
+    def post_collection(self, server, resource, id, query, body):
+        if resource not in ("jobs", "clusters"):
+            return self._send_json(404, {"message": "Not found"})
+        item = server.create(resource, body,
+                             self.headers.get("Idempotency-Key"))
+        self._send_json(201, item)
+
+    def post_item(self, server, resource, id, query, body):
+        self._send_json(404, {"message": "Not found"})
+
+    def delete_collection(self, server, resource, id, query, body):
+        self._send_json(404, {"message": "Not found"})
+
+    def delete_item(self, server, resource, id, query, body):
+        status = {"jobs": "stopping", "clusters": "pending_terminate"}
+        item = server.find(resource, id)
+        if item is None or resource not in status:
+            return self._send_json(404, {"message": "Not found"})
+        with server.lock:
+            item["status"] = status[resource]
+            item["updated_at"] = server.now()
+        self._send_json(200, item)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops SYNs when many clients connect at once
+    request_queue_size = 128
+
+
+class FakeXplentyServer(object):
+    """In-process fake API server running on a background thread.
+
+    :param jobs: Number of jobs in the dataset (and so on for the others).
+    :param latency: Seconds added to every response.
+    :param jitter: Extra random latency, uniformly in ``[0, jitter)``.
+    :param error_rate: Fraction of requests answered with an injected error.
+    :param error_statuses: HTTP statuses to pick injected errors from.
+    :param compress: Gzip/deflate large responses when the client allows.
+    :param max_limit: Most items a listing returns, whatever ``limit`` the
+        client asked for, like an API capping its page size.
+    :param seed: Seed for the dataset and for latency/error injection.
+    """
+
+    def __init__(self, jobs=1000, clusters=50, packages=200, schedules=100,
+                 latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_statuses=(429, 502, 503), compress=True,
+                 rate_limit=100000, max_limit=None, account_id="acme",
+                 seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.compress = compress
+        self.rate_limit = rate_limit
+        self.max_limit = max_limit
+        self.account_id = account_id
+        self.lock = threading.Lock()
+        self._rnd = random.Random(seed)
+        self.data = {
+            "jobs": payloads.generate("jobs", jobs, seed, account_id),
+            "clusters": payloads.generate("clusters", clusters, seed,
+                                          account_id),
+            "packages": payloads.generate("packages", packages, seed,
+                                          account_id),
+            "schedules": payloads.generate("schedules", schedules, seed,
+                                           account_id),
+        }
+        self._index = dict(
+            (resource, dict((item["id"], item) for item in items))
+            for resource, items in self.data.items())
+        self._created = {}
+        self.requests = 0
+        self.bytes_sent = 0
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def api_url(self):
+        """Base URL to pass to ``XplentyClient(api_url=...)``."""
+        host, port = self._httpd.server_address[:2]
+        return "http://%s:%d/%%s/api/" % (host, port)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._httpd = _HTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name="fake-xplenty-api")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes_sent = 0
+
+    def record(self, nbytes):
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += nbytes
+
+    def delay(self):
+        with self.lock:
+            wait = self.latency + (self._rnd.random() * self.jitter
+                                   if self.jitter else 0.0)
+        if wait > 0:
+            time.sleep(wait)
+
+    def injected_error(self):
+        if not self.error_rate:
+            return None
+        with self.lock:
+            if self._rnd.random() < self.error_rate:
+                return self._rnd.choice(self.error_statuses)
+        return None
+
+    def now(self):
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    def find(self, resource, id):
+        try:
+            return self._index.get(resource, {}).get(int(id))
+        except ValueError:
+            return None
+
+    def select(self, resource, items, query):
+        """Applies the list query parameters the API supports."""
+        for field in FILTER_FIELDS:
+            value = query.get(field)
+            if value is not None:
+                items = [item for item in items
+                         if str(item.get(field)) == value]
+        # timestamps share one format, so they compare as strings
+        since, until = query.get("since"), query.get("until")
+        if since is not None:
+            items = [item for item in items
+                     if (item.get("updated_at") or "") >= since]
+        if until is not None:
+            items = [item for item in items
+                     if (item.get("updated_at") or "") < until]
+        sort = query.get("sort")
+        if sort:
+            field = SORT_FIELDS.get(sort, sort)
+            items = sorted(items, key=lambda item: (item.get(field) or "",
+                                                    item["id"]),
+                           reverse=query.get("direction") == "desc")
+        offset = int(query.get("offset", 0))
+        limit = query.get("limit")
+        if limit is not None:
+            limit = int(limit)
+        if self.max_limit is not None:
+            limit = min(limit or self.max_limit, self.max_limit)
+        if limit is not None:
+            return items[offset:offset + limit]
+        return items[offset:]
+
+    def create(self, resource, body, idempotency_key=None):
+        # one lock section, so concurrent creates get distinct ids and a
+        # retried idempotency key never creates a second item
+        with self.lock:
+            if idempotency_key is not None:
+                item = self._created.get(idempotency_key)
+                if item is not None:
+                    return item
+            items = self.data[resource]
+            new_id = items[-1]["id"] + 1 if items else 1
+            make = payloads.GENERATORS[resource]
+            item = make(self._rnd, new_id, self.account_id)
+            if resource == "jobs":
+                item.update(status="pending", progress=0.0,
+                            cluster_id=body.get("cluster_id"),
+                            package_id=body.get("package_id"),
+                            variables=body.get("variables") or {},
+                            dynamic_variables=(body.get("dynamic_variables")
+                                               or {}))
+            else:
+                item.update(status="pending", type=body.get("type"),
+                            nodes=body.get("nodes"), name=body.get("name"),
+                            description=body.get("description"),
+                            running_jobs_count=0)
+            item["created_at"] = item["updated_at"] = self.now()
+            cluster = self._index["clusters"].get(item.get("cluster_id"))
+            if resource == "jobs" and cluster is not None:
+                cluster["running_jobs_count"] = (
+                    cluster.get("running_jobs_count") or 0) + 1
+            items.append(item)
+            self._index[resource][item["id"]] = item
+            if idempotency_key is not None:
+                self._created[idempotency_key] = item
+        return item
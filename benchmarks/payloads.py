@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Realistic API payloads shared by the benchmarks.
+
+Field sets and value shapes follow the responses of the Xplenty API v2.
+Generation is seeded, so every run decodes exactly the same data.
+"""
+import random
+
+JOB_STATUSES = ['idle', 'pending', 'running', 'completed', 'failed',
+                'stopping', 'stopped']
+CLUSTER_STATUSES = ['pending', 'creating', 'available', 'scaling',
+                    'pending_terminate', 'terminating', 'terminated', 'error']
+
+
+def _timestamp(rnd, year=2020):
+    return "%04d-%02d-%02dT%02d:%02d:%02dZ" % (
+        year, rnd.randint(1, 12), rnd.randint(1, 28), rnd.randint(0, 23),
+        rnd.randint(0, 59), rnd.randint(0, 59))
+
+
+def job(rnd, id, account_id="acme"):
+    status = rnd.choice(JOB_STATUSES)
+    done = status in ('completed', 'failed', 'stopped')
+    return {
+        "id": id,
+        "status": status,
+        "variables": {"OUTPUTPATH": "'s3://bucket/out/%d'" % id,
+                      "Date": "'2020-09-10'"},
+        "dynamic_variables": {"now": "ClockTime()"},
+        "owner_id": rnd.randint(1, 50),
+        "progress": 1.0 if done else round(rnd.random(), 2),
+        "outputs_count": rnd.randint(0, 5),
+        "started_at": _timestamp(rnd),
+        "created_at": _timestamp(rnd),
+        "updated_at": _timestamp(rnd),
+        "failed_at": _timestamp(rnd) if status == 'failed' else None,
+        "completed_at": _timestamp(rnd) if done else None,
+        "cluster_id": rnd.randint(1, 40),
+        "package_id": rnd.randint(1, 200),
+        "errors": "Job failed" if status == 'failed' else None,
+        "runtime_in_seconds": rnd.randint(0, 7200),
+        "url": "https://api.xplenty.com/%s/api/jobs/%d" % (account_id, id),
+    }
+
+
+def cluster(rnd, id, account_id="acme"):
+    return {
+        "id": id,
+        "name": "cluster-%d" % id,
+        "description": "Cluster number %d" % id,
+        "status": rnd.choice(CLUSTER_STATUSES),
+        "owner_id": rnd.randint(1, 50),
+        "nodes": rnd.randint(1, 10),
+        "type": rnd.choice(['production', 'sandbox']),
+        "available_since": _timestamp(rnd),
+        "terminated_at": None,
+        "running_jobs_count": rnd.randint(0, 8),
+        "created_at": _timestamp(rnd),
+        "updated_at": _timestamp(rnd),
+        "terminate_on_idle": rnd.random() < 0.5,
+        "time_to_idle": 3600,
+        "url": "https://api.xplenty.com/%s/api/clusters/%d" % (account_id, id),
+    }
+
+
+def package(rnd, id, account_id="acme"):
+    return {
+        "id": id,
+        "name": "package-%d" % id,
+        "description": "Loads and transforms dataset %d" % id,
+        "variables": {"OUTPUTPATH": "'s3://bucket/out'"},
+        "owner_id": rnd.randint(1, 50),
+        "created_at": _timestamp(rnd),
+        "updated_at": _timestamp(rnd),
+        "url": "https://api.xplenty.com/%s/api/packages/%d" % (account_id, id),
+    }
+
+
+def schedule(rnd, id, account_id="acme"):
+    return {
+        "id": id,
+        "name": "schedule-%d" % id,
+        "description": "Runs package %d" % id,
+        "owner_id": rnd.randint(1, 50),
+        "status": rnd.choice(['enabled', 'disabled']),
+        "start_at": _timestamp(rnd),
+        "next_run_at": _timestamp(rnd),
+        "interval_amount": rnd.randint(1, 24),
+        "interval_unit": rnd.choice(['minutes', 'hours', 'days']),
+        "last_run_at": _timestamp(rnd),
+        "last_run_status": rnd.choice(JOB_STATUSES),
+        "execution_count": rnd.randint(0, 1000),
+        "created_at": _timestamp(rnd),
+        "updated_at": _timestamp(rnd),
+        "variables": {"Date": "'2020-09-10'"},
+        "task": {"nodes": 2, "packages": [{"package_id": id}]},
+        "url": "https://api.xplenty.com/%s/api/schedules/%d" % (account_id, id),
+    }
+
+
+GENERATORS = {
+    'jobs': job,
+    'clusters': cluster,
+    'packages': package,
+    'schedules': schedule,
+}
+
+
+def generate(resource, count, seed=0, account_id="acme"):
+    """Returns ``count`` payload dicts for ``resource``."""
+    rnd = random.Random(seed)
+    make = GENERATORS[resource]
+    return [make(rnd, id, account_id) for id in range(1, count + 1)]
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for the Xplenty client against a local fake API server.
+
+Reports, for every client method, requests per second and p50/p99
+latency, then model decode throughput and memory per object. Everything
+is seeded, so results can be saved with ``--json`` and compared against a
+previous run with ``--baseline`` to catch regressions::
+
+    python benchmarks/run.py --json results.json
+    python benchmarks/run.py --baseline results.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import bench_decode  # noqa: E402
+import bench_memory  # noqa: E402
+import payloads  # noqa: E402
+from fake_server import FakeXplentyServer  # noqa: E402
+from xplenty import XplentyClient  # noqa: E402
+from xplenty.exceptions import XplentyAPIException  # noqa: E402
+
+# name -> call(client, i); ids cycle through the fake dataset
+METHODS = [
+    ('get_clusters', lambda c, i: c.get_clusters()),
+    ('get_cluster', lambda c, i: c.get_cluster(i % 50 + 1)),
+    ('get_jobs', lambda c, i: c.get_jobs()),
+    ('stream_jobs', lambda c, i: sum(1 for _ in c.stream_jobs())),
+    ('get_job', lambda c, i: c.get_job(i % 1000 + 1)),
+    ('get_packages', lambda c, i: c.get_packages()),
+    ('get_package', lambda c, i: c.get_package(i % 200 + 1)),
+    ('get_schedules', lambda c, i: c.get_schedules()),
+    ('get_schedule', lambda c, i: c.get_schedule(i % 100 + 1)),
+    ('get_account_limits', lambda c, i: c.get_account_limits()),
+    ('add_job', lambda c, i: c.add_job(1, 1, {'Date': "'2020-09-10'"})),
+    ('stop_job', lambda c, i: c.stop_job(i % 1000 + 1)),
+    ('terminate_cluster', lambda c, i: c.terminate_cluster(i % 50 + 1)),
+]
+
+# metric -> True if higher is better
+DIRECTIONS = {'rps': True, 'p50_ms': False, 'p99_ms': False,
+              'objects_per_s': True, 'bytes_per_object': False}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1,
+                int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def bench_method(client, call, requests, concurrency):
+    latencies = []
+    errors = [0]
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            call(client, i)
+        except XplentyAPIException:
+            errors[0] += 1
+        latencies.append(time.perf_counter() - start)
+
+    try:
+        call(client, 0)  # warm up the connection pool
+    except XplentyAPIException:
+        pass
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(timed, range(requests)))
+    else:
+        for i in range(requests):
+            timed(i)
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rps': requests / wall,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': errors[0],
+    }
+
+
+def run_http(args):
+    results = {}
+    with FakeXplentyServer(jobs=1000, clusters=50, packages=200,
+                           schedules=100, latency=args.latency,
+                           jitter=args.jitter, error_rate=args.error_rate,
+                           seed=args.seed) as server:
+        client = XplentyClient("acme", "key", api_url=server.api_url,
+                               pool_maxsize=max(args.concurrency, 1))
+        for name, call in METHODS:
+            if args.only and name not in args.only:
+                continue
+            results[name] = bench_method(client, call, args.requests,
+                                         args.concurrency)
+    return results
+
+
+def run_decode(args):
+    results = {}
+    for resource, cls in sorted(bench_decode.MODELS.items()):
+        items = payloads.generate(resource, args.decode_count, args.seed)
+        seconds = bench_decode.best_of(3, bench_decode.decode_compiled, cls,
+                                       items)
+        results[cls.__name__] = {'objects_per_s': args.decode_count / seconds}
+    return results
+
+
+def run_memory(args):
+    results = {}
+    for resource, cls in bench_memory.MODELS:
+        items = payloads.generate(resource, args.decode_count, args.seed)
+        size = bench_memory.measure(lambda item: cls.new_from_dict(item),
+                                    items)
+        results[cls.__name__] = {'bytes_per_object': size}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of metrics that regressed by more than ``tolerance``."""
+    regressions = []
+    for section in ('http', 'decode', 'memory'):
+        for name, metrics in results.get(section, {}).items():
+            old_metrics = baseline.get(section, {}).get(name, {})
+            for metric, value in metrics.items():
+                old = old_metrics.get(metric)
+                higher_is_better = DIRECTIONS.get(metric)
+                if old is None or higher_is_better is None or not old:
+                    continue
+                change = (value - old) / float(old)
+                if higher_is_better:
+                    change = -change
+                if change > tolerance:
+                    regressions.append("%s.%s.%s: %.4g -> %.4g (%+.0f%%)" % (
+                        section, name, metric, old, value, change * 100))
+    return regressions
+
+
+def print_table(title, rows, columns):
+    print("\n== %s ==" % title)
+    print("%-20s" % "" + "".join("%14s" % column for column in columns))
+    for name, metrics in rows.items():
+        print("%-20s" % name + "".join(
+            "%14.1f" % metrics[column] if isinstance(metrics[column], float)
+            else "%14s" % metrics[column] for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200,
+                        help="requests per client method")
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="server latency per response, in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--decode-count', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', help="client methods to run")
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="compare with a --json file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed relative regression, e.g. 0.2")
+    args = parser.parse_args(argv)
+
+    results = {
+        'config': dict(vars(args), python=platform.python_version()),
+    }
+    if not args.skip_http:
+        results['http'] = run_http(args)
+        print_table("client methods", results['http'],
+                    ['rps', 'p50_ms', 'p99_ms', 'errors'])
+    results['decode'] = run_decode(args)
+    print_table("decode throughput", results['decode'], ['objects_per_s'])
+    results['memory'] = run_memory(args)
+    print_table("memory", results['memory'], ['bytes_per_object'])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions beyond %.0f%%:" % (args.tolerance * 100))
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("\nNo regressions beyond %.0f%%." % (args.tolerance * 100))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1175 @@
+"""Offline tests, run against the fake API server in ``benchmarks/``.
+
+Unlike ``tests.py``, these need no Xplenty account::
+
+    python -m pytest -q test_offline.py
+    python -m unittest test_offline
+"""
+import asyncio
+import datetime
+import http.client
+import http.server
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+import zlib
+
+from dateutil.tz import tzutc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'benchmarks'))
+
+import payloads  # noqa: E402
+import xplenty  # noqa: E402
+from fake_server import FakeXplentyServer  # noqa: E402
+from xplenty.async_transport import AsyncConnectionPool  # noqa: E402
+from xplenty.decoders import format_iso8601  # noqa: E402
+from xplenty.exceptions import (  # noqa: E402
+    XplentyAPIException, XplentyRateLimitExceeded)
+from xplenty.instrumentation import PHASES  # noqa: E402
+from xplenty.streaming import JSONArrayParser, iter_json_array  # noqa: E402,E501
+from xplenty.transport import ConnectionPool, ContentDecoder  # noqa: E402,E501
+from xplenty.xplenty_api import to_python  # noqa: E402
+
+MODELS = [
+    ('jobs', xplenty.Job),
+    ('clusters', xplenty.Cluster),
+    ('packages', xplenty.Package),
+    ('schedules', xplenty.Schedule),
+]
+
+
+def decode_to_python(cls, item):
+    return to_python(obj=cls(), in_dict=item, str_keys=cls._strs,
+                     int_keys=cls._ints, float_keys=cls._floats,
+                     date_keys=cls._dates, bool_keys=cls._bools,
+                     dict_keys=cls._dicts, object_map=cls._map, _h=None)
+
+
+class FakeServerTestCase(unittest.TestCase):
+    """Runs a :class:`FakeXplentyServer` for the tests of the class."""
+
+    server_options = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeXplentyServer(**cls.server_options).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def client(self, **kwargs):
+        return xplenty.XplentyClient(self.server.account_id, 'key',
+                                     api_url=self.server.api_url, **kwargs)
+
+    def async_client(self, **kwargs):
+        return xplenty.AsyncXplentyClient(self.server.account_id, 'key',
+                                          api_url=self.server.api_url,
+                                          **kwargs)
+
+    def ids(self, resource):
+        return [item['id'] for item in self.server.data[resource]]
+
+
+class DroppingHandler(http.server.BaseHTTPRequestHandler):
+    """Answers the first request of a connection and drops the next one.
+
+    The dropped request has been read in full, like a server that closed
+    a kept-alive connection while it was processing the request.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.server.methods.append(self.command)
+        self.served = getattr(self, 'served', 0) + 1
+        if self.served > 1:
+            self.close_connection = True
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    do_GET = do_POST = do_DELETE = handle_request
+
+    def do_PUT(self):
+        # a truncated body: the rest never arrives
+        self.send_response(200)
+        self.send_header('Content-Length', '10')
+        self.end_headers()
+        self.wfile.write(b'{"')
+        self.wfile.flush()
+        self.server.release.wait(5)
+
+    def log_message(self, *args):
+        pass
+
+
+class DroppingServer(object):
+
+    def __enter__(self):
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                     DroppingHandler)
+        self.httpd.methods = []
+        self.httpd.release = threading.Event()
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/' % self.httpd.server_address[1]
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.release.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def methods(self):
+        return self.httpd.methods
+
+
+class OffsetIgnoringServer(FakeXplentyServer):
+    """Honours the ``limit`` of listings but not their ``offset``."""
+
+    def select(self, resource, items, query):
+        return super(OffsetIgnoringServer, self).select(
+            resource, items, dict(query, offset='0'))
+
+
+class RecordingServer(FakeXplentyServer):
+    """Keeps the query of every listing request in ``queries``."""
+
+    def __init__(self, **kwargs):
+        super(RecordingServer, self).__init__(**kwargs)
+        self.queries = []
+
+    def select(self, resource, items, query):
+        self.queries.append(dict(query))
+        return super(RecordingServer, self).select(resource, items, query)
+
+    def touch(self, id, **fields):
+        """Updates a job as the API would, moving its ``updated_at``."""
+        job = self.find('jobs', id)
+        job.update(fields, updated_at=self.now())
+        return job
+
+
+class DecoderTest(unittest.TestCase):
+
+    EDGE_CASES = [
+        {},
+        {'id': None, 'created_at': None, 'progress': None, 'variables': None},
+        {'id': '7', 'created_at': 'not a date', 'updated_at': 12,
+         'progress': '0.5', 'terminate_on_idle': 0},
+        {'id': 8, 'created_at': '2020-09-10T14:03:59.5+02:00',
+         'updated_at': 'Sep 10 2020 14:03'},
+    ]
+
+    def assertSameModel(self, cls, item, **options):
+        expected = decode_to_python(cls, item).dict()
+        actual = cls.new_from_dict(item, **options).dict()
+        self.assertEqual(actual, expected, "%s %r" % (cls.__name__, item))
+
+    def test_compiled_decoders_match_to_python(self):
+        for resource, cls in MODELS:
+            for item in payloads.generate(resource, 200) + self.EDGE_CASES:
+                self.assertSameModel(cls, item)
+
+    def test_lazy_decoders_match_to_python(self):
+        for resource, cls in MODELS:
+            for item in payloads.generate(resource, 50) + self.EDGE_CASES:
+                self.assertSameModel(cls, item, lazy_dates=True)
+                self.assertSameModel(cls, item, lazy=True)
+
+    def test_extra_attributes(self):
+        for _, cls in MODELS:
+            obj = cls.new_from_dict({'id': 1}, foo=1)
+            self.assertEqual((obj.id, obj.foo), (1, 1))
+            obj.bar = 2
+            self.assertEqual(obj.bar, 2)
+
+    def test_subclasses_keep_extra_attributes(self):
+        class TaggedJob(xplenty.Job):
+            pass
+
+        job = TaggedJob.new_from_dict({'id': 3, 'status': 'running'},
+                                      lazy=True)
+        job.tag = 'nightly'
+        self.assertEqual((job.id, job.status, job.tag),
+                         (3, 'running', 'nightly'))
+
+    def test_client_models_match_to_python(self):
+        with FakeXplentyServer(jobs=50) as server:
+            client = xplenty.XplentyClient(server.account_id, 'key',
+                                           api_url=server.api_url)
+            jobs = client.get_jobs()
+            for job, item in zip(jobs, server.data['jobs']):
+                self.assertEqual(job.dict(),
+                                 decode_to_python(xplenty.Job, item).dict())
+
+
+class ColumnsTest(unittest.TestCase):
+
+    TIMESTAMPS = [
+        '2020-09-10T14:03:59Z',
+        '2020-09-10T14-03-59Z',
+        '2020-09-10T14:03-59Z',
+        '2020-09-10 14:03:59Z',
+        '2020-09-10T14:03:59.25Z',
+        '2020-09-10T14:03:59+02:00',
+        '2020-09-10T14:03:59',
+        'Sep 10 2020 14:03',
+        'not a date',
+        '',
+    ]
+
+    def test_dates_match_the_decoders(self):
+        items = ([{'id': i, 'created_at': value}
+                  for i, value in enumerate(self.TIMESTAMPS)]
+                 + payloads.generate('jobs', 50))
+        columns = xplenty.Columns(xplenty.Job, ['created_at'], items)
+        for item, value in zip(items, columns['created_at'].tolist()):
+            expected = decode_to_python(xplenty.Job, item).created_at
+            if expected is not None and expected.tzinfo is None:
+                # columns take timestamps without a zone as UTC
+                expected = expected.replace(tzinfo=tzutc())
+            self.assertEqual(value, expected, item['created_at'])
+
+
+class StreamingTest(unittest.TestCase):
+
+    PAYLOADS = [
+        b'[1.25, -3e10, 7]',
+        b'[0,-0.5e-3,12345678901234567890,1E+2]',
+        b' [ true , false , null ] ',
+        b'["a\\u00e9\\"]", "\xc3\xa9\xe2\x82\xac",'
+        b' {"x": [1, {"y": null}]}, []]',
+        b'[]',
+        b'[{}]',
+        b'[7]',
+    ]
+
+    def assertStreams(self, payload, chunk_size):
+        self.assertEqual(
+            list(iter_json_array(io.BytesIO(payload), chunk_size)),
+            json.loads(payload.decode('utf-8')),
+            "%r in chunks of %d" % (payload, chunk_size))
+
+    def test_every_chunk_size(self):
+        for payload in self.PAYLOADS:
+            for chunk_size in range(1, len(payload) + 1):
+                self.assertStreams(payload, chunk_size)
+
+    def test_listing(self):
+        payload = json.dumps(payloads.generate('jobs', 20)).encode('utf-8')
+        for chunk_size in (1, 2, 3, 5, 7, 64, 1000, len(payload)):
+            self.assertStreams(payload, chunk_size)
+
+    def test_malformed(self):
+        for payload in (b'[1.]', b'[1 2]', b'[1,', b'{}', b'[tru]', b'[1'):
+            with self.assertRaises(ValueError, msg=payload):
+                list(iter_json_array(io.BytesIO(payload), 1))
+
+    def test_number_is_held_until_it_ends(self):
+        parser = JSONArrayParser()
+        self.assertEqual(parser.feed(b'[1.'), [])
+        self.assertEqual(parser.feed(b'25'), [])
+        self.assertEqual(parser.feed(b'e1'), [])
+        self.assertEqual(parser.feed(b']'), [12.5])
+        self.assertTrue(parser.done)
+
+
+class RetryTest(unittest.TestCase):
+
+    def add_job_requests(self, policy, idempotency_key=None):
+        """Returns the requests one ``add_job`` makes against a 503 server."""
+        with FakeXplentyServer(jobs=5, error_rate=1.0,
+                               error_statuses=(503,)) as server:
+            client = xplenty.XplentyClient(server.account_id, 'key',
+                                           api_url=server.api_url,
+                                           retry=policy)
+            with self.assertRaises(XplentyAPIException):
+                client.add_job(1, 1, idempotency_key=idempotency_key)
+            return server.requests
+
+    def test_post_needs_retry_add_job(self):
+        policy = xplenty.RetryPolicy()
+        headers = {'Idempotency-Key': 'k'}
+        self.assertTrue(policy.is_retryable('GET'))
+        self.assertFalse(policy.is_retryable('POST'))
+        self.assertFalse(policy.is_retryable('POST', headers))
+        policy = xplenty.RetryPolicy(retry_add_job=True)
+        self.assertFalse(policy.is_retryable('POST'))
+        self.assertTrue(policy.is_retryable('POST', headers))
+
+    def test_add_job_is_not_retried_by_default(self):
+        self.assertEqual(self.add_job_requests(xplenty.RetryPolicy(backoff=0)),
+                         1)
+        self.assertEqual(
+            self.add_job_requests(xplenty.RetryPolicy(backoff=0), 'key'), 1)
+
+    def test_add_job_is_retried_with_retry_add_job(self):
+        policy = xplenty.RetryPolicy(max_retries=3, backoff=0,
+                                     retry_add_job=True)
+        self.assertEqual(self.add_job_requests(policy), 4)
+
+
+class SyncFetchTest(unittest.TestCase):
+
+    def engine(self, server, **kwargs):
+        client = xplenty.XplentyClient(server.account_id, 'key',
+                                       api_url=server.api_url)
+        return xplenty.SyncEngine(client, resources=('jobs',), **kwargs)
+
+    def test_full_sync_over_capped_pages(self):
+        with FakeXplentyServer(jobs=45, max_limit=7) as server:
+            engine = self.engine(server, page_size=10)
+            delta, = engine.sync()
+            self.assertEqual(len(delta.added), 45)
+            self.assertEqual(sorted(job.id for job in engine.items('jobs')),
+                             sorted(item['id']
+                                    for item in server.data['jobs']))
+
+    def test_stops_when_offset_is_ignored(self):
+        with OffsetIgnoringServer(jobs=45) as server:
+            engine = self.engine(server, page_size=10)
+            records, complete = engine._fetch('jobs', None)
+            self.assertEqual(len(records), 10)
+            self.assertFalse(complete)
+            self.assertEqual(server.requests, 2)
+
+    def test_stops_after_max_pages(self):
+        with FakeXplentyServer(jobs=45) as server:
+            engine = self.engine(server, page_size=10, max_pages=3)
+            records, complete = engine._fetch('jobs', None)
+            self.assertEqual(len(records), 30)
+            self.assertFalse(complete)
+            self.assertEqual(server.requests, 3)
+
+
+class FlakySyncEngine(xplenty.SyncEngine):
+    """Fails to confirm missing records while ``fail`` is set."""
+
+    fail = False
+
+    def _confirm_missing(self, resource, ids):
+        for id, record in super(FlakySyncEngine, self)._confirm_missing(
+                resource, ids):
+            if self.fail:
+                raise http.client.RemoteDisconnected('closed')
+            yield id, record
+
+
+class SyncMergeTest(unittest.TestCase):
+
+    def test_failed_confirmation_keeps_the_delta(self):
+        with FakeXplentyServer(jobs=30) as server:
+            client = xplenty.XplentyClient(server.account_id, 'key',
+                                           api_url=server.api_url)
+            engine = FlakySyncEngine(client, resources=('jobs',))
+            deltas = []
+            engine.subscribe(deltas.append)
+            engine.sync()
+            watermark = engine.watermark('jobs')
+
+            added = client.add_job(1, 1)
+            gone = server.data['jobs'].pop(0)
+            del server._index['jobs'][gone['id']]
+            engine.fail = True
+            with self.assertRaises(http.client.RemoteDisconnected):
+                engine.sync(full=True)
+            self.assertIsNone(engine.get('jobs', added.id))
+            self.assertIsNotNone(engine.get('jobs', gone['id']))
+            self.assertEqual(engine.watermark('jobs'), watermark)
+
+            engine.fail = False
+            delta, = engine.sync(full=True)
+            self.assertEqual([job.id for job in delta.added], [added.id])
+            self.assertEqual([job.id for job in delta.removed], [gone['id']])
+            self.assertEqual(len(deltas), 2)
+            self.assertIsNone(engine.get('jobs', gone['id']))
+
+
+class FlakyListingClient(xplenty.XplentyClient):
+    """Its first ``get_jobs`` fails as if the body were undecodable."""
+
+    failures = 1
+
+    def get_jobs(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ValueError('Expecting value')
+        return super(FlakyListingClient, self).get_jobs(*args, **kwargs)
+
+
+class WatcherTest(unittest.TestCase):
+
+    def test_background_thread_survives_errors(self):
+        with FakeXplentyServer(jobs=5) as server:
+            job = server.data['jobs'][0]
+            job['status'] = 'completed'
+            client = FlakyListingClient(server.account_id, 'key',
+                                        api_url=server.api_url)
+            with xplenty.JobWatcher(client, interval=0.05) as watcher:
+                future = watcher.watch(job['id'])
+                self.assertEqual(future.result(5).status, 'completed')
+                self.assertEqual(client.failures, 0)
+                self.assertTrue(watcher._thread.is_alive())
+
+
+class SyncThreadTest(unittest.TestCase):
+
+    def test_background_thread_survives_errors(self):
+        with FakeXplentyServer(jobs=5) as server:
+            client = FlakyListingClient(server.account_id, 'key',
+                                        api_url=server.api_url)
+            engine = xplenty.SyncEngine(client, resources=('jobs',),
+                                        interval=0.05)
+            synced = threading.Event()
+            engine.subscribe(lambda delta: synced.set())
+            with engine:
+                self.assertTrue(synced.wait(5))
+                self.assertEqual(len(engine.items('jobs')), 5)
+                self.assertTrue(engine._thread.is_alive())
+
+
+class ModelStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = [decode_to_python(xplenty.Job, item)
+                     for item in payloads.generate('jobs', 300)]
+        self.store = xplenty.ModelStore(xplenty.Job, self.jobs)
+        self.start = datetime.datetime(2020, 4, 1, tzinfo=tzutc())
+        self.end = datetime.datetime(2020, 9, 1, tzinfo=tzutc())
+
+    def scan(self, jobs, status, cluster_ids):
+        return sorted(j.id for j in jobs
+                      if j.status == status and j.cluster_id in cluster_ids
+                      and self.start <= j.created_at < self.end)
+
+    def ids(self, models):
+        return [m.id for m in models]
+
+    def test_find_uses_indexes(self):
+        found = self.store.find(status='failed', cluster_id=(1, 2, 3, 4, 5),
+                                created_at=(self.start, self.end))
+        self.assertEqual(self.ids(found),
+                         self.scan(self.jobs, 'failed', (1, 2, 3, 4, 5)))
+        self.assertEqual(
+            self.ids(self.store.between('created_at', self.start, self.end)),
+            self.ids(sorted((j for j in self.jobs
+                             if self.start <= j.created_at < self.end),
+                            key=lambda j: (j.created_at, j.id))))
+        self.assertEqual(sum(self.store.values('status').values()), 300)
+
+    def test_update_replaces_models(self):
+        changed = [decode_to_python(xplenty.Job, item)
+                   for item in payloads.generate('jobs', 100, seed=1)]
+        for job in changed:
+            job.id += 250
+        self.store.update(changed)
+        by_id = dict((j.id, j) for j in self.jobs)
+        by_id.update((j.id, j) for j in changed)
+        self.assertEqual(len(self.store), 350)
+        for status in payloads.JOB_STATUSES:
+            self.assertEqual(
+                self.ids(self.store.find(status=status,
+                                         created_at=(self.start, self.end))),
+                sorted(j.id for j in by_id.values() if j.status == status
+                       and self.start <= j.created_at < self.end))
+        keys = self.store._sorted['created_at'].keys
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(keys), 350)
+
+    def test_put_and_remove(self):
+        job = self.jobs[0]
+        removed = self.store.remove(job.id)
+        self.assertIs(removed, job)
+        self.assertIsNone(self.store.remove(job.id))
+        self.assertNotIn(job.id, self.store)
+        self.assertNotIn(job.id, self.ids(self.store.find(status=job.status)))
+        self.assertNotIn(job.id, self.ids(self.store.between('created_at')))
+        self.store.put(job)
+        self.assertIn(job.id, self.ids(self.store.find(
+            status=job.status, created_at=(job.created_at, None))))
+        self.assertEqual(len(self.store._sorted['created_at'].keys), 300)
+
+
+class SinceFilterTest(unittest.TestCase):
+
+    def client(self, server):
+        return xplenty.XplentyClient(server.account_id, 'key',
+                                     api_url=server.api_url)
+
+    def test_incremental_sync_sends_the_watermark(self):
+        with RecordingServer(jobs=40) as server:
+            engine = xplenty.SyncEngine(self.client(server),
+                                        resources=('jobs',), page_size=10)
+            engine.sync()
+            self.assertNotIn('since', server.queries[0])
+            since = format_iso8601(engine.watermark('jobs'))
+            job_id = server.data['jobs'][5]['id']
+            server.touch(job_id, status='completed')
+            del server.queries[:]
+            delta, = engine.sync()
+            self.assertEqual([job.id for job in delta.changed], [job_id])
+            self.assertEqual([query.get('since') for query in server.queries],
+                             [since, since])
+
+    def test_watcher_lists_only_updated_jobs(self):
+        with RecordingServer(jobs=40) as server:
+            ids = [item['id'] for item in server.data['jobs'][:3]]
+            for id in ids:
+                server.touch(id, status='running')
+            watcher = xplenty.JobWatcher(self.client(server))
+            futures = [watcher.watch(id) for id in ids]
+            self.assertEqual(watcher.poll(), 3)
+            self.assertNotIn('since', server.queries[-1])
+
+            server.touch(ids[1], status='completed')
+            server.reset_stats()
+            self.assertEqual(watcher.poll(), 2)
+            self.assertIn('since', server.queries[-1])
+            self.assertEqual(server.requests, 1)
+            self.assertEqual(futures[1].result(0).status, 'completed')
+
+    def test_watcher_looks_up_jobs_watched_late(self):
+        with RecordingServer(jobs=40) as server:
+            first, late = [item['id'] for item in server.data['jobs'][:2]]
+            server.touch(first, status='running')
+            server.find('jobs', late)['status'] = 'failed'
+            watcher = xplenty.JobWatcher(self.client(server))
+            watcher.watch(first)
+            watcher.poll()
+            future = watcher.watch(late)
+            server.reset_stats()
+            self.assertEqual(watcher.poll(), 1)
+            self.assertEqual(server.requests, 2)
+            self.assertEqual(future.result(0).status, 'failed')
+
+            watcher = xplenty.JobWatcher(self.client(server),
+                                         fetch_missing=False)
+            watcher.watch(first)
+            watcher.poll()
+            future = watcher.watch(late)
+            self.assertEqual(watcher.poll(), 1)
+            self.assertNotIn('since', server.queries[-1])
+            self.assertEqual(future.result(0).status, 'failed')
+
+
+class BatchTest(unittest.TestCase):
+
+    SPECS = [(1, 1, {'day': day}) for day in range(5)]
+
+    def client(self, server, **policy):
+        return xplenty.XplentyClient(
+            server.account_id, 'key', api_url=server.api_url,
+            retry=xplenty.RetryPolicy(backoff=0, budget=100, **policy))
+
+    def test_no_keys_or_retries_by_default(self):
+        with FakeXplentyServer(jobs=5, error_rate=1.0,
+                               error_statuses=(503,)) as server:
+            batch = xplenty.JobBatch(self.client(server), self.SPECS)
+            batch.wait()
+            self.assertEqual(batch.progress().failed, 5)
+            self.assertEqual([spec.idempotency_key for spec in batch.specs],
+                             [None] * 5)
+            self.assertEqual(server.requests, 5)
+
+    def test_keys_and_retries_with_retry_add_job(self):
+        with FakeXplentyServer(jobs=5, error_rate=1.0,
+                               error_statuses=(503,)) as server:
+            batch = xplenty.JobBatch(
+                self.client(server, max_retries=2, retry_add_job=True),
+                self.SPECS)
+            batch.wait()
+            self.assertTrue(all(spec.idempotency_key
+                                for spec in batch.specs))
+            self.assertEqual(server.requests, 15)
+
+    def test_resubmitted_batch_starts_no_job_twice(self):
+        with FakeXplentyServer(jobs=5) as server:
+            client = self.client(server, retry_add_job=True)
+            batch = xplenty.JobBatch(client, self.SPECS)
+            first = [job.id for job in batch.results().values()]
+            again = xplenty.JobBatch(client, batch.specs)
+            self.assertEqual([job.id for job in again.results().values()],
+                             first)
+            self.assertEqual(len(server.data['jobs']), 10)
+
+    def test_results_record_any_error_per_job(self):
+        with FakeXplentyServer(jobs=5) as server:
+            client = BrokenBodyClient(server.account_id, 'key',
+                                      api_url=server.api_url)
+            batch = xplenty.JobBatch(client, [(1, 1), (1, 666), (1, 2)])
+            result = batch.results()
+            self.assertEqual(list(result), [0, 1, 2])
+            self.assertIsInstance(result[1], ValueError)
+            self.assertEqual([job.package_id
+                              for job in result.succeeded.values()], [1, 2])
+
+
+class DispatcherKeyTest(unittest.TestCase):
+
+    def queued_key(self, retry=None, **submit):
+        client = xplenty.XplentyClient('acme', 'key', retry=retry)
+        dispatcher = xplenty.JobDispatcher(client)
+        dispatcher.submit(1, **submit)
+        return dispatcher._queue[0].idempotency_key
+
+    def test_key_only_with_retry_add_job(self):
+        self.assertIsNone(self.queued_key())
+        self.assertIsNone(self.queued_key(xplenty.RetryPolicy()))
+        self.assertTrue(
+            self.queued_key(xplenty.RetryPolicy(retry_add_job=True)))
+        self.assertEqual(self.queued_key(idempotency_key='k'), 'k')
+
+
+class BrokenBodyClient(xplenty.XplentyClient):
+    """Fails ``add_job`` of package 666 as if its body were undecodable."""
+
+    def add_job(self, cluster_id, package_id, *args, **kwargs):
+        if package_id == 666:
+            raise ValueError('Expecting value: line 1 column 1 (char 0)')
+        return super(BrokenBodyClient, self).add_job(
+            cluster_id, package_id, *args, **kwargs)
+
+
+class FailingPool(xplenty.ClusterPool):
+    """Raises from the ``place`` call number ``fail_at`` (1-based)."""
+
+    def __init__(self, client, fail_at, **kwargs):
+        super(FailingPool, self).__init__(client, **kwargs)
+        self.fail_at = fail_at
+        self.calls = 0
+
+    def place(self):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise RuntimeError('placement failed')
+        return super(FailingPool, self).place()
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeXplentyServer(jobs=5, clusters=2).start()
+        self.addCleanup(self.server.stop)
+        for cluster in self.server.data['clusters']:
+            cluster.update(status='available', type='production', nodes=1,
+                           running_jobs_count=0)
+        self.client = BrokenBodyClient(self.server.account_id, 'key',
+                                       api_url=self.server.api_url)
+
+    def test_any_add_job_error_resolves_its_future(self):
+        pool = xplenty.ClusterPool(self.client, jobs_per_node=10)
+        dispatcher = xplenty.JobDispatcher(self.client, [pool])
+        futures = [dispatcher.submit(package_id)
+                   for package_id in (666, 1, 2)]
+        self.assertEqual(dispatcher.dispatch(), 0)
+        with self.assertRaises(ValueError):
+            futures[0].result(0)
+        self.assertEqual([future.result(0).package_id
+                          for future in futures[1:]], [1, 2])
+        self.assertEqual(dispatcher.stats().failed, 1)
+
+    def test_failed_dispatch_requeues_unplaced_jobs(self):
+        pool = FailingPool(self.client, fail_at=2, jobs_per_node=10)
+        dispatcher = xplenty.JobDispatcher(self.client, [pool])
+        futures = [dispatcher.submit(package_id) for package_id in (1, 2, 3)]
+        with self.assertRaises(RuntimeError):
+            dispatcher.dispatch()
+        self.assertTrue(futures[0].done())
+        self.assertEqual(dispatcher.queued, 2)
+        self.assertEqual(dispatcher.dispatch(), 0)
+        self.assertEqual([future.result(0).package_id for future in futures],
+                         [1, 2, 3])
+
+    def test_background_thread_survives_errors(self):
+        pool = FailingPool(self.client, fail_at=1, jobs_per_node=10)
+        with xplenty.JobDispatcher(self.client, [pool],
+                                   interval=0.05) as dispatcher:
+            broken = dispatcher.submit(666)
+            with self.assertRaises(ValueError):
+                broken.result(5)
+            self.assertEqual(dispatcher.submit(1).result(5).package_id, 1)
+            self.assertTrue(dispatcher._thread.is_alive())
+
+
+class MultiAccountTest(unittest.TestCase):
+
+    def multi(self, server):
+        return xplenty.MultiAccountClient(
+            {'acme': 'key', 'globex': 'key'}, rate_limiter=None,
+            api_url=server.api_url)
+
+    def test_one_broken_account_does_not_fail_the_others(self):
+        def jobs(client):
+            if client.account_id == 'globex':
+                raise ValueError('Expecting value')
+            return client.get_jobs()
+
+        with FakeXplentyServer(jobs=5) as server:
+            with self.multi(server) as multi:
+                result = multi.fan_out(jobs)
+                items = multi.collect(jobs)
+        self.assertEqual(len(result['acme']), 5)
+        self.assertIsInstance(result['globex'], ValueError)
+        self.assertEqual(len(items), 5)
+        self.assertEqual(list(items.errors), ['globex'])
+
+    def test_get_clusters_sends_a_single_status(self):
+        with RecordingServer(clusters=20) as server:
+            with self.multi(server) as multi:
+                available = multi.get_clusters(status='available')
+                several = multi.get_clusters(status=('available', 'error'))
+        expected = sum(cluster['status'] == 'available'
+                       for cluster in server.data['clusters'])
+        self.assertTrue(expected)
+        self.assertEqual(len(available), 2 * expected)
+        self.assertTrue(all(item.item.status == 'available'
+                            for item in available))
+        self.assertGreaterEqual(len(several), len(available))
+        statuses = [query.get('status') for query in server.queries]
+        self.assertEqual(statuses.count('available'), 4)
+        self.assertEqual(statuses.count(None), 4)
+
+
+class EventRecorder(xplenty.RequestHooks):
+    """Keeps every finished :class:`RequestEvent` in ``events``."""
+
+    def __init__(self):
+        self.events = []
+
+    def after_response(self, event):
+        self.events.append(event)
+
+
+class CallOrderHooks(xplenty.RequestHooks):
+    """Keeps ``(callback, operation, endpoint)`` for every hook call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def before_request(self, event):
+        self.calls.append(('before_request', event.operation, event.endpoint))
+
+    def after_response(self, event):
+        self.calls.append(('after_response', event.operation, event.endpoint))
+
+    def on_error(self, event, error):
+        self.calls.append(('on_error', event.operation, event.endpoint))
+
+
+class InstrumentationTest(FakeServerTestCase):
+
+    server_options = dict(jobs=20, latency=0.05)
+
+    def test_hooks_and_metrics(self):
+        hooks = CallOrderHooks()
+        metrics = xplenty.MetricsCollector()
+        client = self.client(hooks=[hooks, metrics])
+        client.get_job(self.ids('jobs')[0])
+        with self.assertRaises(XplentyAPIException):
+            client.get_job(999999)
+        client.get_jobs()
+
+        self.assertEqual(hooks.calls, [
+            ('before_request', 'get_job', 'GET jobs/{id}'),
+            ('after_response', 'get_job', 'GET jobs/{id}'),
+            ('before_request', 'get_job', 'GET jobs/{id}'),
+            ('on_error', 'get_job', 'GET jobs/{id}'),
+            ('before_request', 'get_jobs', 'GET jobs'),
+            ('after_response', 'get_jobs', 'GET jobs'),
+        ])
+        summary = metrics.summary()
+        self.assertEqual(sorted(summary), ['GET jobs', 'GET jobs/{id}'])
+        job = summary['GET jobs/{id}']
+        self.assertEqual((job['count'], job['errors']), (2, 1))
+        self.assertEqual(job['statuses'], {200: 1, 404: 1})
+        jobs = summary['GET jobs']
+        self.assertEqual((jobs['count'], jobs['errors']), (1, 0))
+        self.assertGreater(jobs['bytes_in'], 0)
+        for stats in (job, jobs):
+            # the server's latency is spent waiting for the headers
+            self.assertGreaterEqual(stats['wait'], 0.05)
+            phases = sum(stats[phase] for phase in PHASES)
+            self.assertLessEqual(phases, stats['mean'])
+            self.assertGreaterEqual(stats['max'], 0.05)
+        self.assertGreater(jobs['decode'] + jobs['hydrate'], 0)
+        self.assertIn('GET jobs/{id}', metrics.report())
+        self.assertEqual(metrics.histogram('GET jobs').count, 1)
+
+
+class CompressionTest(FakeServerTestCase):
+
+    server_options = dict(jobs=50)
+    VARIABLES = dict(('VAR_%d' % i, "'s3://bucket/input/%d'" % i)
+                     for i in range(200))
+
+    def test_large_request_bodies_are_gzipped(self):
+        recorder = EventRecorder()
+        client = self.client(compress_requests=True, compress_min_size=1024,
+                             hooks=[recorder])
+        cluster_id = self.ids('clusters')[0]
+        size = len(json.dumps({'cluster_id': cluster_id, 'package_id': 1,
+                               'variables': self.VARIABLES,
+                               'dynamic_variables': {}}).encode('utf-8'))
+        job = client.add_job(cluster_id, 1, vars=self.VARIABLES)
+        self.assertEqual(self.server.find('jobs', job.id)['variables'],
+                         self.VARIABLES)
+        self.assertEqual(job.variables, self.VARIABLES)
+        self.assertLess(recorder.events[-1].bytes_out, size // 2)
+
+        small = client.add_job(cluster_id, 1, vars={'Date': "'2020-09-10'"})
+        self.assertEqual(small.variables, {'Date': "'2020-09-10'"})
+        self.assertEqual(recorder.events[-1].bytes_out, len(json.dumps(
+            {'cluster_id': cluster_id, 'package_id': 1,
+             'variables': {'Date': "'2020-09-10'"},
+             'dynamic_variables': {}}).encode('utf-8')))
+
+    def test_deflate_responses_are_decoded(self):
+        url = (self.server.api_url % self.server.account_id) + 'jobs'
+        pool = ConnectionPool()
+        response = pool.urlopen('GET', url,
+                                headers={'Accept-Encoding': 'deflate'})
+        self.assertEqual(response.getheader('Content-Encoding'), 'deflate')
+        body = response.read()
+        self.assertEqual([item['id'] for item in json.loads(body)],
+                         self.ids('jobs'))
+
+        async def fetch():
+            pool = AsyncConnectionPool()
+            response = await pool.urlopen(
+                'GET', url, headers={'Accept-Encoding': 'deflate'})
+            return await response.read()
+
+        self.assertEqual(asyncio.run(fetch()), body)
+
+    def test_raw_deflate_responses_are_decoded(self):
+        body = json.dumps(payloads.generate('jobs', 20)).encode('utf-8')
+        compressor = zlib.compressobj(5, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = compressor.compress(body) + compressor.flush()
+        decoder = ContentDecoder('deflate')
+        chunks = [decoder.decompress(data[i:i + 100])
+                  for i in range(0, len(data), 100)]
+        self.assertEqual(b''.join(chunks) + decoder.flush(), body)
+
+
+class CacheTest(FakeServerTestCase):
+
+    server_options = dict(jobs=5)
+
+    def test_fresh_entries_skip_the_request(self):
+        cache = xplenty.ResponseCache(ttl=60)
+        client = self.client(cache=cache)
+        job_id = self.ids('jobs')[0]
+        self.server.reset_stats()
+        first = client.get_job(job_id)
+        second = client.get_job(job_id)
+        self.assertEqual(first.dict(), second.dict())
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_stale_entries_are_revalidated_with_etags(self):
+        cache = xplenty.ResponseCache(ttl=0.05)
+        client = self.client(cache=cache)
+        job_id = self.ids('jobs')[1]
+        first = client.get_job(job_id)
+        time.sleep(0.1)
+        self.server.reset_stats()
+        second = client.get_job(job_id)
+        self.assertEqual(first.dict(), second.dict())
+        self.assertEqual(cache.revalidations, 1)
+        self.assertEqual((self.server.requests, self.server.bytes_sent),
+                         (1, 0))
+
+    def test_mutations_invalidate_cached_entries(self):
+        client = self.client(cache=xplenty.ResponseCache(ttl=60))
+        job_id = self.ids('jobs')[2]
+        cluster_id = self.ids('clusters')[0]
+        jobs = len(client.get_jobs())
+        client.get_job(job_id)
+        client.get_cluster(cluster_id)
+
+        client.stop_job(job_id)
+        self.assertEqual(client.get_job(job_id).status, 'stopping')
+        client.terminate_cluster(cluster_id)
+        self.assertEqual(client.get_cluster(cluster_id).status,
+                         'pending_terminate')
+        client.add_job(cluster_id, 1)
+        self.assertEqual(len(client.get_jobs()), jobs + 1)
+
+
+class CoalesceTest(FakeServerTestCase):
+
+    # slow enough for every caller to join the first one's request
+    server_options = dict(jobs=5, latency=0.2)
+    CALLERS = 8
+
+    def get_in_threads(self, client, job_id):
+        results = [None] * self.CALLERS
+        start = threading.Barrier(self.CALLERS)
+
+        def run(i):
+            start.wait()
+            try:
+                results[i] = client.get_job(job_id)
+            except Exception as error:
+                results[i] = error
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(self.CALLERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def get_in_tasks(self, client, job_id):
+        async def run():
+            return await asyncio.gather(
+                *[client.get_job(job_id) for _ in range(self.CALLERS)],
+                return_exceptions=True)
+
+        return asyncio.run(run())
+
+    def test_threads_share_one_request(self):
+        client = self.client(coalesce=True)
+        job_id = self.ids('jobs')[0]
+        self.server.reset_stats()
+        jobs = self.get_in_threads(client, job_id)
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(set(job.id for job in jobs), set([job_id]))
+        self.assertEqual(client._flights.coalesced, self.CALLERS - 1)
+
+    def test_threads_share_one_error(self):
+        client = self.client(coalesce=True)
+        self.server.reset_stats()
+        errors = self.get_in_threads(client, 999999)
+        self.assertEqual(self.server.requests, 1)
+        self.assertIsInstance(errors[0], XplentyAPIException)
+        self.assertTrue(all(error is errors[0] for error in errors))
+
+    def test_tasks_share_one_request(self):
+        client = self.async_client(coalesce=True)
+        job_id = self.ids('jobs')[1]
+        self.server.reset_stats()
+        jobs = self.get_in_tasks(client, job_id)
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(set(job.id for job in jobs), set([job_id]))
+        self.assertEqual(client._flights.coalesced, self.CALLERS - 1)
+
+    def test_tasks_share_one_error(self):
+        client = self.async_client(coalesce=True)
+        self.server.reset_stats()
+        errors = self.get_in_tasks(client, 999999)
+        self.assertEqual(self.server.requests, 1)
+        self.assertIsInstance(errors[0], XplentyAPIException)
+        self.assertTrue(all(error is errors[0] for error in errors))
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_non_blocking_limiter_raises_when_empty(self):
+        with FakeXplentyServer(jobs=5, rate_limit=2) as server:
+            limiter = xplenty.RateLimiter(limit=2, block=False,
+                                          recalibrate_interval=None)
+            client = xplenty.XplentyClient(server.account_id, 'key',
+                                           api_url=server.api_url,
+                                           rate_limiter=limiter)
+            job_id = server.data['jobs'][0]['id']
+            client.get_job(job_id)
+            client.get_job(job_id)
+            with self.assertRaises(XplentyRateLimitExceeded):
+                client.get_job(job_id)
+            self.assertEqual(server.requests, 2)
+
+
+class TransportTest(unittest.TestCase):
+
+    def request(self, pool, method, url, headers=None):
+        response = pool.urlopen(method, url, body=b'{}', headers=headers)
+        return response.read()
+
+    def test_post_on_dropped_connection_is_not_resent(self):
+        with DroppingServer() as server:
+            pool = ConnectionPool()
+            self.request(pool, 'GET', server.url)
+            with self.assertRaises(http.client.RemoteDisconnected):
+                self.request(pool, 'POST', server.url)
+            self.assertEqual(server.methods, ['GET', 'POST'])
+
+    def test_idempotent_request_on_dropped_connection_is_resent(self):
+        for method, headers in (('GET', None), ('DELETE', None),
+                                ('POST', {'Idempotency-Key': 'k'})):
+            with DroppingServer() as server:
+                pool = ConnectionPool()
+                self.request(pool, 'GET', server.url)
+                self.assertEqual(
+                    self.request(pool, method, server.url, headers), b'{}')
+                self.assertEqual(server.methods, ['GET', method, method])
+
+
+class AsyncTransportTest(unittest.TestCase):
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    async def request(self, pool, method, url, headers=None):
+        response = await pool.urlopen(method, url, body=b'{}',
+                                      headers=headers)
+        return await response.read()
+
+    def test_post_on_dropped_connection_is_not_resent(self):
+        async def run(url):
+            pool = AsyncConnectionPool()
+            await self.request(pool, 'GET', url)
+            with self.assertRaises(http.client.RemoteDisconnected):
+                await self.request(pool, 'POST', url)
+            pool.clear()
+
+        with DroppingServer() as server:
+            self.run_async(run(server.url))
+            self.assertEqual(server.methods, ['GET', 'POST'])
+
+    def test_idempotent_request_on_dropped_connection_is_resent(self):
+        async def run(url, method, headers):
+            pool = AsyncConnectionPool()
+            await self.request(pool, 'GET', url)
+            body = await self.request(pool, method, url, headers)
+            pool.clear()
+            return body
+
+        for method, headers in (('GET', None), ('DELETE', None),
+                                ('POST', {'Idempotency-Key': 'k'})):
+            with DroppingServer() as server:
+                self.assertEqual(
+                    self.run_async(run(server.url, method, headers)), b'{}')
+                self.assertEqual(server.methods, ['GET', method, method])
+
+    def test_timeout_covers_response_headers(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        url = 'http://127.0.0.1:%d/' % listener.getsockname()[1]
+        pool = AsyncConnectionPool(timeout=0.2)
+        try:
+            with self.assertRaises(asyncio.TimeoutError):
+                self.run_async(pool.urlopen('GET', url))
+        finally:
+            listener.close()
+
+    def test_timeout_covers_response_body(self):
+        async def run(url):
+            pool = AsyncConnectionPool(timeout=0.2)
+            response = await pool.urlopen('PUT', url, body=b'{}')
+            await response.read()
+
+        with DroppingServer() as server:
+            with self.assertRaises(asyncio.TimeoutError):
+                self.run_async(run(server.url))
+
+
+class PagingTest(FakeServerTestCase):
+    """Listings served by an API capping pages below the requested size."""
+
+    server_options = dict(clusters=50, packages=30, max_limit=7)
+
+    def test_iter_pages_reads_past_capped_pages(self):
+        client = self.client()
+        for prefetch in (False, True):
+            self.assertEqual(
+                [c.id for c in client.iter_clusters(20, prefetch)],
+                self.ids('clusters'))
+            self.assertEqual(
+                [p.id for p in client.iter_packages(20, prefetch)],
+                self.ids('packages'))
+
+    def test_async_iter_pages_reads_past_capped_pages(self):
+        async def collect(prefetch):
+            async with self.async_client() as client:
+                clusters = [c.id async for c in
+                            client.iter_clusters(20, prefetch)]
+                packages = [p.id async for p in
+                            client.iter_packages(20, prefetch)]
+            return clusters, packages
+
+        for prefetch in (False, True):
+            self.assertEqual(asyncio.run(collect(prefetch)),
+                             (self.ids('clusters'), self.ids('packages')))
+
+    def test_get_columns_pages_clusters_and_packages(self):
+        client = self.client()
+        for resource in ('clusters', 'packages'):
+            columns = client.get_columns(resource, ['id'], page_size=20)
+            self.assertEqual(columns['id'].tolist(), self.ids(resource))
+            self.assertEqual(len(client.get_columns(resource, limit=5)), 5)
+
+    def test_async_get_columns_pages_clusters_and_packages(self):
+        async def collect(resource):
+            async with self.async_client() as client:
+                columns = await client.get_columns(resource, ['id'],
+                                                   page_size=20)
+            return columns['id'].tolist()
+
+        for resource in ('clusters', 'packages'):
+            self.assertEqual(asyncio.run(collect(resource)),
+                             self.ids(resource))
+
+
+class BulkTest(FakeServerTestCase):
+
+    server_options = dict(jobs=20)
+
+    ERRORS = {
+        2: http.client.RemoteDisconnected('closed'),
+        3: ValueError('Expecting value'),
+        4: socket.timeout('timed out'),
+    }
+
+    def assertRecorded(self, result, ids):
+        self.assertEqual(list(result), ids)
+        self.assertEqual(list(result.succeeded), [1])
+        self.assertEqual(result.failed, self.ERRORS)
+
+    def test_bulk_records_errors_per_id(self):
+        def func(id):
+            if id in self.ERRORS:
+                raise self.ERRORS[id]
+            return id
+
+        result = self.client()._bulk(func, [1, 2, 3, 4, 3], 4)
+        self.assertRecorded(result, [1, 2, 3, 4])
+
+    def test_async_bulk_records_errors_per_id(self):
+        async def func(id):
+            if id in self.ERRORS:
+                raise self.ERRORS[id]
+            return id
+
+        async def run():
+            async with self.async_client() as client:
+                return await client._bulk(func, [1, 2, 3, 4, 3], 4)
+
+        self.assertRecorded(asyncio.run(run()), [1, 2, 3, 4])
+
+    def test_bulk_records_api_errors(self):
+        ids = self.ids('jobs')[:3] + [10 ** 9]
+        result = self.client().get_jobs_by_id(ids)
+        self.assertEqual(list(result.succeeded), ids[:3])
+        self.assertIsInstance(result[10 ** 9], XplentyAPIException)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import xplenty
+from xplenty.exceptions import XplentyAPIException
 import os
 import sys
 import time
@@ -81,6 +82,7 @@ class TestSuite:
 
         # Packages
         packages = self.test_get_packages()
+        self.test_iter_packages()
 
         if packages:
             self.test_get_package(packages[0].id)
@@ -121,6 +123,13 @@ class TestSuite:
             self.SKIPPED += 1
             self.print_warn("Skipping test: 'get_job' because add_job failed.")
 
+        if job:
+            self.test_get_jobs_by_id(job.id)
+        else:
+            self.SKIPPED += 1
+            self.print_warn(
+                "Skipping test: 'get_jobs_by_id' because add_job failed.")
+
         # test_stop_job creates its own job if a cluster exists
         if cluster:
             self.test_stop_job(cluster.id, packages[0].id)
@@ -277,6 +286,21 @@ class TestSuite:
 
         return job
 
+    def test_get_jobs_by_id(self, id):
+        name = "get_jobs_by_id"
+        try:
+            missing_id = -1
+            result = api.get_jobs_by_id([id, missing_id])
+            assert list(result.keys()) == [id, missing_id]
+            assert type(result[id]) is xplenty.Job
+            assert result[id].id == id
+            assert isinstance(result[missing_id], XplentyAPIException)
+            assert list(result.failed.keys()) == [missing_id]
+            self.print_pass(name)
+        except Exception as e:
+            self.ERRORS += 1
+            self.print_fail(name, e)
+
     # Trying to stop a "Failed" job will throw validation error.
     def test_stop_job(self, cluster_id, package_id):
         name = "stop_job"
@@ -346,6 +370,23 @@ class TestSuite:
 
         return packages
 
+    def test_iter_packages(self):
+        name = "iter_packages"
+        try:
+            first_page = api.get_packages(offset=0, limit=max_response)
+            packages = list(api.iter_packages(page_size=2))
+            assert len(packages) >= len(first_page)
+            for package in packages:
+                assert type(package) is xplenty.Package
+            assert len(set(package.id for package in packages)) == len(packages)
+
+            prefetched = list(api.iter_packages(page_size=2, prefetch=True))
+            assert [p.id for p in prefetched] == [p.id for p in packages]
+            self.print_pass(name)
+        except Exception as e:
+            self.ERRORS += 1
+            self.print_fail(name, e)
+
     def test_get_package(self, id):
         name = "get_package"
         try:
@@ -1,4 +1,56 @@
-from .xplenty_api import (
-    Cluster, Job, AccountLimits,
-    XplentyClient, Package, Schedule
-)
+import importlib
+
+# Public names and the submodules defining them. Submodules are imported
+# on first access (PEP 562), so ``import xplenty`` stays cheap and a script
+# using only the blocking client never loads asyncio and friends.
+_EXPORTS = {
+    'Cluster': 'xplenty_api',
+    'Job': 'xplenty_api',
+    'AccountLimits': 'xplenty_api',
+    'XplentyClient': 'xplenty_api',
+    'Package': 'xplenty_api',
+    'Schedule': 'xplenty_api',
+    'BulkResult': 'xplenty_api',
+    'ConnectionPool': 'transport',
+    'AsyncXplentyClient': 'async_api',
+    'AsyncConnectionPool': 'async_transport',
+    'JobWatcher': 'watcher',
+    'RateLimiter': 'ratelimit',
+    'ResponseCache': 'cache',
+    'MetricsCollector': 'instrumentation',
+    'RequestHooks': 'instrumentation',
+    'RetryPolicy': 'retry',
+    'MultiAccountClient': 'multi',
+    'AccountItem': 'multi',
+    'SyncEngine': 'sync',
+    'ModelStore': 'store',
+    'JobBatch': 'batch',
+    'JobSpec': 'batch',
+    'ClusterPool': 'dispatcher',
+    'JobDispatcher': 'dispatcher',
+    'Columns': 'columnar',
+    'Column': 'columnar',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None and not name.startswith('_'):
+        # submodules such as ``xplenty.xplenty_api`` used to be loaded by
+        # ``import xplenty`` and stay reachable as attributes
+        try:
+            return importlib.import_module('.' + name, __name__)
+        except ModuleNotFoundError as error:
+            if error.name != '%s.%s' % (__name__, name):
+                raise
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
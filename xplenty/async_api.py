@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import functools
+import json
+import logging
+import time
+from urllib.error import HTTPError
+
+from .async_transport import AsyncConnectionPool, raise_for_status
+from .coalesce import AsyncSingleFlight
+from .columnar import Columns
+from .exceptions import XplentyAPIException
+from .instrumentation import (
+    RequestEvent, call_hooks, current_event, finish_event, instrumented
+)
+from .retry import CONNECTION_ERRORS
+from .streaming import CHUNK_SIZE, JSONArrayParser
+from .xplenty_api import (
+    HEADERS, LIST_MODELS, PAGED_LISTINGS, AccountLimits, BulkResult, Cluster,
+    Job, Package, Schedule, XplentyClient, to_base64
+)
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+# connect timeouts from asyncio.wait_for are not OSErrors before Python 3.11
+ASYNC_CONNECTION_ERRORS = CONNECTION_ERRORS + (asyncio.TimeoutError,)
+
+
+class AsyncXplentyClient(object):
+    """asyncio counterpart of :class:`XplentyClient`.
+
+    Every API method is a coroutine returning the same models as the
+    blocking client. All requests share one :class:`AsyncConnectionPool`,
+    so many calls can be awaited concurrently::
+
+        async with AsyncXplentyClient(account_id, api_key) as client:
+            jobs = await asyncio.gather(*[client.get_job(i) for i in ids])
+    """
+    version = XplentyClient.version
+
+    def __init__(self, account_id="", api_key="", pool=None,
+                 pool_maxsize=100, pool_idle_timeout=60.0, timeout=None,
+                 rate_limiter=None, cache=None, lazy_dates=False,
+                 lazy=False, compress_requests=False,
+                 compress_min_size=1024, api_url=None, hooks=None,
+                 retry=None, coalesce=False):
+        self.account_id = account_id
+        self.api_key = api_key
+        if pool is None:
+            pool = AsyncConnectionPool(maxsize=pool_maxsize,
+                                       idle_timeout=pool_idle_timeout,
+                                       timeout=timeout)
+        self.pool = pool
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.lazy_dates = lazy_dates
+        self.lazy = lazy
+        self.compress_requests = compress_requests
+        self.compress_min_size = compress_min_size
+        self.api_url = api_url
+        self.hooks = list(hooks or ())
+        self.retry = retry
+        self._flights = AsyncSingleFlight() if coalesce else None
+
+    def __repr__(self):
+        return '<Xplenty async client at 0x%x>' % (id(self))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Closes the idle connections of the client's pool."""
+        self.pool.clear()
+
+    _join_url = XplentyClient._join_url
+    _model = XplentyClient._model
+    _encode_body = XplentyClient._encode_body
+    _idempotency_headers = XplentyClient._idempotency_headers
+    _coalesced = XplentyClient._coalesced
+    _list_path = XplentyClient._list_path
+
+    async def _send(self, method, url, data=None, headers=None, event=None):
+        if event is not None:
+            event.request(method, url, data)
+            call_hooks(self.hooks, 'before_request', event)
+        req_headers = dict(HEADERS)
+        base64string = to_base64(self.api_key).replace('\n', '')
+        req_headers["Authorization"] = f"Basic {base64string}"
+        if headers:
+            req_headers.update(headers)
+
+        retry = self.retry
+        if retry is not None:
+            retry.record_request()
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt(method, url, data, req_headers,
+                                           event)
+            except HTTPError as error:
+                delay = retry and retry.delay(method, attempt, headers,
+                                              error.code, error.headers)
+                if delay is None:
+                    raise XplentyAPIException(error)
+                reason = error.code
+            except ASYNC_CONNECTION_ERRORS as error:
+                delay = retry and retry.delay(method, attempt, headers)
+                if delay is None:
+                    raise
+                reason = error
+            attempt += 1
+            if event is not None:
+                event.retries = attempt
+            logger.info("Retrying %s %s in %.2fs (attempt %d): %s",
+                        method, url, delay, attempt, reason)
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, method, url, data, headers, event):
+        limiter = self.rate_limiter
+        if limiter is not None:
+            if limiter.start_calibration():
+                await self.calibrate_rate_limiter()
+            start = time.perf_counter()
+            await limiter.acquire_async()
+            if event is not None:
+                event.throttle += time.perf_counter() - start
+
+        resp = await self.pool.urlopen(method, url, body=data,
+                                       headers=headers)
+        if event is not None:
+            event.response(resp)
+        if limiter is not None:
+            limiter.update_from_headers(resp.headers)
+        try:
+            await raise_for_status(url, resp)
+        except HTTPError as error:
+            if limiter is not None and error.code == 429:
+                limiter.drain()
+            raise
+        return resp
+
+    async def _decode(self, resp, event=None):
+        body = await resp.read()
+        if event is None:
+            return json.loads(body)
+        start = time.perf_counter()
+        value = json.loads(body)
+        event.decoded(start)
+        return value
+
+    async def _request(self, method, url, data=None, headers=None):
+        event = current_event()
+        resp = await self._send(method, url, data, headers, event)
+        return await self._decode(resp, event)
+
+    async def calibrate_rate_limiter(self):
+        """Seeds the rate limiter from the account's ``rate_limit_status``."""
+        try:
+            limits = await self.get_account_limits()
+        except (XplentyAPIException, OSError) as error:
+            logger.warning("Could not calibrate rate limiter: %s", error)
+            return
+        self.rate_limiter.calibrate(limits.limit, limits.remaining)
+
+    @instrumented
+    async def get(self, url):
+        logger.debug("GET %s", url)
+        flights = self._flights
+        if flights is None:
+            return await self._get(url)
+        value, shared = await flights.do(url, self._get, url)
+        if shared:
+            self._coalesced('GET', url)
+        return value
+
+    async def _get(self, url):
+        cache = self.cache
+        if cache is None:
+            return await self._request('GET', url)
+
+        event = current_event()
+        entry = cache.lookup(url)
+        if entry is not None and entry.fresh:
+            if event is not None:
+                event.request('GET', url)
+                event.cached = True
+                event.decoded()
+            return entry.value
+        resp = await self._send('GET', url,
+                                headers=entry.validators() if entry else None,
+                                event=event)
+        if resp.status == 304 and entry is not None:
+            await resp.read()
+            cache.revalidated(url, entry, resp.headers)
+            if event is not None:
+                event.cached = True
+                event.decoded()
+            return entry.value
+        value = await self._decode(resp, event)
+        cache.store(url, value, resp.headers)
+        return value
+
+    @instrumented
+    async def post(self, url, data_dict={}, headers=None):
+        logger.debug("POST %s, data %s", url, data_dict)
+        json_data, body_headers = self._encode_body(data_dict)
+        if headers:
+            body_headers.update(headers)
+        headers = body_headers
+        try:
+            return await self._request('POST', url, json_data, headers)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(url)
+
+    @instrumented
+    async def delete(self, url):
+        logger.debug("DELETE %s", url)
+        try:
+            return await self._request('DELETE', url)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(url)
+
+    async def stream(self, url, chunk_size=CHUNK_SIZE):
+        """Async counterpart of :meth:`XplentyClient.stream`."""
+        logger.debug("GET %s (streaming)", url)
+        event = RequestEvent('stream') if self.hooks else None
+        try:
+            resp = await self._send('GET', url, event=event)
+            parser = JSONArrayParser()
+            try:
+                while not parser.done:
+                    data = await resp.read(chunk_size)
+                    for item in parser.feed(data, final=not data):
+                        yield item
+                    if not data:
+                        break
+                await resp.read()  # trailing whitespace; frees the connection
+            finally:
+                resp.close()
+        except Exception as error:
+            finish_event(self.hooks, event, error)
+            raise
+        except GeneratorExit:
+            finish_event(self.hooks, event)
+            raise
+        finish_event(self.hooks, event)
+
+    @instrumented
+    async def get_clusters(self, offset=0, limit=20, status=None, since=None,
+                           until=None, sort=None, direction=None):
+        method_path = self._list_path(
+            'clusters', offset=offset, limit=limit, status=status,
+            since=since, until=until, sort=sort, direction=direction)
+        url = self._join_url(method_path)
+        resp = await self.get(url)
+        return [self._model(Cluster, item) for item in resp]
+
+    @instrumented
+    async def get_cluster(self, id):
+        method_path = 'clusters/%s' % (str(id))
+        url = self._join_url(method_path)
+        resp = await self.get(url)
+        return self._model(Cluster, resp)
+
+    @instrumented
+    async def terminate_cluster(self, id):
+        method_path = 'clusters/%s' % (str(id))
+        url = self._join_url(method_path)
+        resp = await self.delete(url)
+        return self._model(Cluster, resp)
+
+    @instrumented
+    async def create_cluster(self, cluster_type, nodes, cluster_name, cluster_description, terminate_on_idle=False, time_to_idle=3600):
+        cluster_info = {}
+        cluster_info["type"] = cluster_type
+        cluster_info["nodes"] = nodes
+        cluster_info["name"] = cluster_name if cluster_name else ""
+        cluster_info["description"] = cluster_description if cluster_description else ""
+        cluster_info["terminate_on_idle"] = 1 if terminate_on_idle else 0
+        cluster_info["time_to_idle"] = time_to_idle
+        url = self._join_url('clusters')
+        resp = await self.post(url, cluster_info)
+        return self._model(Cluster, resp)
+
+    @instrumented
+    async def get_jobs(self, status=None, cluster_id=None, since=None,
+                       until=None, sort=None, direction=None, offset=None,
+                       limit=None):
+        method_path = self._list_path(
+            'jobs', status=status, cluster_id=cluster_id, since=since,
+            until=until, sort=sort, direction=direction, offset=offset,
+            limit=limit)
+        url = self._join_url(method_path)
+        resp = await self.get(url)
+        return [self._model(Job, item) for item in resp]
+
+    async def stream_jobs(self, **filters):
+        path = self._list_path('jobs', **filters)
+        async for item in self.stream(self._join_url(path)):
+            yield self._model(Job, item)
+
+    @instrumented
+    async def get_job(self, id):
+        method_path = 'jobs/%s' % (str(id))
+        url = self._join_url(method_path)
+        resp = await self.get(url)
+        return self._model(Job, resp)
+
+    @instrumented
+    async def stop_job(self, id):
+        method_path = 'jobs/%s' % (str(id))
+        url = self._join_url(method_path)
+        return await self.delete(url)
+
+    @instrumented
+    async def add_job(self, cluster_id, package_id, vars={}, dynamic_vars={},
+                      idempotency_key=None):
+        job_info = {}
+        job_info["cluster_id"] = cluster_id
+        job_info["package_id"] = package_id
+        job_info["variables"] = vars
+        job_info["dynamic_variables"] = dynamic_vars
+
+        url = self._join_url('jobs')
+        resp = await self.post(url, job_info,
+                               self._idempotency_headers(idempotency_key))
+        return self._model(Job, resp)
+
+    @instrumented
+    async def get_account_limits(self):
+        url = self._join_url('rate_limit_status')
+        resp = await self.get(url)
+        return self._model(AccountLimits, resp['limits'])
+
+    @instrumented
+    async def get_packages(self, offset=0, limit=20):
+        method_path = 'packages?offset=%d&limit=%d' % (offset, limit)
+        url = self._join_url(method_path)
+        resp = await self.get(url)
+        return [self._model(Package, item) for item in resp]
+
+    @instrumented
+    async def get_package(self, id):
+        method_path = 'packages/%s' % id
+        url = self._join_url(method_path)
+        resp = await self.get(url)
+        return self._model(Package, resp)
+
+    @instrumented
+    async def get_schedules(self, status=None, since=None, until=None,
+                            sort=None, direction=None, offset=None,
+                            limit=None):
+        method_path = self._list_path(
+            'schedules', status=status, since=since, until=until, sort=sort,
+            direction=direction, offset=offset, limit=limit)
+        url = self._join_url(method_path)
+        resp = await self.get(url)
+        return [self._model(Schedule, item) for item in resp]
+
+    async def stream_schedules(self, **filters):
+        path = self._list_path('schedules', **filters)
+        async for item in self.stream(self._join_url(path)):
+            yield self._model(Schedule, item)
+
+    async def get_columns(self, resource, fields=None, page_size=100,
+                          **filters):
+        """Async counterpart of :meth:`XplentyClient.get_columns`."""
+        columns = Columns(LIST_MODELS[resource], fields)
+        paged = (resource in PAGED_LISTINGS
+                 and 'offset' not in filters and 'limit' not in filters)
+        offset = 0
+        while True:
+            if paged:
+                path = self._list_path(resource, offset=offset,
+                                       limit=page_size, **filters)
+            else:
+                path = self._list_path(resource, **filters)
+            before = len(columns)
+            async for item in self.stream(self._join_url(path)):
+                columns.append(item)
+            if not paged or len(columns) == before:
+                return columns
+            offset += len(columns) - before
+
+    @instrumented
+    async def get_schedule(self, id):
+        method_path = 'schedules/%s' % id
+        url = self._join_url(method_path)
+        resp = await self.get(url)
+        return self._model(Schedule, resp)
+
+    async def _bulk(self, func, ids, max_concurrency):
+        """Async counterpart of :meth:`XplentyClient._bulk`."""
+        ids = list(collections.OrderedDict.fromkeys(ids))
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def call(id):
+            async with semaphore:
+                return await func(id)
+
+        outcomes = await asyncio.gather(*[call(id) for id in ids],
+                                        return_exceptions=True)
+        return BulkResult(zip(ids, outcomes))
+
+    async def get_clusters_by_id(self, ids, max_concurrency=8):
+        return await self._bulk(self.get_cluster, ids, max_concurrency)
+
+    async def terminate_clusters(self, ids, max_concurrency=8):
+        return await self._bulk(self.terminate_cluster, ids, max_concurrency)
+
+    async def get_jobs_by_id(self, ids, max_concurrency=8):
+        return await self._bulk(self.get_job, ids, max_concurrency)
+
+    async def stop_jobs(self, ids, max_concurrency=8):
+        return await self._bulk(self.stop_job, ids, max_concurrency)
+
+    async def _iter_pages(self, get_page, page_size, prefetch):
+        """Async counterpart of :meth:`XplentyClient._iter_pages`."""
+        next_page = None
+        try:
+            offset = 0
+            page = await get_page(offset, page_size)
+            while True:
+                # the server may cap the limit below page_size, so only
+                # an empty page marks the end of the listing
+                offset += len(page)
+                more = bool(page)
+                if more and prefetch:
+                    next_page = asyncio.ensure_future(
+                        get_page(offset, page_size))
+                for item in page:
+                    yield item
+                if not more:
+                    return
+                if prefetch:
+                    page, next_page = await next_page, None
+                else:
+                    page = await get_page(offset, page_size)
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    def iter_clusters(self, page_size=20, prefetch=False, **filters):
+        """Async iterator over all clusters, fetching pages lazily."""
+        return self._iter_pages(functools.partial(self.get_clusters, **filters),
+                                page_size, prefetch)
+
+    def iter_packages(self, page_size=20, prefetch=False):
+        """Async iterator over all packages, fetching pages lazily."""
+        return self._iter_pages(self.get_packages, page_size, prefetch)
+
+    @property
+    def clusters(self):
+        return self.get_clusters()
+
+    @property
+    def jobs(self):
+        return self.get_jobs()
+
+    @property
+    def account_limits(self):
+        return self.get_account_limits()
+
+    @property
+    def packages(self):
+        return self.get_packages()
+
+    @property
+    def schedules(self):
+        return self.get_schedules()
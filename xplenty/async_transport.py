@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import http.client
+import io
+import logging
+import ssl
+import time
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+from .transport import (
+    STALE_CONNECTION_ERRORS, can_resend, get_content_decoder)
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+
+class _Connection(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncPooledResponse(object):
+    """An HTTP/1.1 response read from a pooled asyncio connection.
+
+    Mirrors :class:`xplenty.transport.PooledResponse`: the connection goes
+    back to the pool once the body has been read in full, and compressed
+    bodies are inflated transparently.
+    """
+
+    def __init__(self, pool, key, conn, status, reason, headers, will_close,
+                 length, chunked):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._will_close = will_close
+        self._length = length
+        self._chunked = chunked
+        self._chunk_left = 0
+        self._decoder = get_content_decoder(headers)
+        self.queue_time = 0.0
+        self.connect_time = 0.0
+        self.wait_time = 0.0
+        self.read_time = 0.0
+        self.bytes_read = 0
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    async def _read_chunked(self, amt):
+        reader = self._conn.reader
+        if self._chunk_left == 0:
+            line = await reader.readline()
+            size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # skip trailers up to the terminating blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b""
+            self._chunk_left = size
+        data = await reader.read(min(amt, self._chunk_left))
+        if not data:
+            raise http.client.IncompleteRead(data)
+        self._chunk_left -= len(data)
+        if self._chunk_left == 0:
+            await reader.readexactly(2)  # CRLF after each chunk
+        return data
+
+    async def _read_some(self, amt):
+        reader = self._conn.reader
+        if self._chunked:
+            return await self._read_chunked(amt)
+        if self._length is None:
+            return await reader.read(amt)
+        if self._length == 0:
+            return b""
+        data = await reader.read(min(amt, self._length))
+        if not data:
+            raise http.client.IncompleteRead(data, self._length)
+        self._length -= len(data)
+        return data
+
+    async def read(self, amt=None):
+        decoder = self._decoder
+        if decoder is None:
+            return await self._read_raw(amt)
+        if amt is None:
+            return decoder.decompress(await self._read_raw()) + decoder.flush()
+        while True:
+            data = await self._read_raw(amt)
+            if not data:
+                return decoder.flush()
+            data = decoder.decompress(data)
+            if data:
+                return data
+
+    async def _read_raw(self, amt=None):
+        if self._conn is None:
+            return b""
+        start = time.perf_counter()
+        timeout = self._pool.timeout
+        try:
+            if amt is not None:
+                data = await asyncio.wait_for(self._read_some(amt), timeout)
+                self.read_time += time.perf_counter() - start
+                self.bytes_read += len(data)
+                if not data:
+                    self.release_conn()
+                return data
+            parts = []
+            while True:
+                data = await asyncio.wait_for(self._read_some(65536),
+                                              timeout)
+                if not data:
+                    break
+                parts.append(data)
+        except Exception:
+            self.close()
+            raise
+        self.release_conn()
+        data = b"".join(parts)
+        self.read_time += time.perf_counter() - start
+        self.bytes_read += len(data)
+        return data
+
+    def release_conn(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._will_close:
+            self._pool._discard_conn(self._key, conn)
+        else:
+            self._pool._put_conn(self._key, conn)
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool._discard_conn(self._key, conn)
+
+
+class AsyncConnectionPool(object):
+    """Pool of persistent HTTP(S) connections for asyncio.
+
+    Speaks plain HTTP/1.1 over :func:`asyncio.open_connection`, so requests
+    never block the event loop. Connections are kept per (scheme, host,
+    port) and reused across requests.
+
+    :param maxsize: Maximum number of connections per host. Coroutines wait
+        when all of them are in use.
+    :param idle_timeout: Seconds an idle connection is kept before it is
+        closed instead of reused.
+    :param timeout: Timeout in seconds for opening a connection, for
+        sending a request and reading its response headers, and for each
+        read of the response body.
+    :param ssl_context: :class:`ssl.SSLContext` for HTTPS connections.
+    """
+
+    def __init__(self, maxsize=100, idle_timeout=60.0, timeout=None,
+                 ssl_context=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self._idle = collections.defaultdict(collections.deque)
+        self._slots = {}
+
+    def __repr__(self):
+        return '<Xplenty async connection pool at 0x%x>' % (id(self))
+
+    async def _new_conn(self, key):
+        scheme, host, port = key
+        logger.debug("Opening connection to %s://%s:%s", scheme, host, port)
+        ssl_context = None
+        if scheme == "https":
+            ssl_context = self.ssl_context or ssl.create_default_context()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context),
+            self.timeout)
+        return _Connection(reader, writer)
+
+    async def _get_conn(self, key):
+        now = time.monotonic()
+        idle = self._idle[key]
+        while idle:
+            conn = idle.pop()
+            if (now - conn.last_used <= self.idle_timeout
+                    and not conn.reader.at_eof()):
+                return conn, True
+            conn.close()
+        return await self._new_conn(key), False
+
+    def _put_conn(self, key, conn):
+        conn.last_used = time.monotonic()
+        self._idle[key].append(conn)
+        self._slots[key].release()
+
+    def _discard_conn(self, key, conn):
+        conn.close()
+        self._slots[key].release()
+
+    async def _send(self, conn, method, host, path, body, headers):
+        lines = ["%s %s HTTP/1.1" % (method, path), "Host: %s" % host]
+        for name, value in headers.items():
+            lines.append("%s: %s" % (name, value))
+        if body is not None or method in ("POST", "PUT", "PATCH"):
+            lines.append("Content-Length: %d" % len(body or b""))
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        conn.writer.write(head + (body or b""))
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise http.client.RemoteDisconnected(
+                "Remote end closed connection without response")
+        version, status, reason = (
+            status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+        raw = []
+        while True:
+            line = await conn.reader.readline()
+            raw.append(line)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        headers = http.client.parse_headers(io.BytesIO(b"".join(raw)))
+        return version, int(status), reason, headers
+
+    async def urlopen(self, method, url, body=None, headers=None):
+        """Sends a request and returns an :class:`AsyncPooledResponse`."""
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        slots = self._slots.get(key)
+        if slots is None:
+            slots = self._slots[key] = asyncio.BoundedSemaphore(self.maxsize)
+        start = time.perf_counter()
+        await slots.acquire()
+        queued = time.perf_counter()
+        conn = None
+        try:
+            conn, reused = await self._get_conn(key)
+            connected = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(
+                    self._send(conn, method, parts.netloc, path, body,
+                               headers or {}),
+                    self.timeout)
+            except STALE_CONNECTION_ERRORS:
+                # the server may have read the request before it dropped
+                # the connection; see xplenty.transport.can_resend
+                if not reused or not can_resend(method, headers):
+                    raise
+                conn.close()
+                conn = await self._new_conn(key)
+                connected = time.perf_counter()
+                result = await asyncio.wait_for(
+                    self._send(conn, method, parts.netloc, path, body,
+                               headers or {}),
+                    self.timeout)
+        except BaseException:
+            if conn is not None:
+                conn.close()
+            slots.release()
+            raise
+
+        version, status, reason, resp_headers = result
+        connection = resp_headers.get("Connection", "").lower()
+        will_close = version == "HTTP/1.0" or connection == "close"
+        chunked = "chunked" in resp_headers.get("Transfer-Encoding", "").lower()
+        length = None
+        if (method == "HEAD" or status in (204, 304) or 100 <= status < 200):
+            length = 0
+        elif not chunked and resp_headers.get("Content-Length") is not None:
+            length = int(resp_headers["Content-Length"])
+        elif not chunked:
+            will_close = True
+
+        response = AsyncPooledResponse(self, key, conn, status, reason,
+                                       resp_headers, will_close, length,
+                                       chunked)
+        response.queue_time = queued - start
+        response.connect_time = connected - queued
+        response.wait_time = time.perf_counter() - connected
+        return response
+
+    def clear(self):
+        """Closes all idle connections."""
+        idle, self._idle = self._idle, collections.defaultdict(
+            collections.deque)
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+
+async def raise_for_status(url, response):
+    """Async counterpart of :func:`xplenty.transport.raise_for_status`."""
+    if response.status < 400:
+        return
+    body = await response.read()
+    raise HTTPError(url, response.status, response.reason,
+                    response.headers, io.BytesIO(body))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .xplenty_api import BulkResult
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+
+JobSpec = collections.namedtuple('JobSpec', [
+    'cluster_id', 'package_id', 'variables', 'dynamic_variables',
+    'idempotency_key'])
+JobSpec.__new__.__defaults__ = (None, None, None)
+
+BatchProgress = collections.namedtuple('BatchProgress', [
+    'total', 'succeeded', 'failed', 'cancelled', 'elapsed', 'rate'])
+
+
+def _as_spec(spec, client):
+    if isinstance(spec, JobSpec):
+        pass
+    elif isinstance(spec, dict):
+        spec = JobSpec(**spec)
+    else:
+        spec = JobSpec(*spec)
+    retry = client.retry
+    if (spec.idempotency_key is None and retry is not None
+            and retry.retry_add_job):
+        spec = spec._replace(idempotency_key=str(uuid.uuid4()))
+    return spec
+
+
+class JobBatch(object):
+    """Submits many jobs concurrently and returns a future per job.
+
+    At most ``window`` ``add_job`` requests are in flight at a time, and
+    each one still takes a token from the client's rate limiter, so a
+    large batch runs as fast as the account's limit allows without
+    bursting into HTTP 429s::
+
+        specs = [(cluster_id, package_id, {'date': day}) for day in days]
+        with JobBatch(client, specs, window=16) as batch:
+            for spec, future in zip(batch.specs, batch.futures):
+                print(spec.variables, future.result().id)
+
+    When the client's retry policy has ``retry_add_job`` set, every spec
+    without an ``idempotency_key`` gets one, which is sent with the job.
+    Failed submissions are then retried without starting a job twice, and
+    a batch interrupted halfway can be resubmitted with
+    ``JobBatch(client, batch.specs)``.
+
+    :param client: The :class:`XplentyClient` to submit with.
+    :param specs: :class:`JobSpec` instances, or tuples or dicts of its
+        fields: ``cluster_id``, ``package_id``, ``variables``,
+        ``dynamic_variables`` and ``idempotency_key``.
+    :param window: Number of submissions in flight at the same time.
+    :param progress: Optional ``progress(BatchProgress)`` callback, fired at
+        most every ``report_interval`` seconds and when the batch is done.
+    :param report_interval: Seconds between progress reports.
+    """
+
+    def __init__(self, client, specs, window=8, progress=None,
+                 report_interval=5.0):
+        self.client = client
+        self.specs = [_as_spec(spec, client) for spec in specs]
+        self.window = window
+        self.progress_callback = progress
+        self.report_interval = report_interval
+        self._lock = threading.Lock()
+        self._succeeded = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._reported_at = None
+        self._started = time.monotonic()
+        self._finished = None
+        self.futures = []
+        if not self.specs:
+            self._finished = self._started
+            return
+        executor = ThreadPoolExecutor(max_workers=window,
+                                      thread_name_prefix='xplenty-batch')
+        for spec in self.specs:
+            future = executor.submit(self._submit, spec)
+            future.add_done_callback(self._done)
+            self.futures.append(future)
+        executor.shutdown(wait=False)
+
+    def __repr__(self):
+        progress = self.progress()
+        return '<JobBatch {0}/{1} done, {2} failed>'.format(
+            progress.succeeded + progress.failed + progress.cancelled,
+            progress.total, progress.failed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is not None:
+            self.cancel()
+        self.wait()
+
+    def __iter__(self):
+        return iter(self.futures)
+
+    def __len__(self):
+        return len(self.futures)
+
+    def _submit(self, spec):
+        return self.client.add_job(spec.cluster_id, spec.package_id,
+                                   spec.variables or {},
+                                   spec.dynamic_variables or {},
+                                   idempotency_key=spec.idempotency_key)
+
+    def _done(self, future):
+        error = None if future.cancelled() else future.exception()
+        with self._lock:
+            if future.cancelled():
+                self._cancelled += 1
+            elif error is not None:
+                self._failed += 1
+            else:
+                self._succeeded += 1
+            done = self._succeeded + self._failed + self._cancelled
+            now = time.monotonic()
+            finished = done == len(self.specs)
+            if finished:
+                self._finished = now
+            report = finished or self._reported_at is None or (
+                now - self._reported_at >= self.report_interval)
+            if report:
+                self._reported_at = now
+        if error is not None:
+            logger.warning("Job submission failed: %s", error)
+        if report:
+            progress = self.progress()
+            logger.info("Submitted %d/%d jobs, %d failed, %.1f jobs/s",
+                        progress.succeeded, progress.total, progress.failed,
+                        progress.rate)
+            if self.progress_callback is not None:
+                try:
+                    self.progress_callback(progress)
+                except Exception:
+                    logger.exception("Batch progress callback %r failed",
+                                     self.progress_callback)
+
+    def progress(self):
+        """Returns a :class:`BatchProgress` snapshot.
+
+        ``rate`` is the number of jobs finished per second so far.
+        """
+        with self._lock:
+            end = self._finished or time.monotonic()
+            elapsed = end - self._started
+            done = self._succeeded + self._failed
+            return BatchProgress(len(self.specs), self._succeeded,
+                                 self._failed, self._cancelled, elapsed,
+                                 done / elapsed if elapsed > 0 else 0.0)
+
+    @property
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    def cancel(self):
+        """Cancels the submissions that have not started yet.
+
+        Returns the number of cancelled submissions.
+        """
+        return sum(1 for future in self.futures if future.cancel())
+
+    def wait(self, timeout=None):
+        """Blocks until every submission is done or ``timeout`` expires."""
+        return wait(self.futures, timeout=timeout)
+
+    def results(self, timeout=None):
+        """Waits for the batch and returns a :class:`BulkResult`.
+
+        Keys are the specs' positions in :attr:`specs`; values are the
+        created :class:`Job`, or the exception raised submitting it.
+        Cancelled submissions are left out.
+        """
+        self.wait(timeout)
+        result = BulkResult()
+        for index, future in enumerate(self.futures):
+            if future.cancelled() or not future.done():
+                continue
+            try:
+                result[index] = future.result()
+            except Exception as error:
+                # recorded, so one failure does not lose the others
+                result[index] = error
+        return result
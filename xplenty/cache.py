@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import collections
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def resource_of(url):
+    """Returns the API resource a URL belongs to, e.g. ``'packages'``."""
+    path = urlsplit(url).path
+    _, _, rest = path.partition('/api/')
+    return rest.split('/', 1)[0]
+
+
+def collection_of(url):
+    """Returns the URL of the collection a resource URL belongs to."""
+    parts = urlsplit(url)
+    head, sep, rest = parts.path.partition('/api/')
+    return "{0}://{1}{2}{3}{4}".format(parts.scheme, parts.netloc, head, sep,
+                                       rest.split('/', 1)[0])
+
+
+class CacheEntry(object):
+    __slots__ = ('value', 'etag', 'last_modified', 'expires')
+
+    def __init__(self, value, etag, last_modified, expires):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    @property
+    def fresh(self):
+        return time.monotonic() < self.expires
+
+    def validators(self):
+        """Headers that turn a refetch into a conditional GET."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+    """Thread-safe LRU cache of decoded GET responses.
+
+    Fresh entries are served without a request. Once an entry's TTL has
+    passed it is revalidated with ``If-None-Match``/``If-Modified-Since``,
+    so an unchanged resource costs a ``304 Not Modified`` instead of a full
+    download and decode. Mutating requests invalidate every cached entry of
+    the affected resource.
+
+    Cached values are shared between callers and must not be modified.
+
+    :param maxsize: Maximum number of cached URLs.
+    :param ttl: Default time to live in seconds.
+    :param ttls: Per-resource TTLs, e.g. ``{'packages': 3600, 'jobs': 5}``.
+    """
+
+    def __init__(self, maxsize=256, ttl=60.0, ttls=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def __repr__(self):
+        return "<ResponseCache '{0}/{1}'>".format(len(self._entries),
+                                                   self.maxsize)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _ttl_for(self, url):
+        return self.ttls.get(resource_of(url), self.ttl)
+
+    def lookup(self, url):
+        """Returns the entry cached for ``url`` (fresh or stale), or ``None``."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            if entry.fresh:
+                self.hits += 1
+            return entry
+
+    def store(self, url, value, headers):
+        ttl = self._ttl_for(url)
+        if ttl <= 0:
+            return
+        entry = CacheEntry(value, headers.get('ETag'),
+                           headers.get('Last-Modified'),
+                           time.monotonic() + ttl)
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def revalidated(self, url, entry, headers):
+        """Extends an entry's lifetime after a ``304 Not Modified``."""
+        with self._lock:
+            self.revalidations += 1
+            entry.expires = time.monotonic() + self._ttl_for(url)
+            entry.etag = headers.get('ETag') or entry.etag
+            entry.last_modified = (headers.get('Last-Modified')
+                                   or entry.last_modified)
+
+    def invalidate(self, url):
+        """Drops every entry of the resource ``url`` belongs to.
+
+        Both the item and the listings it appears in are dropped, e.g.
+        ``DELETE .../jobs/5`` invalidates ``.../jobs/5`` and ``.../jobs``.
+        """
+        prefix = collection_of(url)
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key == prefix or key.startswith(prefix + '/')
+                        or key.startswith(prefix + '?')]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
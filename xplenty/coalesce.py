@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import threading
+
+
+class _Call(object):
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Runs at most one call per key at a time across threads.
+
+    A caller asking for a key that is already in flight waits for that
+    call and gets its result, or its exception, instead of starting a
+    duplicate. Results are not kept once the call has finished; that is
+    what :class:`ResponseCache` is for.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def __repr__(self):
+        return '<SingleFlight %d in flight>' % len(self._calls)
+
+    def do(self, key, func, *args):
+        """Returns ``(func(*args), shared)`` for the call in flight for ``key``.
+
+        ``shared`` is ``True`` when the result came from another caller's
+        call. The result is the same object for every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = func(*args)
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+
+class AsyncSingleFlight(object):
+    """asyncio counterpart of :class:`SingleFlight`.
+
+    The call runs in its own task, so it completes for the remaining
+    waiters even if the task that started it is cancelled.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    def __repr__(self):
+        return '<AsyncSingleFlight %d in flight>' % len(self._calls)
+
+    def _done(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if every waiter went away
+
+    async def do(self, key, func, *args):
+        import asyncio  # only loaded once the async client uses it
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = self._calls[key] = asyncio.ensure_future(func(*args))
+            task.add_done_callback(lambda task: self._done(key, task))
+        return await asyncio.shield(task), shared
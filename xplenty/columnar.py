@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+import array
+import collections
+import datetime
+
+from .decoders import ISO8601, parse_datetime
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# typecode of the array each kind of field is stored in; None for lists
+TYPECODES = {
+    'int': 'q',
+    'float': 'd',
+    'date': 'q',     # microseconds since the epoch, UTC
+    'bool': 'b',
+    'str': None,
+    'dict': None,
+}
+
+# stored in place of missing values, which the validity mask marks
+_FILLERS = {
+    'int': '0',
+    'float': 'nan',
+    'date': '0',
+    'bool': '0',
+    'str': 'None',
+    'dict': 'None',
+}
+
+# converts a present value; 'str' values are kept as they are
+_CONVERSIONS = {
+    'int': 'int(v)',
+    'float': 'float(v)',
+    'date': 'timestamp_us(v)',
+    'bool': 'bool(v)',
+    'dict': 'dict(v)',
+}
+
+
+# seconds from the epoch to the start of each day seen, by 'YYYY-MM-DD';
+# a listing spans few distinct days, so most lookups hit
+_day_seconds = {}
+
+
+def timestamp_us(value):
+    """Returns an API timestamp as microseconds since the epoch, UTC.
+
+    Timestamps without a zone are taken as UTC.
+    """
+    if not isinstance(value, str):
+        match = None
+    elif (len(value) == 20 and value[19] == "Z" and value[10] == "T"
+            and value[4] == value[7] == "-"
+            and value[13] == value[16] == ":"):
+        # the layout the API sends, e.g. 2020-09-10T14:03:59Z
+        day = value[:10]
+        seconds = _day_seconds.get(day)
+        if seconds is None:
+            if len(_day_seconds) > 10000:
+                _day_seconds.clear()
+            seconds = (datetime.date(int(value[:4]), int(value[5:7]),
+                                     int(value[8:10])).toordinal()
+                       - _EPOCH_ORDINAL) * 86400
+            _day_seconds[day] = seconds
+        return (seconds + int(value[11:13]) * 3600 + int(value[14:16]) * 60
+                + int(value[17:19])) * 1000000
+    else:
+        match = ISO8601.match(value)
+    if match is None:
+        parsed = parse_datetime(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(datetime.timezone.utc).replace(
+                tzinfo=None)
+        return (parsed - _EPOCH) // _MICROSECOND
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    days = datetime.date(int(year), int(month), int(day)).toordinal()
+    seconds = ((days - _EPOCH_ORDINAL) * 86400 + int(hour) * 3600
+               + int(minute) * 60 + int(second))
+    if zone and zone != "Z":
+        offset = int(zone[1:3]) * 3600 + int(zone[-2:] if len(zone) > 3 else 0) * 60
+        seconds += offset if zone[0] == "-" else -offset
+    microsecond = int(fraction[:6].ljust(6, "0")) if fraction else 0
+    return seconds * 1000000 + microsecond
+
+
+def _kinds(cls):
+    kinds = collections.OrderedDict()
+    for kind, names in (('int', cls._ints), ('float', cls._floats),
+                        ('date', cls._dates), ('bool', cls._bools),
+                        ('str', cls._strs), ('dict', cls._dicts)):
+        for name in names:
+            kinds[name] = kind
+    return kinds
+
+
+def writer_source(columns):
+    """Returns the source of ``extend(items)`` appending records to columns.
+
+    Like the model decoders, the function is generated per field list, so
+    each record costs one pass of straight-line code.
+    """
+    body = ["n = 0", "for item in items:", "    get = item.get"]
+    for i, column in enumerate(columns):
+        body.append("    v = get(%r)" % column.name)
+        filler = _FILLERS[column.kind]
+        if column.kind == 'str':
+            body.append("    values_%d(v)" % i)
+            body.append("    valid_%d(0 if v is None else 1)" % i)
+            continue
+        body.extend([
+            "    if v is None:",
+            "        values_%d(%s)" % (i, filler),
+            "        valid_%d(0)" % i,
+            "    else:",
+            "        try:",
+            "            values_%d(%s)" % (i, _CONVERSIONS[column.kind]),
+            "        except (ValueError, TypeError, OverflowError):",
+            "            values_%d(%s)" % (i, filler),
+            "            valid_%d(0)" % i,
+            "        else:",
+            "            valid_%d(1)" % i,
+        ])
+    body.append("    n += 1")
+    body.append("return n")
+    return ("def extend(items):\n"
+            + "".join("    %s\n" % line for line in body))
+
+
+def compile_writer(columns):
+    """Builds the ``extend(items)`` function of :func:`writer_source`."""
+    columns = list(columns)
+    source = writer_source(columns)
+    namespace = {'nan': float('nan'), 'timestamp_us': timestamp_us}
+    for i, column in enumerate(columns):
+        namespace['values_%d' % i] = column.values.append
+        namespace['valid_%d' % i] = column.valid.append
+    code = compile(source, "<column writer>", "exec")
+    exec(code, namespace)
+    extend = namespace['extend']
+    extend.source = source
+    return extend
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Converting columns to arrays requires numpy")
+    return numpy
+
+
+class Column(object):
+    """One field of many records, as a typed array and a validity mask.
+
+    ``values`` is an :class:`array.array` for ``int`` (``'q'``), ``float``
+    (``'d'``), ``bool`` (``'b'``) and ``date`` fields, the latter as
+    microseconds since the epoch in UTC, and a list for ``str`` and
+    ``dict`` fields. ``valid`` holds a byte per record, 0 where the value
+    was missing or could not be converted.
+    """
+
+    __slots__ = ('name', 'kind', 'values', 'valid')
+
+    def __init__(self, name, kind):
+        typecode = TYPECODES[kind]
+        self.name = name
+        self.kind = kind
+        self.values = [] if typecode is None else array.array(typecode)
+        self.valid = bytearray()
+
+    def __repr__(self):
+        return "<Column '{0}' of {1} {2} values>".format(
+            self.name, len(self), self.kind)
+
+    def __len__(self):
+        return len(self.valid)
+
+    def __getitem__(self, index):
+        if not self.valid[index]:
+            return None
+        value = self.values[index]
+        if self.kind == 'date':
+            return (_EPOCH + value * _MICROSECOND).replace(
+                tzinfo=datetime.timezone.utc)
+        if self.kind == 'bool':
+            return bool(value)
+        return value
+
+    @property
+    def null_count(self):
+        return len(self.valid) - sum(self.valid)
+
+    def tolist(self):
+        """Returns the values as Python objects, ``None`` where missing."""
+        return [self[i] for i in range(len(self))]
+
+    def _mask(self, np):
+        return np.array(self.valid, dtype=np.uint8) == 0
+
+    def to_numpy(self):
+        """Returns the column as a NumPy array.
+
+        ``float`` columns hold NaN and ``date`` columns (``datetime64[us]``,
+        UTC) hold NaT where values are missing. ``int`` and ``bool``
+        columns with missing values become masked arrays; ``str`` and
+        ``dict`` columns are object arrays holding ``None``.
+        """
+        np = _numpy()
+        if TYPECODES[self.kind] is None:
+            values = np.empty(len(self.values), dtype=object)
+            values[:] = self.values
+            return values
+        if self.kind == 'float':
+            return np.array(self.values, dtype=np.float64)
+        if self.kind == 'date':
+            values = np.array(self.values, dtype=np.int64).view(
+                'datetime64[us]')
+            values[self._mask(np)] = np.datetime64('NaT')
+            return values
+        values = np.array(self.values, dtype=(
+            np.int64 if self.kind == 'int' else np.bool_))
+        if self.null_count:
+            return np.ma.masked_array(values, mask=self._mask(np))
+        return values
+
+
+class Columns(object):
+    """Records of one model class decoded into a :class:`Column` per field.
+
+    Fields and their types come from the model's ``_ints``, ``_floats``,
+    ``_dates``, ``_bools``, ``_strs`` and ``_dicts`` declarations. Raw
+    records are appended straight into the columns, so no model object
+    is built per record::
+
+        columns = client.get_columns('jobs', ['status', 'runtime_in_seconds'])
+        runtimes = columns['runtime_in_seconds'].to_numpy()
+        frame = columns.to_pandas()
+
+    :param cls: The model class, e.g. :class:`Job`.
+    :param fields: Fields to keep; all declared fields by default.
+    :param items: Raw records (dicts) to start with.
+    """
+
+    def __init__(self, cls, fields=None, items=()):
+        kinds = _kinds(cls)
+        if fields is None:
+            fields = list(kinds)
+        for name in fields:
+            if name not in kinds:
+                raise ValueError("%s has no field %r" % (cls.__name__, name))
+        self.cls = cls
+        self._columns = collections.OrderedDict(
+            (name, Column(name, kinds[name])) for name in fields)
+        self._extend = compile_writer(self._columns.values())
+        self._length = 0
+        self.extend(items)
+
+    def __repr__(self):
+        return '<Columns of {0} {1} records, {2} fields>'.format(
+            self._length, self.cls.__name__, len(self._columns))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    @property
+    def fields(self):
+        return list(self._columns)
+
+    def append(self, item):
+        """Appends one raw record, as returned by the API."""
+        self._length += self._extend((item,))
+
+    def extend(self, items):
+        """Appends raw records from any iterable, e.g. a streamed response."""
+        self._length += self._extend(items)
+
+    def to_numpy(self):
+        """Returns ``{field: array}``; see :meth:`Column.to_numpy`."""
+        return collections.OrderedDict(
+            (name, column.to_numpy())
+            for name, column in self._columns.items())
+
+    def to_pandas(self):
+        """Returns the columns as a :class:`pandas.DataFrame`.
+
+        Dates become timezone-aware UTC datetimes, and ``int`` and
+        ``bool`` columns with missing values use pandas' nullable
+        ``Int64`` and ``boolean`` types.
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("Converting columns to a DataFrame requires "
+                              "pandas")
+        np = _numpy()
+        data = collections.OrderedDict()
+        for name, column in self._columns.items():
+            values = column.to_numpy()
+            if column.kind == 'date':
+                values = pandas.Series(values).dt.tz_localize('UTC')
+            elif isinstance(values, np.ma.MaskedArray):
+                array_type = (pandas.arrays.IntegerArray
+                              if column.kind == 'int'
+                              else pandas.arrays.BooleanArray)
+                values = array_type(values.data, column._mask(np))
+            data[name] = values
+        return pandas.DataFrame(data, columns=list(self._columns))
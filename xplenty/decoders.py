@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+import datetime
+import keyword
+import re
+
+# The timestamp layout the API returns, e.g. 2020-09-10T14:03:59Z.
+ISO8601 = re.compile(
+    r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d+))?"
+    r"(Z|[+-]\d\d(?::?\d\d)?)?$")
+
+# dateutil is slow to import, so it is only loaded once a timestamp
+# needs it; _utc becomes its tzutc() on the first parse.
+_utc = None
+
+# Returned by field converters for fields that stay unset when missing.
+MISSING = object()
+
+
+def _tzutc():
+    global _utc
+    if _utc is None:
+        from dateutil.tz import tzutc
+        _utc = tzutc()
+    return _utc
+
+
+def parse_iso8601(value):
+    """Parses an ISO-8601 timestamp, returning ``None`` if it does not match.
+
+    Produces the same values as ``dateutil.parser.parse`` for the formats
+    it accepts, at a fraction of the cost.
+    """
+    match = ISO8601.match(value)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    microsecond = int(fraction[:6].ljust(6, "0")) if fraction else 0
+    tzinfo = None
+    if zone == "Z":
+        tzinfo = _utc or _tzutc()
+    elif zone:
+        offset = int(zone[1:3]) * 3600 + int(zone[-2:] if len(zone) > 3 else 0) * 60
+        if zone[0] == "-":
+            offset = -offset
+        if offset:
+            from dateutil.tz import tzoffset
+            tzinfo = tzoffset(None, offset)
+        else:
+            tzinfo = _utc or _tzutc()
+    return datetime.datetime(int(year), int(month), int(day), int(hour),
+                             int(minute), int(second), microsecond, tzinfo)
+
+
+def parse_datetime(value):
+    """Parses an API timestamp, falling back to dateutil for unusual formats."""
+    if isinstance(value, str):
+        try:
+            parsed = parse_iso8601(value)
+        except ValueError:
+            parsed = None
+        if parsed is not None:
+            return parsed
+    from dateutil.parser import parse as dateutil_parse
+    return dateutil_parse(value)
+
+
+def format_iso8601(value):
+    """Formats a datetime as an API timestamp. Naive values are taken as UTC."""
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def to_datetime(value):
+    """Like :func:`parse_datetime`, but ``None`` for missing or bad values."""
+    if value is None:
+        return None
+    try:
+        return parse_datetime(value)
+    except Exception:
+        return None
+
+
+def _is_name(name):
+    return name.isidentifier() and not keyword.iskeyword(name)
+
+
+def _assign(name, expr):
+    if _is_name(name):
+        return "obj.%s = %s" % (name, expr)
+    return "setattr(obj, %r, %s)" % (name, expr)
+
+
+def decoder_source(cls, skip_init=True, lazy_dates=False, lazy=False):
+    """Returns the source of the specialized decoder for a model class.
+
+    The generated function is equivalent to calling ``cls()`` followed by
+    :func:`to_python` with the class's field declarations: fields listed in
+    ``_keys()`` always end up set (``None`` when missing), ``_floats`` and
+    ``_dicts`` are only set when present, dates that fail to parse become
+    ``None``, and ``_map`` entries are decoded into nested models.
+
+    With ``skip_init`` the instance is created without running ``__init__``;
+    pass ``False`` for classes that override it. With ``lazy_dates`` the
+    date fields are left unset and parsed from ``_raw`` on first access;
+    with ``lazy`` every field is.
+    """
+    lazy_fields = set()
+    if lazy:
+        lazy_fields.update(field_converters(cls))
+    elif lazy_dates:
+        lazy_fields.update(cls._dates)
+
+    body = []
+    if not (cls._strs or cls._dates or cls._bools or cls._dicts or cls._map):
+        # only _ints/_floats, which to_python guards against a None dict
+        body.append("if in_dict is None: in_dict = {}")
+    if skip_init:
+        body.append("obj = new(cls)")
+    else:
+        body.append("obj = cls()")
+        for name in (cls._strs + cls._ints + cls._dates + cls._bools
+                     + list(cls._map)):
+            if name in lazy_fields:
+                body.append("del obj.%s" % name if _is_name(name)
+                            else "delattr(obj, %r)" % name)
+    if len(lazy_fields) < len(field_converters(cls)):
+        body.append("get = in_dict.get")
+
+    for name in cls._strs:
+        if name not in lazy_fields:
+            body.append(_assign(name, "get(%r)" % name))
+    for name in cls._dates:
+        if name not in lazy_fields:
+            body.append(_assign(name, "to_datetime(get(%r))" % name))
+    for name in cls._ints:
+        if name not in lazy_fields:
+            body.append("v = get(%r)" % name)
+            body.append(_assign(name, "None if v is None else int(v)"))
+    for name in cls._floats:
+        if name not in lazy_fields:
+            body.append("v = get(%r)" % name)
+            body.append("if v is not None: " + _assign(name, "float(v)"))
+    for name in cls._bools:
+        if name not in lazy_fields:
+            body.append("v = get(%r)" % name)
+            body.append(_assign(name, "None if v is None else bool(v)"))
+    for name in cls._dicts:
+        if name not in lazy_fields:
+            body.append("v = get(%r)" % name)
+            body.append("if v is not None: " + _assign(name, "dict(v)"))
+    for i, name in enumerate(cls._map):
+        if name not in lazy_fields:
+            body.append("v = get(%r)" % name)
+            body.append(_assign(
+                name, "map_%d.new_from_dict(v) if v else None" % i))
+
+    if lazy_fields:
+        body.append("obj._raw = in_dict")
+    body.append("obj._h = h")
+    body.append("if kwargs:")
+    body.append("    for k, v in kwargs.items(): setattr(obj, k, v)")
+    body.append("return obj")
+
+    return ("def decode(in_dict, h=None, kwargs=None):\n"
+            + "".join("    %s\n" % line for line in body))
+
+
+def compile_decoder(cls, skip_init=True, lazy_dates=False, lazy=False):
+    """Builds the specialized ``decode(in_dict, h, kwargs)`` function of a model."""
+    source = decoder_source(cls, skip_init, lazy_dates, lazy)
+    namespace = {
+        'cls': cls,
+        'new': object.__new__,
+        'to_datetime': to_datetime,
+    }
+    for i, model in enumerate(cls._map.values()):
+        namespace['map_%d' % i] = model
+    code = compile(source, "<decoder %s>" % cls.__name__, "exec")
+    exec(code, namespace)
+    decode = namespace['decode']
+    decode.source = source
+    return decode
+
+
+def _convert_int(value):
+    return None if value is None else int(value)
+
+
+def _convert_float(value):
+    return MISSING if value is None else float(value)
+
+
+def _convert_bool(value):
+    return None if value is None else bool(value)
+
+
+def _convert_dict(value):
+    return MISSING if value is None else dict(value)
+
+
+def field_converters(cls):
+    """Returns ``{field: convert(raw_dict)}`` for fields decoded on access.
+
+    Converters mirror the generated decoders, and return :data:`MISSING`
+    for ``_floats``/``_dicts`` fields that an eager decode leaves unset.
+    """
+    converters = {}
+
+    def add(names, convert):
+        for name in names:
+            converters[name] = (
+                lambda raw, name=name: convert(raw.get(name)))
+
+    add(cls._strs, lambda value: value)
+    add(cls._dates, to_datetime)
+    add(cls._ints, _convert_int)
+    add(cls._floats, _convert_float)
+    add(cls._bools, _convert_bool)
+    add(cls._dicts, _convert_dict)
+    for name, model in cls._map.items():
+        add([name], lambda value, model=model: (
+            model.new_from_dict(value) if value else None))
+    return converters
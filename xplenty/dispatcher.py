@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from .exceptions import XplentyAPIException
+from .retry import CONNECTION_ERRORS
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+
+AVAILABLE_STATUSES = frozenset(['available'])
+STARTING_STATUSES = frozenset(['pending', 'creating', 'scaling'])
+
+DispatcherStats = collections.namedtuple('DispatcherStats', [
+    'queued', 'placed', 'failed', 'clusters_created', 'mean_queue_time',
+    'max_queue_time'])
+
+
+class ClusterPool(object):
+    """Warm clusters of one type that jobs are packed onto.
+
+    A cluster runs up to ``nodes * jobs_per_node`` jobs. :meth:`place`
+    picks the available cluster with the lowest share of that capacity in
+    use, counting both its ``running_jobs_count`` and the jobs placed on
+    it since the last :meth:`update`. Clusters are only created by
+    :meth:`grow`, when the queued jobs do not fit on the clusters that are
+    available or still starting.
+
+    Clusters the pool creates have ``terminate_on_idle`` set, so those not
+    needed any more stop costing node-hours after ``time_to_idle``.
+
+    :param client: The :class:`XplentyClient` to create clusters with.
+    :param cluster_type: ``'production'`` or ``'sandbox'``.
+    :param nodes: Nodes of each cluster the pool creates.
+    :param min_size: Clusters kept warm even with nothing queued.
+    :param max_size: Most clusters the pool runs at once.
+    :param jobs_per_node: Concurrent jobs each node takes.
+    :param time_to_idle: Seconds before an idle created cluster terminates.
+    :param name: Prefix of the names of created clusters.
+    :param adopt: Also place jobs on clusters of this type that the pool
+        did not create.
+    """
+
+    def __init__(self, client, cluster_type='production', nodes=1,
+                 min_size=0, max_size=4, jobs_per_node=1, time_to_idle=3600,
+                 name='xplenty-pool', adopt=True):
+        self.client = client
+        self.cluster_type = cluster_type
+        self.nodes = nodes
+        self.min_size = min_size
+        self.max_size = max_size
+        self.jobs_per_node = jobs_per_node
+        self.time_to_idle = time_to_idle
+        self.name = name
+        self.adopt = adopt
+        self.created = 0
+        self._lock = threading.Lock()
+        self._clusters = collections.OrderedDict()
+        self._placed = collections.Counter()
+
+    def __repr__(self):
+        return "<ClusterPool '{0}' of {1} clusters>".format(
+            self.cluster_type, len(self._clusters))
+
+    @property
+    def clusters(self):
+        with self._lock:
+            return list(self._clusters.values())
+
+    def owns(self, cluster):
+        """Whether jobs of this pool may run on ``cluster``."""
+        if cluster.type != self.cluster_type:
+            return False
+        return self.adopt or (cluster.name or '').startswith(self.name + '-')
+
+    def update(self, clusters):
+        """Replaces the pool's clusters with the live ones in a listing."""
+        live = [cluster for cluster in clusters
+                if self.owns(cluster) and (
+                    cluster.status in AVAILABLE_STATUSES
+                    or cluster.status in STARTING_STATUSES)]
+        with self._lock:
+            self._clusters = collections.OrderedDict(
+                (cluster.id, cluster) for cluster in live)
+            self._placed.clear()
+
+    def capacity(self, cluster):
+        return max(cluster.nodes or 1, 1) * self.jobs_per_node
+
+    def load(self, cluster):
+        """Jobs running on ``cluster`` plus those placed since the update."""
+        return (cluster.running_jobs_count or 0) + self._placed[cluster.id]
+
+    def place(self):
+        """Reserves a slot on the least loaded available cluster.
+
+        Returns the :class:`Cluster`, or ``None`` when every available
+        cluster is full.
+        """
+        with self._lock:
+            best = None
+            for cluster in self._clusters.values():
+                if cluster.status not in AVAILABLE_STATUSES:
+                    continue
+                capacity = self.capacity(cluster)
+                load = self.load(cluster)
+                if load >= capacity:
+                    continue
+                key = (load / float(capacity), load - capacity)
+                if best is None or key < best[0]:
+                    best = (key, cluster)
+            if best is None:
+                return None
+            cluster = best[1]
+            self._placed[cluster.id] += 1
+            return cluster
+
+    def release(self, cluster):
+        """Gives back a slot taken by :meth:`place` whose job failed."""
+        with self._lock:
+            if self._placed[cluster.id] > 0:
+                self._placed[cluster.id] -= 1
+
+    def free_starting_slots(self):
+        """Slots on clusters that are starting up and will take jobs soon."""
+        with self._lock:
+            return sum(max(self.capacity(cluster) - self.load(cluster), 0)
+                       for cluster in self._clusters.values()
+                       if cluster.status in STARTING_STATUSES)
+
+    def grow(self, queued=0):
+        """Creates the clusters needed for ``queued`` jobs that found no slot.
+
+        Jobs are first counted against clusters that are still starting,
+        and the pool never exceeds ``max_size``. Returns the new clusters.
+        """
+        with self._lock:
+            size = len(self._clusters)
+        per_cluster = max(self.nodes, 1) * self.jobs_per_node
+        waiting = max(queued - self.free_starting_slots(), 0)
+        wanted = -(-waiting // per_cluster)  # rounded up
+        wanted = max(wanted, self.min_size - size)
+        wanted = min(wanted, self.max_size - size)
+        created = []
+        for _ in range(max(wanted, 0)):
+            self.created += 1
+            name = '%s-%s' % (self.name, uuid.uuid4().hex[:8])
+            cluster = self.client.create_cluster(
+                self.cluster_type, self.nodes, name,
+                'Created by a ClusterPool', terminate_on_idle=True,
+                time_to_idle=self.time_to_idle)
+            logger.info("Created %s cluster %s (%s)", self.cluster_type,
+                        cluster.id, name)
+            with self._lock:
+                self._clusters[cluster.id] = cluster
+            created.append(cluster)
+        return created
+
+
+class _QueuedJob(object):
+    __slots__ = ('package_id', 'variables', 'dynamic_variables',
+                 'idempotency_key', 'cluster_type', 'future', 'queued_at')
+
+    def __init__(self, package_id, variables, dynamic_variables,
+                 idempotency_key, cluster_type):
+        self.package_id = package_id
+        self.variables = variables or {}
+        self.dynamic_variables = dynamic_variables or {}
+        self.idempotency_key = idempotency_key
+        self.cluster_type = cluster_type
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+
+class JobDispatcher(object):
+    """Runs jobs on warm clusters instead of a new cluster per workload.
+
+    :meth:`submit` queues a job and returns a future. Each :meth:`dispatch`
+    refreshes every pool from a single cluster listing, places queued jobs
+    on the least loaded available cluster of their type, and asks a pool
+    to :meth:`ClusterPool.grow` only for the jobs that did not fit::
+
+        pool = ClusterPool(client, 'production', nodes=2, max_size=3)
+        with JobDispatcher(client, [pool]) as dispatcher:
+            futures = [dispatcher.submit(package_id, {'day': day})
+                       for day in days]
+            jobs = [future.result() for future in futures]
+
+    Futures resolve to the :class:`Job` once it has been added to a
+    cluster, or to the exception ``add_job`` raised.
+
+    :param client: The :class:`XplentyClient` to run jobs with.
+    :param pools: :class:`ClusterPool` instances, one per cluster type.
+        Defaults to a production pool with default settings.
+    :param interval: Seconds between dispatches of the background thread.
+        A submit wakes it up right away.
+    """
+
+    def __init__(self, client, pools=None, interval=15.0):
+        if pools is None:
+            pools = [ClusterPool(client)]
+        self.client = client
+        self.pools = collections.OrderedDict(
+            (pool.cluster_type, pool) for pool in pools)
+        self.interval = interval
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._dispatch_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._placed = 0
+        self._failed = 0
+        self._queue_time = 0.0
+        self._max_queue_time = 0.0
+
+    def __repr__(self):
+        return '<JobDispatcher with {0} queued jobs>'.format(len(self._queue))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def submit(self, package_id, variables=None, dynamic_variables=None,
+               cluster_type=None, idempotency_key=None):
+        """Queues a job and returns a future resolving to its :class:`Job`.
+
+        :param cluster_type: Pool to run the job on; the first by default.
+        :param idempotency_key: Sent with ``add_job``. Generated if omitted
+            and the client's retry policy has ``retry_add_job`` set.
+        """
+        if cluster_type is None:
+            cluster_type = next(iter(self.pools))
+        elif cluster_type not in self.pools:
+            raise ValueError("No cluster pool of type %r" % cluster_type)
+        retry = self.client.retry
+        if (idempotency_key is None and retry is not None
+                and retry.retry_add_job):
+            idempotency_key = str(uuid.uuid4())
+        job = _QueuedJob(package_id, variables, dynamic_variables,
+                         idempotency_key, cluster_type)
+        with self._lock:
+            self._queue.append(job)
+        self._wakeup.set()
+        return job.future
+
+    @property
+    def queued(self):
+        with self._lock:
+            return len(self._queue)
+
+    def stats(self):
+        """Returns :class:`DispatcherStats` counted since the dispatcher began."""
+        with self._lock:
+            return DispatcherStats(
+                len(self._queue), self._placed, self._failed,
+                sum(pool.created for pool in self.pools.values()),
+                self._queue_time / self._placed if self._placed else 0.0,
+                self._max_queue_time)
+
+    def refresh(self):
+        """Updates every pool from one listing of the account's clusters."""
+        clusters = list(self.client.iter_clusters(page_size=100))
+        for pool in self.pools.values():
+            pool.update(clusters)
+
+    def _run_job(self, job, cluster, pool):
+        if not job.future.set_running_or_notify_cancel():
+            pool.release(cluster)
+            return
+        try:
+            created = self.client.add_job(
+                cluster.id, job.package_id, job.variables,
+                job.dynamic_variables, idempotency_key=job.idempotency_key)
+        except Exception as error:
+            # the future is running, so any error must resolve it
+            pool.release(cluster)
+            logger.warning("Could not add job of package %s to cluster %s: "
+                           "%s", job.package_id, cluster.id, error)
+            with self._lock:
+                self._failed += 1
+            job.future.set_exception(error)
+            return
+        waited = time.monotonic() - job.queued_at
+        with self._lock:
+            self._placed += 1
+            self._queue_time += waited
+            self._max_queue_time = max(self._max_queue_time, waited)
+        job.future.set_result(created)
+
+    def dispatch(self):
+        """Places queued jobs and grows saturated pools once.
+
+        Returns the number of jobs still queued.
+        """
+        with self._dispatch_lock:
+            self.refresh()
+            with self._lock:
+                remaining = collections.deque(self._queue)
+                self._queue.clear()
+            waiting = []
+            try:
+                while remaining:
+                    job = remaining[0]
+                    if job.future.cancelled():
+                        remaining.popleft()
+                        continue
+                    pool = self.pools[job.cluster_type]
+                    cluster = pool.place()
+                    remaining.popleft()
+                    if cluster is None:
+                        waiting.append(job)
+                    else:
+                        self._run_job(job, cluster, pool)
+            finally:
+                # jobs not placed yet go back, even if placing one failed
+                with self._lock:
+                    self._queue.extendleft(reversed(waiting + list(remaining)))
+            counts = collections.Counter(job.cluster_type for job in waiting)
+            for cluster_type, pool in self.pools.items():
+                pool.grow(counts[cluster_type])
+            return len(waiting)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                self.dispatch()
+            except (XplentyAPIException,) + CONNECTION_ERRORS as error:
+                logger.warning("Job dispatch failed: %s", error)
+            except Exception:
+                logger.exception("Job dispatch failed")
+            self._wakeup.wait(self.interval)
+
+    def start(self):
+        """Starts dispatching in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="xplenty-job-dispatcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread. Queued jobs stay queued."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -15,3 +15,15 @@ class XplentyAPIException(Exception):
             msg = str(http_error)
 
         super(XplentyAPIException, self).__init__(msg)
+
+
+class XplentyRateLimitExceeded(XplentyAPIException):
+    """
+    Raised when the client-side rate limiter has no request left and is
+    not allowed to wait for one.
+    """
+
+    def __init__(self, message):
+        self.http_error = None
+        self.content = None
+        Exception.__init__(self, message)
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+import bisect
+import collections
+import contextvars
+import functools
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+# inspect.CO_COROUTINE; inspect and asyncio are too slow to import just to
+# tell ``async def`` methods apart
+_CO_COROUTINE = 0x80
+
+# Where the time of a request goes, in the order it is spent:
+# rate limiter, pool slot, TCP/TLS connect, server (time to the response
+# headers), body transfer, JSON decode and model hydration.
+PHASES = ('throttle', 'queue', 'connect', 'wait', 'read', 'decode',
+          'hydrate')
+
+_current_event = contextvars.ContextVar('xplenty_request_event',
+                                        default=None)
+
+
+def endpoint_of(method, url):
+    """Returns a label for the endpoint, e.g. ``'GET jobs/{id}'``."""
+    path = urlsplit(url).path
+    _, _, rest = path.partition('/api/')
+    parts = ['{id}' if part.isdigit() else part
+             for part in rest.strip('/').split('/')]
+    return '%s %s' % (method, '/'.join(parts))
+
+
+class RequestEvent(object):
+    """What one API call did and where its time went.
+
+    Timings are in seconds. ``hydrate`` covers building models from the
+    decoded response; it is not measured for streamed responses, whose
+    models are built while the caller iterates.
+    """
+
+    __slots__ = ('operation', 'method', 'url', 'endpoint', 'status',
+                 'bytes_out', 'bytes_in', 'cached', 'coalesced', 'retries',
+                 'error', 'start', 'end', '_response', '_decoded_at') + PHASES
+
+    def __init__(self, operation=None):
+        self.operation = operation
+        self.method = None
+        self.url = None
+        self.endpoint = None
+        self.status = None
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.cached = False
+        self.coalesced = False
+        self.retries = 0
+        self.error = None
+        self.start = time.perf_counter()
+        self.end = None
+        self._response = None
+        self._decoded_at = None
+        for phase in PHASES:
+            setattr(self, phase, 0.0)
+
+    def __repr__(self):
+        return '<RequestEvent %s %s in %.1fms>' % (
+            self.endpoint, self.status, self.duration * 1000)
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def request(self, method, url, body=None):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint_of(method, url)
+        self.bytes_out = len(body) if body else 0
+
+    def response(self, response):
+        """Takes the transfer timings from a pooled response."""
+        self._response = response
+        self.status = response.status
+        self.queue = response.queue_time
+        self.connect = response.connect_time
+        self.wait = response.wait_time
+
+    def decoded(self, start=None):
+        now = time.perf_counter()
+        if start is not None:
+            self.decode = now - start
+        self._decoded_at = now
+
+    def finish(self, error=None):
+        self.end = time.perf_counter()
+        self.error = error
+        response, self._response = self._response, None
+        if response is not None:
+            self.read = response.read_time
+            self.bytes_in = response.bytes_read
+        if self._decoded_at is not None:
+            self.hydrate = self.end - self._decoded_at
+
+    def as_dict(self):
+        d = dict((name, getattr(self, name)) for name in (
+            'operation', 'method', 'url', 'endpoint', 'status', 'bytes_out',
+            'bytes_in', 'cached', 'coalesced', 'retries') + PHASES)
+        d['duration'] = self.duration
+        return d
+
+
+class RequestHooks(object):
+    """Base class for request hooks passed to a client's ``hooks``.
+
+    Override any of the callbacks. They run on the thread (or event loop)
+    making the request, so they should be quick; exceptions they raise are
+    logged and otherwise ignored.
+    """
+
+    def before_request(self, event):
+        """Called before the request is sent; timings are not set yet."""
+
+    def after_response(self, event):
+        """Called once the response has been read, decoded and hydrated."""
+
+    def on_error(self, event, error):
+        """Called instead of :meth:`after_response` when the call failed."""
+
+
+def call_hooks(hooks, name, *args):
+    for hook in hooks:
+        callback = getattr(hook, name, None)
+        if callback is None:
+            continue
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception("Request hook %r failed in %s", hook, name)
+
+
+def current_event():
+    """Returns the event of the call in progress, or ``None``."""
+    return _current_event.get()
+
+
+def finish_event(hooks, event, error=None):
+    if event is None:
+        return
+    event.finish(error)
+    if error is None:
+        call_hooks(hooks, 'after_response', event)
+    else:
+        call_hooks(hooks, 'on_error', event, error)
+
+
+def _start_event(operation):
+    """Starts an event unless the call joins one that has not sent yet."""
+    event = _current_event.get()
+    if event is not None and event.method is None:
+        return None, None
+    event = RequestEvent(operation)
+    return event, _current_event.set(event)
+
+
+def instrumented(func):
+    """Reports a client method's request to the client's hooks.
+
+    The outermost instrumented call starts the event and the request it
+    sends fills it in, so ``get_job`` and the ``get`` it calls report one
+    event. Works for both plain and ``async`` methods, and costs a single
+    attribute lookup when the client has no hooks.
+    """
+    if func.__code__.co_flags & _CO_COROUTINE:
+        @functools.wraps(func)
+        async def async_wrapper(self, *args, **kwargs):
+            if not self.hooks:
+                return await func(self, *args, **kwargs)
+            event, token = _start_event(func.__name__)
+            if event is None:
+                return await func(self, *args, **kwargs)
+            try:
+                result = await func(self, *args, **kwargs)
+            except Exception as error:
+                finish_event(self.hooks, event, error)
+                raise
+            finally:
+                _current_event.reset(token)
+            finish_event(self.hooks, event)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not self.hooks:
+            return func(self, *args, **kwargs)
+        event, token = _start_event(func.__name__)
+        if event is None:
+            return func(self, *args, **kwargs)
+        try:
+            result = func(self, *args, **kwargs)
+        except Exception as error:
+            finish_event(self.hooks, event, error)
+            raise
+        finally:
+            _current_event.reset(token)
+        finish_event(self.hooks, event)
+        return result
+    return wrapper
+
+
+class LatencyHistogram(object):
+    """Fixed-bucket latency histogram.
+
+    :param bounds: Upper bounds of the buckets in seconds, ascending. One
+        more bucket counts everything above the last bound.
+    """
+
+    BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+              1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """Estimates a percentile as the upper bound of its bucket."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class EndpointStats(object):
+
+    def __init__(self, bounds):
+        self.latency = LatencyHistogram(bounds)
+        self.phases = dict((phase, 0.0) for phase in PHASES)
+        self.statuses = collections.Counter()
+        self.errors = 0
+        self.cached = 0
+        self.coalesced = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, event, failed):
+        self.latency.record(event.duration)
+        for phase in PHASES:
+            self.phases[phase] += getattr(event, phase)
+        if event.status is not None:
+            self.statuses[event.status] += 1
+        self.errors += failed
+        self.cached += event.cached
+        self.coalesced += event.coalesced
+        self.bytes_in += event.bytes_in
+        self.bytes_out += event.bytes_out
+
+    def as_dict(self):
+        latency = self.latency
+        count = latency.count or 1
+        d = {
+            'count': latency.count,
+            'errors': self.errors,
+            'cached': self.cached,
+            'coalesced': self.coalesced,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'statuses': dict(self.statuses),
+            'mean': latency.mean,
+            'p50': latency.percentile(0.50),
+            'p90': latency.percentile(0.90),
+            'p99': latency.percentile(0.99),
+            'max': latency.max or 0.0,
+        }
+        for phase in PHASES:
+            d[phase] = self.phases[phase] / count
+        return d
+
+
+class MetricsCollector(RequestHooks):
+    """In-process request metrics: a latency histogram per endpoint.
+
+    Pass it to a client with ``hooks=[collector]``. Besides the histogram,
+    each endpoint keeps the mean time spent in every phase of a request
+    (see :data:`PHASES`), status counts, errors and bytes transferred.
+
+    :param bounds: Histogram bucket bounds, see :class:`LatencyHistogram`.
+    """
+
+    def __init__(self, bounds=LatencyHistogram.BOUNDS):
+        self.bounds = bounds
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __repr__(self):
+        return '<Xplenty metrics collector at 0x%x>' % (id(self))
+
+    def _record(self, event, failed):
+        endpoint = event.endpoint or event.operation
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = EndpointStats(self.bounds)
+            stats.record(event, failed)
+
+    def after_response(self, event):
+        self._record(event, False)
+
+    def on_error(self, event, error):
+        self._record(event, True)
+
+    def histogram(self, endpoint):
+        """Returns the :class:`LatencyHistogram` of an endpoint, or ``None``."""
+        stats = self._stats.get(endpoint)
+        return stats.latency if stats is not None else None
+
+    def summary(self):
+        """Returns ``{endpoint: stats}`` with latencies in seconds."""
+        with self._lock:
+            return dict((endpoint, stats.as_dict())
+                        for endpoint, stats in self._stats.items())
+
+    def report(self):
+        """Returns the summary as a text table, slowest endpoints first."""
+        rows = sorted(self.summary().items(),
+                      key=lambda row: row[1]['mean'] * row[1]['count'],
+                      reverse=True)
+        lines = ['%-28s %6s %5s %8s %8s %8s ' % (
+            'endpoint', 'count', 'err', 'p50 ms', 'p99 ms', 'mean ms')
+            + ' '.join('%8s' % phase for phase in PHASES)]
+        for endpoint, d in rows:
+            lines.append('%-28s %6d %5d %8.1f %8.1f %8.1f ' % (
+                endpoint, d['count'], d['errors'], d['p50'] * 1000,
+                d['p99'] * 1000, d['mean'] * 1000)
+                + ' '.join('%8.1f' % (d[phase] * 1000) for phase in PHASES))
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import collections
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dateutil.tz import tzutc
+
+from .ratelimit import RateLimiter
+from .transport import ConnectionPool
+from .xplenty_api import BulkResult, XplentyClient
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+
+AccountItem = collections.namedtuple('AccountItem', ['account_id', 'item'])
+
+
+class FanOutResult(list):
+    """:class:`AccountItem` results gathered from many accounts.
+
+    Accounts whose requests failed are left out of the list; their
+    exceptions are kept in :attr:`errors`, keyed by account id.
+    """
+
+    def __init__(self, items=(), errors=None):
+        super(FanOutResult, self).__init__(items)
+        self.errors = collections.OrderedDict(errors or ())
+
+    def by_account(self):
+        """Returns the items grouped as ``{account_id: [item, ...]}``."""
+        grouped = collections.OrderedDict()
+        for account_id, item in self:
+            grouped.setdefault(account_id, []).append(item)
+        return grouped
+
+
+def _as_statuses(status):
+    if status is None:
+        return None
+    if isinstance(status, str):
+        return frozenset([status])
+    return frozenset(status)
+
+
+class MultiAccountClient(object):
+    """Queries many Xplenty accounts concurrently through one connection pool.
+
+    Each account gets its own :class:`XplentyClient`, and with it its own
+    rate limiter, since the API limits every account separately. All
+    clients share one :class:`ConnectionPool`, so connections opened for
+    one account are reused by the others::
+
+        multi = MultiAccountClient({'acme': key1, 'globex': key2})
+        for account_id, cluster in multi.get_clusters(status='available'):
+            print(account_id, cluster.name)
+
+    :param accounts: Mapping of account id to API key.
+    :param pool: A :class:`ConnectionPool` to share. When omitted, one is
+        created with ``pool_maxsize`` connections.
+    :param rate_limiter: Callable returning a new rate limiter for each
+        account, :class:`RateLimiter` by default. ``None`` disables rate
+        limiting.
+    :param max_concurrency: Number of accounts queried at the same time.
+    :param client_kwargs: Further :class:`XplentyClient` arguments shared by
+        every account, e.g. ``retry`` or ``lazy``.
+    """
+
+    def __init__(self, accounts=None, pool=None, pool_maxsize=20,
+                 pool_idle_timeout=60.0, timeout=None,
+                 rate_limiter=RateLimiter, max_concurrency=8,
+                 **client_kwargs):
+        if pool is None:
+            pool = ConnectionPool(maxsize=pool_maxsize,
+                                  idle_timeout=pool_idle_timeout,
+                                  timeout=timeout)
+        self.pool = pool
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max_concurrency
+        self.client_kwargs = client_kwargs
+        self._lock = threading.Lock()
+        self._clients = collections.OrderedDict()
+        for account_id, api_key in dict(accounts or {}).items():
+            self.add_account(account_id, api_key)
+
+    def __repr__(self):
+        return '<Xplenty multi-account client for {0} accounts>'.format(
+            len(self._clients))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Closes the idle connections of the shared pool."""
+        self.pool.clear()
+
+    @property
+    def accounts(self):
+        with self._lock:
+            return list(self._clients)
+
+    def add_account(self, account_id, api_key):
+        """Adds an account and returns its :class:`XplentyClient`."""
+        limiter = self.rate_limiter() if self.rate_limiter else None
+        client = XplentyClient(account_id, api_key, pool=self.pool,
+                               rate_limiter=limiter, **self.client_kwargs)
+        with self._lock:
+            self._clients[account_id] = client
+        return client
+
+    def remove_account(self, account_id):
+        with self._lock:
+            del self._clients[account_id]
+
+    def client(self, account_id):
+        """Returns the :class:`XplentyClient` of an account."""
+        with self._lock:
+            return self._clients[account_id]
+
+    def fan_out(self, func, accounts=None, max_concurrency=None):
+        """Calls ``func(client)`` for every account concurrently.
+
+        Returns a :class:`BulkResult` mapping each account id to the return
+        value of ``func``, or to the exception it raised.
+
+        :param accounts: Account ids to query; all accounts by default.
+        """
+        with self._lock:
+            clients = collections.OrderedDict(
+                (account_id, client)
+                for account_id, client in self._clients.items()
+                if accounts is None or account_id in accounts)
+        result = BulkResult()
+        if not clients:
+            return result
+        workers = min(max_concurrency or self.max_concurrency, len(clients))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(account_id, executor.submit(func, client))
+                       for account_id, client in clients.items()]
+            for account_id, future in futures:
+                try:
+                    result[account_id] = future.result()
+                except Exception as error:
+                    # one broken account must not fail the others
+                    logger.warning("Account %s failed: %s", account_id, error)
+                    result[account_id] = error
+        return result
+
+    def collect(self, func, accounts=None, max_concurrency=None):
+        """Like :meth:`fan_out` for a ``func`` returning an iterable of items.
+
+        The iterable is consumed in the worker threads, so generators such
+        as ``client.stream_jobs()`` are read concurrently as well. Returns
+        a :class:`FanOutResult` of :class:`AccountItem` tuples.
+        """
+        results = self.fan_out(lambda client: list(func(client)), accounts,
+                               max_concurrency)
+        items = FanOutResult(errors=results.failed)
+        for account_id, value in results.succeeded.items():
+            items.extend(AccountItem(account_id, item) for item in value)
+        return items
+
+    def get_clusters(self, status=None, accounts=None):
+        """Returns the clusters of every account, optionally by status.
+
+        :param status: A status such as ``'available'``, or several.
+        """
+        statuses = _as_statuses(status)
+        filters = {}
+        if statuses is not None and len(statuses) == 1:
+            filters['status'] = next(iter(statuses))
+
+        def clusters(client):
+            for cluster in client.iter_clusters(page_size=100, **filters):
+                if statuses is None or cluster.status in statuses:
+                    yield cluster
+        return self.collect(clusters, accounts)
+
+    def get_jobs(self, status=None, since=None, accounts=None,
+                 since_field='updated_at'):
+        """Returns the jobs of every account, e.g. all failed jobs since T.
+
+        :param status: A status such as ``'failed'``, or several.
+        :param since: Only jobs whose ``since_field`` is at or after this
+            datetime. Naive datetimes are taken as UTC.
+        :param since_field: Date field ``since`` applies to.
+        """
+        statuses = _as_statuses(status)
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=tzutc())
+        # let the API do what filtering it can; the checks below still
+        # apply in case it ignores a parameter
+        filters = {}
+        if statuses is not None and len(statuses) == 1:
+            filters['status'] = next(iter(statuses))
+        if since is not None and since_field == 'updated_at':
+            filters['since'] = since
+
+        def jobs(client):
+            for job in client.stream_jobs(**filters):
+                if statuses is not None and job.status not in statuses:
+                    continue
+                if since is not None:
+                    when = getattr(job, since_field, None)
+                    if not isinstance(when, datetime.datetime) or when < since:
+                        continue
+                yield job
+        return self.collect(jobs, accounts)
+
+    def get_packages(self, accounts=None):
+        return self.collect(
+            lambda client: client.iter_packages(page_size=100), accounts)
+
+    def get_schedules(self, accounts=None):
+        return self.collect(lambda client: client.stream_schedules(),
+                            accounts)
+
+    def get_account_limits(self, accounts=None):
+        """Returns a :class:`BulkResult` of each account's limits."""
+        return self.fan_out(lambda client: client.get_account_limits(),
+                            accounts)
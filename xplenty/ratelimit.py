@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+
+from .exceptions import XplentyRateLimitExceeded
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+
+class RateLimiter(object):
+    """Client-side token bucket matching the account's API rate limit.
+
+    The bucket holds up to ``limit`` tokens and refills at
+    ``limit / window`` tokens per second. Each request takes one token.
+    Tokens are reserved under a lock, so concurrent callers on a shared
+    client are spaced out evenly instead of bursting into HTTP 429s.
+
+    Until the limiter is calibrated (from ``rate_limit_status`` or from the
+    ``X-RateLimit-*`` response headers) it lets every request through.
+
+    :param limit: Requests allowed per ``window``. ``None`` to seed later.
+    :param window: Length of the rate limit window in seconds.
+    :param block: Wait for a token when none is free. When ``False``,
+        :class:`XplentyRateLimitExceeded` is raised instead.
+    :param recalibrate_interval: Seconds after which the client refreshes
+        the limiter from ``rate_limit_status``. ``None`` disables it.
+    """
+
+    def __init__(self, limit=None, window=3600.0, block=True,
+                 recalibrate_interval=300.0):
+        self.window = float(window)
+        self.block = block
+        self.recalibrate_interval = recalibrate_interval
+        self._lock = threading.Lock()
+        self._limit = None
+        self._rate = None
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._calibrated_at = None
+        if limit is not None:
+            self.calibrate(limit)
+
+    def __repr__(self):
+        return "<RateLimiter '{0}/{1}s'>".format(self._limit, self.window)
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def tokens(self):
+        """Tokens currently available. Negative while callers are queued."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def _refill(self, now):
+        if self._rate:
+            self._tokens = min(float(self._limit),
+                               self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def calibrate(self, limit, remaining=None):
+        """Sets the bucket size, and optionally the tokens left, from the API."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if not limit:
+                return
+            self._limit = int(limit)
+            self._rate = self._limit / self.window
+            if remaining is not None:
+                self._tokens = min(float(remaining), float(self._limit))
+            elif self._calibrated_at is None:
+                self._tokens = float(self._limit)
+            self._calibrated_at = now
+            logger.debug("Rate limiter calibrated: limit %s, remaining %s",
+                         limit, remaining)
+
+    def update_from_headers(self, headers):
+        """Recalibrates from ``X-RateLimit-Limit``/``X-RateLimit-Remaining``.
+
+        The server's ``remaining`` count only ever lowers the local bucket,
+        because requests still in flight are not reflected in it yet.
+        """
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        if limit is None:
+            return
+        try:
+            limit = int(limit)
+            remaining = int(remaining) if remaining is not None else None
+        except ValueError:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit != self._limit:
+                self._limit = limit
+                self._rate = limit / self.window
+                self._tokens = min(self._tokens, float(limit))
+            if remaining is not None:
+                self._tokens = min(self._tokens, float(remaining))
+            if self._calibrated_at is None:
+                self._calibrated_at = now
+
+    def drain(self):
+        """Empties the bucket, e.g. after the server answered HTTP 429."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+    def start_calibration(self):
+        """Returns ``True`` to the single caller that should recalibrate now."""
+        if self.recalibrate_interval is None:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if (self._calibrated_at is not None
+                    and now - self._calibrated_at < self.recalibrate_interval):
+                return False
+            # claim the slot so concurrent callers do not all recalibrate
+            self._calibrated_at = now
+            return True
+
+    def reserve(self, block=None, timeout=None):
+        """Takes a token and returns the seconds to wait before using it.
+
+        :raises XplentyRateLimitExceeded: if no token is free and the caller
+            may not block, or the wait would exceed ``timeout``.
+        """
+        if block is None:
+            block = self.block
+        with self._lock:
+            if not self._rate:
+                return 0.0
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            delay = (1 - self._tokens) / self._rate
+            if not block or (timeout is not None and delay > timeout):
+                raise XplentyRateLimitExceeded(
+                    "Rate limit of {0} requests per {1:g}s reached, next "
+                    "token in {2:.2f}s".format(self._limit, self.window, delay))
+            self._tokens -= 1
+            return delay
+
+    def acquire(self, block=None, timeout=None):
+        """Blocks the calling thread until a token is available."""
+        delay = self.reserve(block, timeout)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, block=None, timeout=None):
+        """Like :meth:`acquire`, but sleeps without blocking the event loop."""
+        import asyncio
+        delay = self.reserve(block, timeout)
+        if delay:
+            await asyncio.sleep(delay)
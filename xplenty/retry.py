@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import email.utils
+import http.client
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# Failures where no HTTP status was received: resets, timeouts, refused
+# connections and malformed or truncated responses.
+CONNECTION_ERRORS = (OSError, http.client.HTTPException)
+
+
+def parse_retry_after(value):
+    """Returns the seconds a ``Retry-After`` header asks to wait, or ``None``.
+
+    The header is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy(object):
+    """When and how long to wait before resending a failed request.
+
+    Requests failing with one of ``statuses`` or with a connection error
+    are retried up to ``max_retries`` times. The delay grows exponentially
+    from ``backoff`` up to ``max_backoff``, with full jitter so clients do
+    not retry in lockstep, and a ``Retry-After`` header from the server
+    takes precedence.
+
+    Only ``methods`` are retried, GET and DELETE by default. ``add_job``
+    is retried too with ``retry_add_job=True``: every submission then
+    carries an ``Idempotency-Key`` header, so a resent request that the
+    server already accepted does not start a second job.
+
+    Retries are paid from a budget shared by everything using the policy.
+    It holds up to ``budget`` retries and every request adds
+    ``budget_ratio`` of a retry, so during an outage retries add at most
+    that fraction of extra load instead of multiplying it.
+
+    :param max_retries: Retries per request.
+    :param backoff: Delay before the first retry, in seconds.
+    :param max_backoff: Upper bound of the exponential delay.
+    :param jitter: Pick the delay uniformly between 0 and the backoff.
+    :param statuses: HTTP statuses worth retrying.
+    :param methods: HTTP methods that are safe to resend.
+    :param retry_add_job: Retry job submissions using idempotency keys.
+    :param max_retry_after: Give up rather than honour a ``Retry-After``
+        longer than this many seconds.
+    :param budget: Maximum number of retries banked in the budget.
+    :param budget_ratio: Retries earned per request.
+    """
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30.0,
+                 jitter=True, statuses=(429, 502, 503, 504),
+                 methods=('GET', 'DELETE'), retry_add_job=False,
+                 max_retry_after=120.0, budget=10, budget_ratio=0.1):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(method.upper() for method in methods)
+        self.retry_add_job = retry_add_job
+        self.max_retry_after = max_retry_after
+        self.budget = float(budget)
+        self.budget_ratio = budget_ratio
+        self._lock = threading.Lock()
+        self._tokens = float(budget)
+        self.retries = 0
+        self.exhausted = 0
+
+    def __repr__(self):
+        return "<RetryPolicy max_retries={0} budget={1:.1f}/{2:g}>".format(
+            self.max_retries, self.tokens, self.budget)
+
+    @property
+    def tokens(self):
+        """Retries currently left in the budget."""
+        return self._tokens
+
+    def record_request(self):
+        """Adds ``budget_ratio`` to the budget; called once per request."""
+        with self._lock:
+            self._tokens = min(self.budget, self._tokens + self.budget_ratio)
+
+    def _withdraw(self):
+        with self._lock:
+            if self._tokens < 1.0:
+                self.exhausted += 1
+                return False
+            self._tokens -= 1.0
+            self.retries += 1
+            return True
+
+    def backoff_for(self, attempt):
+        """Returns the delay before retry number ``attempt`` (0-based)."""
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def is_retryable(self, method, headers=None):
+        """Whether a failed request with ``method`` may be resent.
+
+        Other methods than ``methods``, such as the POST of ``add_job``,
+        are only retried with ``retry_add_job`` and an idempotency key.
+        """
+        if method.upper() in self.methods:
+            return True
+        if not self.retry_add_job:
+            return False
+        return bool(headers) and IDEMPOTENCY_HEADER in headers
+
+    def delay(self, method, attempt, headers=None, status=None,
+              response_headers=None):
+        """Returns seconds to wait before retrying, or ``None`` to give up.
+
+        :param method: HTTP method of the failed request.
+        :param attempt: Number of retries already made.
+        :param headers: Request headers; with ``retry_add_job``, an
+            idempotency key makes any method retryable.
+        :param status: HTTP status of the failure, ``None`` for connection
+            errors.
+        :param response_headers: Response headers, for ``Retry-After``.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if not self.is_retryable(method, headers):
+            return None
+        if status is not None and status not in self.statuses:
+            return None
+        delay = self.backoff_for(attempt)
+        if response_headers is not None:
+            retry_after = parse_retry_after(response_headers.get('Retry-After'))
+            if retry_after is not None:
+                if retry_after > self.max_retry_after:
+                    return None
+                delay = retry_after
+        if not self._withdraw():
+            logger.warning("Retry budget exhausted, not retrying %s", method)
+            return None
+        return delay
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+import bisect
+import collections
+import datetime
+import threading
+
+from dateutil.tz import tzutc
+
+HASH_FIELDS = ('status', 'cluster_id', 'package_id', 'owner_id')
+
+
+def _utc(value):
+    if isinstance(value, datetime.datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=tzutc())
+    return value
+
+
+class _SortedIndex(object):
+    """``(value, id)`` pairs kept sorted with :mod:`bisect`."""
+
+    def __init__(self):
+        self.keys = []
+
+    def add(self, value, id):
+        if value is not None:
+            bisect.insort(self.keys, (value, id))
+
+    def bulk(self, removed, added):
+        """Removes and adds many ``(value, id)`` pairs with a single sort."""
+        removed = set(key for key in removed if key[0] is not None)
+        keys = self.keys
+        if removed:
+            keys = [key for key in keys if key not in removed]
+        keys.extend(key for key in added if key[0] is not None)
+        keys.sort()
+        self.keys = keys
+
+    def remove(self, value, id):
+        if value is None:
+            return
+        keys = self.keys
+        i = bisect.bisect_left(keys, (value, id))
+        if i < len(keys) and keys[i] == (value, id):
+            del keys[i]
+
+    def between(self, start, end):
+        """Yields ids with ``start <= value < end``; ``None`` is unbounded."""
+        keys = self.keys
+        lo = 0 if start is None else bisect.bisect_left(keys, (start,))
+        hi = len(keys) if end is None else bisect.bisect_left(keys, (end,))
+        for i in range(lo, hi):
+            yield keys[i][1]
+
+
+class ModelStore(object):
+    """Indexed in-memory collection of models of one class.
+
+    Keeps a hash index per field in ``hash_fields`` and a sorted index per
+    date field. :meth:`put` and :meth:`remove` update them incrementally;
+    the initial models and :meth:`update` sort each date index once. :meth:`find` answers equality, membership and date
+    range questions from the indexes instead of scanning every model::
+
+        store = ModelStore(Job, client.get_jobs())
+        store.find(status='failed', cluster_id=42)
+        store.find(status=('running', 'pending'),
+                   created_at=(datetime.datetime(2020, 9, 1), None))
+
+    Models are keyed by ``id``. Pass a store's :meth:`apply` to
+    :meth:`SyncEngine.subscribe` to keep it in step with a mirror.
+
+    :param cls: The model class, e.g. :class:`Job`.
+    :param models: Initial models.
+    :param hash_fields: Fields with an equality index. Defaults to those
+        of ``status``, ``cluster_id``, ``package_id`` and ``owner_id`` the
+        model has.
+    :param sorted_fields: Fields with a range index. Defaults to the
+        model's date fields.
+    """
+
+    def __init__(self, cls, models=(), hash_fields=None, sorted_fields=None):
+        fields = set(cls._strs + cls._ints + cls._dates + cls._bools)
+        if hash_fields is None:
+            hash_fields = [f for f in HASH_FIELDS if f in fields]
+        if sorted_fields is None:
+            sorted_fields = list(cls._dates)
+        self.cls = cls
+        self._lock = threading.RLock()
+        self._models = {}
+        self._hash = dict((field, {}) for field in hash_fields)
+        self._sorted = dict((field, _SortedIndex()) for field in sorted_fields)
+        self.update(models)
+
+    def __repr__(self):
+        return '<ModelStore of {0} {1} models>'.format(
+            len(self._models), self.cls.__name__)
+
+    def __len__(self):
+        return len(self._models)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._models.values()))
+
+    def __contains__(self, id):
+        return id in self._models
+
+    @property
+    def indexes(self):
+        """Names of the indexed fields."""
+        return sorted(self._hash) + sorted(self._sorted)
+
+    def get(self, id, default=None):
+        return self._models.get(id, default)
+
+    def _index(self, model):
+        self._index_hash(model)
+        for field, index in self._sorted.items():
+            index.add(getattr(model, field, None), model.id)
+
+    def _index_hash(self, model):
+        id = model.id
+        for field, index in self._hash.items():
+            index.setdefault(getattr(model, field, None), set()).add(id)
+
+    def _unindex(self, model):
+        self._unindex_hash(model)
+        id = model.id
+        for field, index in self._sorted.items():
+            index.remove(getattr(model, field, None), id)
+
+    def _unindex_hash(self, model):
+        id = model.id
+        for field, index in self._hash.items():
+            value = getattr(model, field, None)
+            ids = index.get(value)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del index[value]
+
+    def put(self, model):
+        """Adds a model, replacing the one with the same ``id``."""
+        with self._lock:
+            old = self._models.get(model.id)
+            if old is not None:
+                self._unindex(old)
+            self._models[model.id] = model
+            self._index(model)
+
+    def update(self, models):
+        """Adds many models, replacing those with the same ``id``.
+
+        Unlike a :meth:`put` per model, each sorted index is rebuilt with a
+        single sort, so loading ``n`` models costs ``O(n log n)``.
+        """
+        # the last model with an id wins, as it would with put
+        latest = collections.OrderedDict((model.id, model) for model in models)
+        if not latest:
+            return
+        with self._lock:
+            old = []
+            for id, model in latest.items():
+                previous = self._models.get(id)
+                if previous is not None:
+                    self._unindex_hash(previous)
+                    old.append(previous)
+                self._models[id] = model
+                self._index_hash(model)
+            for field, index in self._sorted.items():
+                index.bulk(
+                    [(getattr(m, field, None), m.id) for m in old],
+                    [(getattr(m, field, None), m.id)
+                     for m in latest.values()])
+
+    def remove(self, id):
+        """Removes and returns the model with ``id``, or ``None``."""
+        with self._lock:
+            model = self._models.pop(id, None)
+            if model is not None:
+                self._unindex(model)
+            return model
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            for index in self._hash.values():
+                index.clear()
+            for index in self._sorted.values():
+                index.keys = []
+
+    def apply(self, delta):
+        """Applies a :class:`SyncDelta` from a :class:`SyncEngine`."""
+        with self._lock:
+            for model in delta.added + delta.changed:
+                if isinstance(model, self.cls):
+                    self.put(model)
+            for model in delta.removed:
+                if isinstance(model, self.cls):
+                    self.remove(model.id)
+
+    def _candidates(self, field, value):
+        if field in self._hash:
+            index = self._hash[field]
+            if isinstance(value, (list, tuple, set, frozenset)):
+                ids = set()
+                for v in value:
+                    ids.update(index.get(v, ()))
+                return ids
+            return set(index.get(value, ()))
+        if field in self._sorted:
+            start, end = value
+            return set(self._sorted[field].between(_utc(start), _utc(end)))
+        return None
+
+    def _matches(self, model, field, value):
+        actual = getattr(model, field, None)
+        if field in self.cls._dates:
+            start, end = _utc(value[0]), _utc(value[1])
+            return (actual is not None
+                    and (start is None or actual >= start)
+                    and (end is None or actual < end))
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return actual in value
+        return actual == value
+
+    def find(self, order_by=None, **criteria):
+        """Returns the models matching every criterion.
+
+        A criterion is ``field=value`` for equality, ``field=(a, b, ...)``
+        or a list/set for membership, and ``date_field=(start, end)`` for
+        ``start <= value < end`` where either bound may be ``None``.
+        Indexed criteria are answered from the indexes, smallest first;
+        others are checked on the remaining candidates only.
+
+        :param order_by: Field to sort by, ``'-field'`` for descending.
+            Defaults to ``id``.
+        """
+        with self._lock:
+            ids = None
+            unindexed = []
+            sized = []
+            for field, value in criteria.items():
+                candidates = self._candidates(field, value)
+                if candidates is None:
+                    unindexed.append((field, value))
+                else:
+                    sized.append(candidates)
+            for candidates in sorted(sized, key=len):
+                ids = candidates if ids is None else ids & candidates
+                if not ids:
+                    return []
+            models = self._models
+            if ids is None:
+                found = list(models.values())
+            else:
+                found = [models[id] for id in ids]
+        for field, value in unindexed:
+            found = [m for m in found if self._matches(m, field, value)]
+        return self._order(found, order_by or 'id')
+
+    def _order(self, models, order_by):
+        reverse = order_by.startswith('-')
+        field = order_by.lstrip('-')
+        # models without a value go last either way
+        present = [m for m in models if getattr(m, field, None) is not None]
+        missing = [m for m in models if getattr(m, field, None) is None]
+        present.sort(key=lambda m: getattr(m, field), reverse=reverse)
+        return present + missing
+
+    def between(self, field, start=None, end=None):
+        """Returns the models with ``start <= field < end``, in that order."""
+        with self._lock:
+            if field in self._sorted:
+                ids = self._sorted[field].between(_utc(start), _utc(end))
+                return [self._models[id] for id in ids]
+        return self.find(order_by=field, **{field: (start, end)})
+
+    def count(self, **criteria):
+        return len(self.find(**criteria))
+
+    def values(self, field):
+        """Returns the distinct values of a hash-indexed field with counts."""
+        with self._lock:
+            return dict((value, len(ids))
+                        for value, ids in self._hash[field].items())
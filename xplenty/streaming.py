@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024
+
+_START, _FIRST, _NEXT, _DONE = range(4)
+_WHITESPACE = ' \t\n\r'
+# what may follow a number or literal once it is complete
+_SCALAR_END = ',]' + _WHITESPACE
+
+
+class JSONArrayParser(object):
+    """Incremental parser for a JSON array, yielding one element at a time.
+
+    Bytes are pushed in with :meth:`feed`, which returns the elements that
+    became complete. Only the current, unfinished element is buffered, so
+    memory stays bounded by the size of the largest element rather than
+    the size of the whole response.
+    """
+
+    def __init__(self, encoding='utf-8'):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder(encoding)()
+        self._buf = ''
+        self._pos = 0
+        self._state = _START
+
+    @property
+    def done(self):
+        return self._state == _DONE
+
+    def feed(self, data, final=False):
+        """Adds ``data`` and returns the list of completed elements.
+
+        :param final: ``True`` once the whole input has been fed.
+        :raises ValueError: on malformed input, or when the input ends
+            before the array does.
+        """
+        buf = self._buf = self._buf[self._pos:] + self._text.decode(data, final)
+        self._pos = 0
+        items = []
+        while self._state != _DONE:
+            pos = _skip_whitespace(buf, self._pos)
+            if pos == len(buf):
+                break
+            char = buf[pos]
+            if self._state == _START:
+                if char != '[':
+                    raise ValueError("Expected a JSON array, got %r" % char)
+                self._pos = pos + 1
+                self._state = _FIRST
+                continue
+            if char == ']':
+                self._pos = pos + 1
+                self._state = _DONE
+                break
+            if self._state == _NEXT:
+                if char != ',':
+                    raise ValueError("Expected ',' or ']', got %r" % char)
+                pos = _skip_whitespace(buf, pos + 1)
+                if pos == len(buf):
+                    break
+            try:
+                item, end = self._decoder.raw_decode(buf, pos)
+            except ValueError:
+                if final:
+                    raise
+                break
+            if (not final and buf[pos] not in '{["'
+                    and (end == len(buf) or buf[end] not in _SCALAR_END)):
+                # a number or literal could continue in the next chunk:
+                # '1.' decodes as 1 before '25' arrives
+                break
+            items.append(item)
+            self._pos = end
+            self._state = _NEXT
+        if final and self._state != _DONE:
+            raise ValueError("Unexpected end of JSON array")
+        return items
+
+
+def _skip_whitespace(buf, pos):
+    while pos < len(buf) and buf[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+def iter_json_array(fp, chunk_size=CHUNK_SIZE):
+    """Yields the elements of a JSON array read from a file-like object."""
+    parser = JSONArrayParser()
+    while not parser.done:
+        data = fp.read(chunk_size)
+        for item in parser.feed(data, final=not data):
+            yield item
+        if not data:
+            break
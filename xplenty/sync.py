@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+import threading
+import time
+
+from .exceptions import XplentyAPIException
+from .retry import CONNECTION_ERRORS
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+
+# the client methods listing each resource and getting one of its records
+RESOURCES = {
+    'jobs': ('get_jobs', 'get_job'),
+    'clusters': ('get_clusters', 'get_cluster'),
+    'schedules': ('get_schedules', 'get_schedule'),
+}
+
+
+class SyncDelta(object):
+    """Changes to one resource found by a sync.
+
+    :ivar resource: ``'jobs'``, ``'clusters'`` or ``'schedules'``.
+    :ivar added: Models that were not in the mirror.
+    :ivar changed: Models whose ``updated_at`` moved on.
+    :ivar removed: Models that disappeared, found by full syncs only.
+    :ivar full: Whether this was a full sync.
+    """
+
+    def __init__(self, resource, full=False):
+        self.resource = resource
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.full = full
+
+    def __repr__(self):
+        return "<SyncDelta {0}: +{1} ~{2} -{3}>".format(
+            self.resource, len(self.added), len(self.changed),
+            len(self.removed))
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    __nonzero__ = __bool__
+
+
+class _Mirror(object):
+
+    def __init__(self):
+        self.items = {}
+        self.watermark = None
+        self.synced_at = None
+        self.full_synced_at = None
+
+
+def _is_newest_first(page):
+    dates = [item.updated_at for item in page if item.updated_at is not None]
+    return all(a >= b for a, b in zip(dates, dates[1:]))
+
+
+class SyncEngine(object):
+    """Keeps a local mirror of jobs, clusters and schedules up to date.
+
+    Listings are requested newest ``updated_at`` first, one page at a
+    time, filtered with ``since`` to the records updated at or after the
+    newest one already mirrored (the watermark). Paging also stops at the
+    first older record, should the API send one. A refresh therefore
+    costs requests in proportion to what changed, not to the size of the
+    account.
+
+    Deleted records never show up in such a listing, so every
+    ``full_sync_interval`` seconds a sync fetches the full listings and
+    reports records missing from them as removed. Subscribers receive a
+    :class:`SyncDelta` for every resource that changed::
+
+        engine = SyncEngine(client)
+        engine.subscribe(lambda delta: print(delta))
+        with engine:                  # syncs every ``interval`` seconds
+            ...
+            running = [job for job in engine.items('jobs')
+                       if job.status == 'running']
+
+    :param client: The :class:`XplentyClient` to sync with.
+    :param resources: Resources to mirror.
+    :param page_size: Records per listing request.
+    :param interval: Seconds between syncs of the background thread.
+    :param full_sync_interval: Seconds between full syncs. ``None`` only
+        runs the initial one.
+    :param max_pages: Most listing requests per resource and sync. A sync
+        stopped by this limit does not count as a full one.
+    """
+
+    def __init__(self, client, resources=('jobs', 'clusters', 'schedules'),
+                 page_size=100, interval=30.0, full_sync_interval=600.0,
+                 max_pages=1000):
+        for resource in resources:
+            if resource not in RESOURCES:
+                raise ValueError("Cannot sync %r" % resource)
+        self.client = client
+        self.resources = tuple(resources)
+        self.page_size = page_size
+        self.interval = interval
+        self.full_sync_interval = full_sync_interval
+        self.max_pages = max_pages
+        self._mirrors = dict((resource, _Mirror()) for resource in resources)
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return '<SyncEngine mirroring {0}>'.format(', '.join(
+            '{0} {1}'.format(len(self._mirrors[resource].items), resource)
+            for resource in self.resources))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def subscribe(self, callback):
+        """Registers ``callback(delta)``, called for every non-empty delta."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def get(self, resource, id):
+        """Returns a mirrored model by ID, or ``None``."""
+        with self._lock:
+            return self._mirrors[resource].items.get(id)
+
+    def items(self, resource):
+        """Returns the mirrored models of a resource."""
+        with self._lock:
+            return list(self._mirrors[resource].items.values())
+
+    def watermark(self, resource):
+        """Returns the newest ``updated_at`` mirrored for a resource."""
+        return self._mirrors[resource].watermark
+
+    def _fetch_page(self, resource, offset, since=None):
+        get_page = getattr(self.client, RESOURCES[resource][0])
+        return get_page(sort='updated', direction='desc', offset=offset,
+                        limit=self.page_size, since=since)
+
+    def _fetch(self, resource, watermark):
+        """Returns the records updated at or after ``watermark``, or all.
+
+        Also returns whether the records are the complete listing.
+        """
+        records = []
+        seen = set()
+        offset = 0
+        for _ in range(self.max_pages):
+            page = self._fetch_page(resource, offset, watermark)
+            if watermark is not None and not _is_newest_first(page):
+                logger.warning("Listing of %s is not sorted by updated_at, "
+                               "falling back to a full sync", resource)
+                return self._fetch(resource, None)
+            new = [record for record in page if record.id not in seen]
+            if page and not new:
+                # the API honours the limit but not the offset, and would
+                # send the same page forever
+                logger.warning("Listing of %s repeats itself, stopping "
+                               "after %d records", resource, len(records))
+                return records, False
+            for record in page:
+                if (watermark is not None and record.updated_at is not None
+                        and record.updated_at < watermark):
+                    return records, False
+                records.append(record)
+                seen.add(record.id)
+            # an empty page is the last one; a longer one than asked for
+            # means the API ignored paging and sent everything
+            if not page or len(page) > self.page_size:
+                return records, watermark is None
+            offset += len(page)
+        logger.warning("Listing of %s is longer than %d pages, stopping",
+                       resource, self.max_pages)
+        return records, False
+
+    def _merge(self, resource, records, full):
+        mirror = self._mirrors[resource]
+        latest = collections.OrderedDict()
+        for record in records:
+            # a record shifted onto the next page while paging shows up
+            # twice; the first copy is the newest
+            latest.setdefault(record.id, record)
+        missing = []
+        if full:
+            with self._lock:
+                missing = [id for id in mirror.items if id not in latest]
+        # a record deleted while paging shifts the next pages by one, so a
+        # missing record only counts as removed once the API confirms it.
+        # This happens before the mirror changes: if it fails, the next
+        # sync finds the same delta again.
+        confirmed = list(self._confirm_missing(resource, missing))
+
+        delta = SyncDelta(resource, full)
+        with self._lock:
+            items = mirror.items
+            for record in latest.values():
+                old = items.get(record.id)
+                if old is None:
+                    delta.added.append(record)
+                elif old.updated_at != record.updated_at:
+                    delta.changed.append(record)
+                else:
+                    continue
+                items[record.id] = record
+                if record.updated_at is not None and (
+                        mirror.watermark is None
+                        or record.updated_at > mirror.watermark):
+                    mirror.watermark = record.updated_at
+            for id, record in confirmed:
+                if record is None:
+                    delta.removed.append(items.pop(id))
+                elif items[id].updated_at != record.updated_at:
+                    items[id] = record
+                    delta.changed.append(record)
+            now = time.monotonic()
+            mirror.synced_at = now
+            if full:
+                mirror.full_synced_at = now
+        return delta
+
+    def _confirm_missing(self, resource, ids):
+        get_record = getattr(self.client, RESOURCES[resource][1])
+        for id in ids:
+            try:
+                yield id, get_record(id)
+            except XplentyAPIException as error:
+                if getattr(error.http_error, 'code', None) != 404:
+                    raise
+                yield id, None
+
+    def _needs_full_sync(self, mirror):
+        if mirror.full_synced_at is None:
+            return True
+        return (self.full_sync_interval is not None and
+                time.monotonic() - mirror.full_synced_at
+                >= self.full_sync_interval)
+
+    def sync(self, full=False):
+        """Syncs every resource once and returns the list of deltas.
+
+        :param full: Fetch full listings and detect removed records even
+            if ``full_sync_interval`` has not passed.
+        """
+        deltas = []
+        with self._sync_lock:
+            for resource in self.resources:
+                mirror = self._mirrors[resource]
+                full_sync = full or self._needs_full_sync(mirror)
+                watermark = None if full_sync else mirror.watermark
+                records, was_full = self._fetch(resource, watermark)
+                delta = self._merge(resource, records, was_full)
+                deltas.append(delta)
+                if delta:
+                    self._publish(delta)
+        return deltas
+
+    def _publish(self, delta):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(delta)
+            except Exception:
+                logger.exception("Sync subscriber %r failed", callback)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except (XplentyAPIException,) + CONNECTION_ERRORS as error:
+                logger.warning("Sync failed: %s", error)
+            except Exception:
+                # keep syncing; what failed is fetched again by the next sync
+                logger.exception("Sync failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Starts syncing in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="xplenty-sync")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+import collections
+import http.client
+import io
+import logging
+import threading
+import time
+import zlib
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+from .retry import IDEMPOTENCY_HEADER
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+
+# Errors raised when a kept-alive connection was closed by the server
+# while it sat idle in the pool. The server may still have read the
+# request, so only requests that are safe to repeat are resent once.
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'DELETE'])
+
+
+def can_resend(method, headers=None):
+    """Whether a request that may have reached the server can be sent again.
+
+    True for idempotent methods, and for requests carrying an
+    ``Idempotency-Key`` that lets the server drop the duplicate.
+    """
+    if method.upper() in IDEMPOTENT_METHODS:
+        return True
+    return bool(headers) and IDEMPOTENCY_HEADER in headers
+
+
+class ContentDecoder(object):
+    """Incremental decompressor for a ``gzip`` or ``deflate`` response body.
+
+    ``deflate`` is tried as a zlib stream first and, like browsers do,
+    falls back to a raw deflate stream if the server sent one.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._obj = zlib.decompressobj()
+        self._first = encoding == 'deflate'
+
+    def decompress(self, data):
+        if not data:
+            return data
+        if self._first:
+            self._first = False
+            try:
+                return self._obj.decompress(data)
+            except zlib.error:
+                self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._obj.decompress(data)
+
+    def flush(self):
+        return self._obj.flush()
+
+
+def get_content_decoder(headers):
+    """Returns a :class:`ContentDecoder` for the response, or ``None``."""
+    encoding = (headers.get('Content-Encoding') or '').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return ContentDecoder('gzip')
+    if encoding == 'deflate':
+        return ContentDecoder('deflate')
+    return None
+
+
+class PooledResponse(object):
+    """A response whose connection goes back to the pool once the body is read.
+
+    The body can be read at once with :meth:`read` or consumed in pieces
+    with ``read(amt)``. Closing the response before the body is exhausted
+    discards the connection instead of returning it to the pool.
+
+    ``gzip`` and ``deflate`` bodies are decompressed transparently and
+    incrementally; ``read(amt)`` then returns whatever ``amt`` compressed
+    bytes inflate to.
+    """
+
+    def __init__(self, pool, key, conn, response):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.msg
+        self._decoder = get_content_decoder(response.msg)
+        # seconds spent waiting for a pool slot, connecting, waiting for
+        # the response headers and reading the body; set by the pool
+        self.queue_time = 0.0
+        self.connect_time = 0.0
+        self.wait_time = 0.0
+        self.read_time = 0.0
+        self.bytes_read = 0
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def read(self, amt=None):
+        decoder = self._decoder
+        if decoder is None:
+            return self._read_raw(amt)
+        if amt is None:
+            return decoder.decompress(self._read_raw()) + decoder.flush()
+        while True:
+            data = self._read_raw(amt)
+            if not data:
+                return decoder.flush()
+            data = decoder.decompress(data)
+            if data:
+                return data
+
+    def _read_raw(self, amt=None):
+        if self._conn is None:
+            return b""
+        start = time.perf_counter()
+        try:
+            data = self._response.read(amt)
+        except Exception:
+            self.close()
+            raise
+        self.read_time += time.perf_counter() - start
+        self.bytes_read += len(data)
+        if amt is None or not data or self._response.isclosed():
+            self.release_conn()
+        return data
+
+    def release_conn(self):
+        """Returns the connection to the pool, or closes it if not reusable."""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._put_conn(self._key, conn)
+        else:
+            self._pool._discard_conn(self._key, conn)
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._response.close()
+        self._pool._discard_conn(self._key, conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of persistent HTTP(S) connections.
+
+    Connections are kept per (scheme, host, port) and reused across
+    requests, so consecutive API calls skip the TCP and TLS handshakes.
+
+    :param maxsize: Maximum number of connections per host. Callers block
+        when all of them are in use.
+    :param idle_timeout: Seconds an idle connection is kept before it is
+        closed instead of reused.
+    :param timeout: Socket timeout in seconds for new connections.
+    """
+
+    def __init__(self, maxsize=10, idle_timeout=60.0, timeout=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = collections.defaultdict(collections.deque)
+        self._slots = collections.defaultdict(
+            lambda: threading.BoundedSemaphore(self.maxsize))
+
+    def __repr__(self):
+        return '<Xplenty connection pool at 0x%x>' % (id(self))
+
+    def _new_conn(self, key):
+        scheme, host, port = key
+        logger.debug("Opening connection to %s://%s:%s", scheme, host, port)
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _get_conn(self, key):
+        """Returns an idle connection for ``key`` and whether it was reused."""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle[key]
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used <= self.idle_timeout:
+                    return conn, True
+                conn.close()
+        return self._new_conn(key), False
+
+    def _put_conn(self, key, conn):
+        with self._lock:
+            self._idle[key].append((conn, time.monotonic()))
+        self._slots[key].release()
+
+    def _discard_conn(self, key, conn):
+        conn.close()
+        self._slots[key].release()
+
+    def urlopen(self, method, url, body=None, headers=None):
+        """Sends a request and returns a :class:`PooledResponse`.
+
+        The connection stays checked out until the response body has been
+        read or the response is closed.
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        with self._lock:
+            slots = self._slots[key]
+        start = time.perf_counter()
+        slots.acquire()
+        queued = time.perf_counter()
+        conn = None
+        try:
+            conn, reused = self._get_conn(key)
+            if conn.sock is None:
+                conn.connect()
+            connected = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                if not reused or not can_resend(method, headers):
+                    raise
+                conn.close()
+                conn = self._new_conn(key)
+                conn.connect()
+                connected = time.perf_counter()
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+        except Exception:
+            if conn is not None:
+                conn.close()
+            slots.release()
+            raise
+
+        pooled = PooledResponse(self, key, conn, response)
+        pooled.queue_time = queued - start
+        pooled.connect_time = connected - queued
+        pooled.wait_time = time.perf_counter() - connected
+        return pooled
+
+    def clear(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, collections.defaultdict(
+                collections.deque)
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+
+def raise_for_status(url, response):
+    """Raises :class:`HTTPError` for 4xx/5xx responses, like ``urlopen`` did."""
+    if response.status < 400:
+        return
+    body = response.read()
+    raise HTTPError(url, response.status, response.reason,
+                    response.headers, io.BytesIO(body))
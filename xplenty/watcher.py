@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from concurrent.futures import Future, wait
+
+from .exceptions import XplentyAPIException
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
+
+
+TERMINAL_STATUSES = frozenset(['completed', 'failed', 'stopped'])
+
+
+class JobWatcher(object):
+    """Waits for many jobs at once using the shared ``get_jobs`` listing.
+
+    Instead of one polling loop per job, every refresh issues a single
+    ``get_jobs`` call and resolves all watched jobs that reached a terminal
+    status. After the first refresh, the listing is filtered with ``since``
+    to the jobs updated at or after the newest ``updated_at`` seen so far,
+    so a watched job missing from it has not changed. Only jobs that were
+    never seen since they were watched are looked up individually with
+    ``get_jobs_by_id``, so the number of requests per refresh stays flat
+    as the number of watched jobs grows.
+
+    ::
+
+        with JobWatcher(client, interval=10) as watcher:
+            futures = [watcher.watch(job.id) for job in jobs]
+            for future in futures:
+                print(future.result().status)
+
+    :param client: The :class:`XplentyClient` to poll with.
+    :param interval: Seconds between refreshes of the background thread.
+    :param terminal_statuses: Job statuses that end the watch.
+    :param fetch_missing: Look up newly watched jobs absent from the
+        listing. Without it, refreshes list all jobs while any watched job
+        has not been seen yet.
+    """
+
+    def __init__(self, client, interval=10.0,
+                 terminal_statuses=TERMINAL_STATUSES, fetch_missing=True):
+        self.client = client
+        self.interval = interval
+        self.terminal_statuses = frozenset(terminal_statuses)
+        self.fetch_missing = fetch_missing
+        self._watched = {}
+        # watched jobs found in a listing or looked up since being watched
+        self._seen = set()
+        self._since = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return '<JobWatcher watching {0} jobs>'.format(len(self._watched))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def watch(self, job_id, callback=None):
+        """Starts watching a job.
+
+        :param job_id: ID of the job to watch.
+        :param callback: Optional ``callback(job)`` fired on a terminal status.
+        :return: A :class:`concurrent.futures.Future` resolving to the
+            final :class:`Job`.
+        """
+        job_id = int(job_id)
+        with self._lock:
+            future = self._watched.get(job_id)
+            if future is None:
+                future = self._watched[job_id] = Future()
+        if callback is not None:
+            def done(f):
+                if not f.cancelled() and f.exception() is None:
+                    callback(f.result())
+            future.add_done_callback(done)
+        return future
+
+    def unwatch(self, job_id):
+        """Stops watching a job and cancels its future."""
+        with self._lock:
+            future = self._watched.pop(int(job_id), None)
+            self._seen.discard(int(job_id))
+        if future is not None:
+            future.cancel()
+
+    @property
+    def pending(self):
+        """IDs of the jobs that have not reached a terminal status yet."""
+        with self._lock:
+            return list(self._watched.keys())
+
+    def _resolve(self, job):
+        with self._lock:
+            future = self._watched.pop(job.id, None)
+            self._seen.discard(job.id)
+        if future is not None and future.set_running_or_notify_cancel():
+            future.set_result(job)
+
+    def _saw(self, job):
+        if (job.status or '').lower() in self.terminal_statuses:
+            self._resolve(job)
+            return
+        with self._lock:
+            if job.id in self._watched:
+                self._seen.add(job.id)
+
+    def poll(self):
+        """Refreshes all watched jobs once. Returns the number still pending."""
+        with self._lock:
+            if not self._watched:
+                return 0
+            pending = set(self._watched)
+            unseen = pending - self._seen
+            since = self._since
+        if unseen and not self.fetch_missing:
+            # a new job older than the watermark would never be listed
+            since = None
+
+        newest = self._since
+        for job in self.client.get_jobs(since=since):
+            if job.updated_at is not None and (
+                    newest is None or job.updated_at > newest):
+                newest = job.updated_at
+            if job.id in pending:
+                pending.discard(job.id)
+                unseen.discard(job.id)
+                self._saw(job)
+        self._since = newest
+
+        if self.fetch_missing and unseen:
+            for job_id, job in self.client.get_jobs_by_id(unseen).items():
+                if isinstance(job, Exception):
+                    logger.warning("Could not refresh job %s: %s", job_id, job)
+                else:
+                    self._saw(job)
+
+        with self._lock:
+            return len(self._watched)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except (XplentyAPIException, OSError) as error:
+                logger.warning("Job watcher refresh failed: %s", error)
+            except Exception:
+                # keep polling: pending futures would otherwise never resolve
+                logger.exception("Job watcher refresh failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Starts refreshing in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="xplenty-job-watcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread. Watched futures stay pending."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, timeout=None):
+        """Blocks until every watched job is done or ``timeout`` expires."""
+        with self._lock:
+            futures = list(self._watched.values())
+        return wait(futures, timeout=timeout)
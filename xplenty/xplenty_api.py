@@ -1,19 +1,28 @@
 # -*- coding: utf-8 -*-
 import base64
+import collections
+import datetime
+import functools
+import gzip
 import json
 import logging
-try:
-    from urllib.parse import urlencode, urljoin
-    from urllib.request import urlopen, Request
-    from urllib.error import HTTPError
-except ImportError:
-    from urllib.parse import urlencode
-    from urllib.request import urlopen, Request
-    from urllib.error import HTTPError
-    from urllib.parse import urljoin
-from dateutil.parser import parse as parse_datetime
-
+import time
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urljoin
+
+from .coalesce import SingleFlight
+from .columnar import Columns
+from .decoders import (
+    MISSING, compile_decoder, field_converters, format_iso8601,
+    parse_datetime
+)
 from .exceptions import XplentyAPIException
+from .instrumentation import (
+    RequestEvent, call_hooks, current_event, finish_event, instrumented
+)
+from .retry import CONNECTION_ERRORS, IDEMPOTENCY_HEADER
+from .streaming import CHUNK_SIZE, iter_json_array
+from .transport import ConnectionPool, raise_for_status
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
@@ -23,7 +32,8 @@ logger.addHandler(logging.NullHandler())  # avoid "No handler found" warnings
 API_URL = "https://api.xplenty.com/%s/api/"
 
 HEADERS = {
-    'Accept': 'application/vnd.xplenty+json version=2'
+    'Accept': 'application/vnd.xplenty+json version=2',
+    'Accept-Encoding': 'gzip, deflate'
 }
 
 
@@ -96,8 +106,8 @@ def to_python(obj,
             if in_dict.get(k):
                 d[k] = v.new_from_dict(in_dict.get(k))
 
-    obj.__dict__.update(d)
-    obj.__dict__.update(kwargs)
+    for (k, v) in list(d.items()) + list(kwargs.items()):
+        setattr(obj, k, v)
 
     # Save the dictionary, for write comparisons.
     # obj._cache = d
@@ -106,7 +116,37 @@ def to_python(obj,
     return obj
 
 
-class BaseModel(object):
+class ModelMeta(type):
+    """Gives every model ``__slots__`` built from its field declarations.
+
+    Each declared field, plus the ``_h`` client back-reference, is stored
+    in a fixed slot. :class:`BaseModel` also keeps a ``__dict__`` slot, so
+    extra attributes (``new_from_dict`` keyword arguments, attributes set
+    by user code or subclasses) still work; the dict is only allocated
+    for objects that get one.
+    """
+
+    FIELD_LISTS = ('_strs', '_ints', '_dates', '_bools', '_dicts', '_floats')
+
+    def __new__(mcs, name, bases, namespace):
+        if '__slots__' not in namespace:
+            inherited = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    inherited.update(getattr(klass, '__slots__', ()))
+            fields = []
+            for field_list in mcs.FIELD_LISTS:
+                fields.extend(namespace.get(field_list, []))
+            fields.extend(namespace.get('_map', {}).keys())
+            namespace['__slots__'] = tuple(
+                field for field in collections.OrderedDict.fromkeys(fields)
+                if field not in inherited)
+        return super(ModelMeta, mcs).__new__(mcs, name, bases, namespace)
+
+
+class BaseModel(object, metaclass=ModelMeta):
+
+    __slots__ = ('_h', '_raw', '__dict__')
 
     _strs = []
     _ints = []
@@ -125,6 +165,28 @@ class BaseModel(object):
     def __repr__(self):
         return "<resource '{0}'>".format(self._id)
 
+    def __getattr__(self, name):
+        # Only reached for unset slots: fields that were left undecoded are
+        # converted from the raw response on first access and kept.
+        try:
+            raw = object.__getattribute__(self, '_raw')
+        except AttributeError:
+            raw = None
+        convert = self._converters().get(name) if raw is not None else None
+        value = convert(raw) if convert is not None else MISSING
+        if value is MISSING:
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(
+                type(self).__name__, name))
+        setattr(self, name, value)
+        return value
+
+    @classmethod
+    def _converters(cls):
+        converters = cls.__dict__.get('_field_converters')
+        if converters is None:
+            converters = cls._field_converters = field_converters(cls)
+        return converters
+
     def _bootstrap(self):
         """Bootstraps the model object based on configured values."""
 
@@ -156,30 +218,31 @@ class BaseModel(object):
 
     def dict(self):
         d = dict()
-        for k in list(self.keys()):
-            d[k] = self.__dict__.get(k)
+        for k in self._keys() + self._floats + self._dicts:
+            d[k] = getattr(self, k, None)
 
         return d
 
     @classmethod
-    def new_from_dict(cls, d, h=None, **kwargs):
-
-        d = to_python(
-            obj=cls(),
-            in_dict=d,
-            str_keys=cls._strs,
-            int_keys=cls._ints,
-            float_keys=cls._floats,
-            date_keys=cls._dates,
-            bool_keys=cls._bools,
-            dict_keys=cls._dicts,
-            object_map=cls._map,
-            _h=h
-        )
-
-        d.__dict__.update(kwargs)
-
-        return d
+    def new_from_dict(cls, d, h=None, lazy_dates=False, lazy=False, **kwargs):
+        """Decodes an API response dict into a model.
+
+        :param h: The client the model was fetched with.
+        :param lazy_dates: Keep date fields as raw strings until they are
+            first accessed.
+        :param lazy: Keep the raw dict and convert every field the first
+            time it is accessed.
+        """
+        decoders = cls.__dict__.get('_decoders')
+        if decoders is None:
+            decoders = cls._decoders = {}
+        mode = (lazy_dates, lazy)
+        decode = decoders.get(mode)
+        if decode is None:
+            decode = decoders[mode] = compile_decoder(
+                cls, skip_init=cls.__init__ is BaseModel.__init__,
+                lazy_dates=lazy_dates, lazy=lazy)
+        return decode(d, h, kwargs)
 
 
 class Cluster(BaseModel):
@@ -250,103 +313,371 @@ class Schedule(BaseModel):
         return "<Schedule '{0}'>".format(self.name)
 
 
-class RequestWithMethod(Request):
-    """Workaround for using DELETE with urllib2"""
+# models of the resources the API lists
+LIST_MODELS = {
+    'jobs': Job,
+    'clusters': Cluster,
+    'packages': Package,
+    'schedules': Schedule,
+}
+
+# listings the API pages, returning ``limit`` (by default 20) records from
+# ``offset`` instead of the whole list
+PAGED_LISTINGS = frozenset(['clusters', 'packages'])
+
+
+def _request_with_method():
+    # urllib.request is slow to import and the client no longer sends
+    # requests through it, so the class is only built when asked for
+    from urllib.request import Request
+
+    class RequestWithMethod(Request):
+        """Workaround for using DELETE with urllib2"""
+
+        def __init__(self, url, method, data=None, headers={},
+                     origin_req_host=None, unverifiable=False):
+            self._method = method
+            Request.__init__(self, url, data, headers,
+                             origin_req_host, unverifiable)
+
+        def get_method(self):
+            if self._method:
+                return self._method
+            else:
+                return Request.get_method(self)
 
-    def __init__(self, url, method, data=None, headers={},
-                 origin_req_host=None, unverifiable=False):
-        self._method = method
-        Request.__init__(self, url, data, headers,
-                         origin_req_host, unverifiable)
+    return RequestWithMethod
 
-    def get_method(self):
-        if self._method:
-            return self._method
-        else:
-            return Request.get_method(self)
+
+def __getattr__(name):
+    if name == 'RequestWithMethod':
+        cls = globals()[name] = _request_with_method()
+        return cls
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+class BulkResult(collections.OrderedDict):
+    """Per-ID outcome of a bulk call, in the order the IDs were given.
+
+    Each value is either the result for that ID or the exception raised
+    for it: an :class:`XplentyAPIException`, a network error, a response
+    that could not be decoded, and so on.
+    """
+
+    @property
+    def succeeded(self):
+        return collections.OrderedDict(
+            (k, v) for k, v in self.items() if not isinstance(v, Exception))
+
+    @property
+    def failed(self):
+        return collections.OrderedDict(
+            (k, v) for k, v in self.items() if isinstance(v, Exception))
 
 
 class XplentyClient(object):
     version = "3.0.0"
 
-    def __init__(self, account_id="", api_key=""):
+    def __init__(self, account_id="", api_key="", pool=None,
+                 pool_maxsize=10, pool_idle_timeout=60.0, timeout=None,
+                 rate_limiter=None, cache=None, lazy_dates=False,
+                 lazy=False, compress_requests=False,
+                 compress_min_size=1024, api_url=None, hooks=None,
+                 retry=None, coalesce=False):
+        """
+        :param pool: A :class:`ConnectionPool` to share between clients.
+            When omitted, the client creates its own.
+        :param pool_maxsize: Maximum number of kept-alive connections.
+        :param pool_idle_timeout: Seconds before an idle connection is dropped.
+        :param timeout: Socket timeout in seconds.
+        :param rate_limiter: Optional :class:`RateLimiter` that every request
+            takes a token from.
+        :param cache: Optional :class:`ResponseCache` for GET responses.
+        :param lazy_dates: Parse date fields of returned models only when
+            they are first accessed.
+        :param lazy: Return models that convert each field from the raw
+            response on first access.
+        :param compress_requests: Gzip request bodies of at least
+            ``compress_min_size`` bytes, e.g. large ``add_job`` variables.
+        :param api_url: API base URL with a ``%s`` placeholder for the
+            account id. Defaults to :data:`API_URL`.
+        :param hooks: Request hooks, e.g. a :class:`MetricsCollector`; see
+            :class:`~xplenty.instrumentation.RequestHooks`.
+        :param retry: Optional :class:`RetryPolicy` for transient errors.
+        :param coalesce: Share one request between threads asking for the
+            same URL at the same time; see :class:`SingleFlight`.
+        """
         self.account_id = account_id
         self.api_key = api_key
+        if pool is None:
+            pool = ConnectionPool(maxsize=pool_maxsize,
+                                  idle_timeout=pool_idle_timeout,
+                                  timeout=timeout)
+        self.pool = pool
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.lazy_dates = lazy_dates
+        self.lazy = lazy
+        self.compress_requests = compress_requests
+        self.compress_min_size = compress_min_size
+        self.api_url = api_url
+        self.hooks = list(hooks or ())
+        self.retry = retry
+        self._flights = SingleFlight() if coalesce else None
 
     def __repr__(self):
         return '<Xplenty client at 0x%x>' % (id(self))
 
-    def get(self, url):
-        logger.debug("GET %s", url)
-        request = Request(url, headers=HEADERS)
+    def _send(self, method, url, data=None, headers=None, event=None):
+        """Sends a request and returns the response with its body unread."""
+        if event is not None:
+            event.request(method, url, data)
+            call_hooks(self.hooks, 'before_request', event)
+        req_headers = dict(HEADERS)
         base64string = to_base64(self.api_key).replace('\n', '')
-        request.add_header("Authorization", f"Basic {base64string}")
-
+        req_headers["Authorization"] = f"Basic {base64string}"
+        if headers:
+            req_headers.update(headers)
+
+        retry = self.retry
+        if retry is not None:
+            retry.record_request()
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(method, url, data, req_headers, event)
+            except HTTPError as error:
+                delay = retry and retry.delay(method, attempt, headers,
+                                              error.code, error.headers)
+                if delay is None:
+                    raise XplentyAPIException(error)
+                reason = error.code
+            except CONNECTION_ERRORS as error:
+                delay = retry and retry.delay(method, attempt, headers)
+                if delay is None:
+                    raise
+                reason = error
+            attempt += 1
+            if event is not None:
+                event.retries = attempt
+            logger.info("Retrying %s %s in %.2fs (attempt %d): %s",
+                        method, url, delay, attempt, reason)
+            time.sleep(delay)
+
+    def _attempt(self, method, url, data, headers, event):
+        limiter = self.rate_limiter
+        if limiter is not None:
+            if limiter.start_calibration():
+                self.calibrate_rate_limiter()
+            start = time.perf_counter()
+            limiter.acquire()
+            if event is not None:
+                event.throttle += time.perf_counter() - start
+
+        resp = self.pool.urlopen(method, url, body=data, headers=headers)
+        if event is not None:
+            event.response(resp)
+        if limiter is not None:
+            limiter.update_from_headers(resp.headers)
         try:
-            resp = urlopen(request)
+            raise_for_status(url, resp)
         except HTTPError as error:
-            raise XplentyAPIException(error)
+            if limiter is not None and error.code == 429:
+                limiter.drain()
+            raise
+        return resp
 
-        return json.loads(resp.read())
+    def _decode(self, resp, event=None):
+        body = resp.read()
+        if event is None:
+            return json.loads(body)
+        start = time.perf_counter()
+        value = json.loads(body)
+        event.decoded(start)
+        return value
+
+    def _request(self, method, url, data=None, headers=None):
+        event = current_event()
+        resp = self._send(method, url, data, headers, event)
+        return self._decode(resp, event)
+
+    def calibrate_rate_limiter(self):
+        """Seeds the rate limiter from the account's ``rate_limit_status``."""
+        try:
+            limits = self.get_account_limits()
+        except (XplentyAPIException, OSError) as error:
+            logger.warning("Could not calibrate rate limiter: %s", error)
+            return
+        self.rate_limiter.calibrate(limits.limit, limits.remaining)
 
-    def post(self, url, data_dict={}):
+    @instrumented
+    def get(self, url):
+        logger.debug("GET %s", url)
+        flights = self._flights
+        if flights is None:
+            return self._get(url)
+        value, shared = flights.do(url, self._get, url)
+        if shared:
+            self._coalesced('GET', url)
+        return value
+
+    def _coalesced(self, method, url):
+        event = current_event()
+        if event is not None:
+            event.request(method, url)
+            event.coalesced = True
+            event.decoded()
+
+    def _get(self, url):
+        cache = self.cache
+        if cache is None:
+            return self._request('GET', url)
+
+        event = current_event()
+        entry = cache.lookup(url)
+        if entry is not None and entry.fresh:
+            if event is not None:
+                event.request('GET', url)
+                event.cached = True
+                event.decoded()
+            return entry.value
+        resp = self._send('GET', url,
+                          headers=entry.validators() if entry else None,
+                          event=event)
+        if resp.status == 304 and entry is not None:
+            resp.read()
+            cache.revalidated(url, entry, resp.headers)
+            if event is not None:
+                event.cached = True
+                event.decoded()
+            return entry.value
+        value = self._decode(resp, event)
+        cache.store(url, value, resp.headers)
+        return value
+
+    def _encode_body(self, data_dict):
         json_data = json.dumps(data_dict).encode('utf-8')
-        logger.debug("POST %s, data %s", url, json_data)
-
-        request = Request(url, data=json_data, headers=HEADERS)
-        base64string = to_base64(self.api_key).replace('\n', '')
-        request.add_header("Authorization", f"Basic {base64string}")
-        request.add_header("Content-Type", "application/json")
-
+        headers = {"Content-Type": "application/json"}
+        if self.compress_requests and len(json_data) >= self.compress_min_size:
+            json_data = gzip.compress(json_data)
+            headers["Content-Encoding"] = "gzip"
+        return json_data, headers
+
+    @instrumented
+    def post(self, url, data_dict={}, headers=None):
+        logger.debug("POST %s, data %s", url, data_dict)
+        json_data, body_headers = self._encode_body(data_dict)
+        if headers:
+            body_headers.update(headers)
+        headers = body_headers
         try:
-            resp = urlopen(request)
-        except HTTPError as error:
-            raise XplentyAPIException(error)
-
-        return json.loads(resp.read())
+            return self._request('POST', url, json_data, headers)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(url)
 
+    @instrumented
     def delete(self, url):
         logger.debug("DELETE %s", url)
-        request = RequestWithMethod(url, 'DELETE', headers=HEADERS)
-        base64string = to_base64(self.api_key).replace('\n', '')
-        request.add_header("Authorization", f"Basic {base64string}")
-
         try:
-            resp = urlopen(request)
-        except HTTPError as error:
-            raise XplentyAPIException(error)
-
-        return json.loads(resp.read())
+            return self._request('DELETE', url)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(url)
+
+    def stream(self, url, chunk_size=CHUNK_SIZE):
+        """Yields the elements of a JSON array response as they arrive.
+
+        The body is decoded incrementally from the socket, so only one
+        element is held in memory at a time. Responses are never cached.
+        """
+        logger.debug("GET %s (streaming)", url)
+        event = RequestEvent('stream') if self.hooks else None
+        try:
+            resp = self._send('GET', url, event=event)
+            try:
+                for item in iter_json_array(resp, chunk_size):
+                    yield item
+                resp.read()  # trailing whitespace; frees the connection
+            finally:
+                resp.close()
+        except Exception as error:
+            finish_event(self.hooks, event, error)
+            raise
+        except GeneratorExit:
+            finish_event(self.hooks, event)
+            raise
+        finish_event(self.hooks, event)
+
+    def _idempotency_headers(self, key):
+        if key is None and self.retry is not None and self.retry.retry_add_job:
+            import uuid
+            key = str(uuid.uuid4())
+        return {IDEMPOTENCY_HEADER: key} if key else None
+
+    def _model(self, cls, item):
+        return cls.new_from_dict(item, h=self, lazy_dates=self.lazy_dates,
+                                 lazy=self.lazy)
+
+    def _list_path(self, resource, **params):
+        """Returns ``resource`` with the given list parameters as its query.
+
+        ``None`` values are left out and datetimes are sent as ISO-8601.
+        """
+        query = []
+        for name, value in sorted(params.items()):
+            if value is None:
+                continue
+            if isinstance(value, datetime.datetime):
+                value = format_iso8601(value)
+            query.append((name, value))
+        if not query:
+            return resource
+        return '%s?%s' % (resource, urlencode(query))
 
     def _join_url(self, method):
-        _url = API_URL % (self.account_id)
+        _url = (self.api_url or API_URL) % (self.account_id)
         url = urljoin(_url, method)
         return url
 
-    def get_clusters(self, offset=0, limit=20):
-        method_path = 'clusters?offset=%d&limit=%d' % (offset, limit)
+    @instrumented
+    def get_clusters(self, offset=0, limit=20, status=None, since=None,
+                     until=None, sort=None, direction=None):
+        """
+        :param status: Only clusters with this status, e.g. ``'available'``.
+        :param since: Only clusters updated at or after this datetime.
+        :param until: Only clusters updated before this datetime.
+        :param sort: Field to sort by, e.g. ``'created'`` or ``'updated'``.
+        :param direction: ``'asc'`` or ``'desc'``.
+        """
+        method_path = self._list_path(
+            'clusters', offset=offset, limit=limit, status=status,
+            since=since, until=until, sort=sort, direction=direction)
         url = self._join_url(method_path)
         resp = self.get(url)
-        clusters = [Cluster.new_from_dict(item, h=self) for item in resp]
+        clusters = [self._model(Cluster, item) for item in resp]
 
         return clusters
 
+    @instrumented
     def get_cluster(self, id):
         method_path = 'clusters/%s' % (str(id))
         url = self._join_url(method_path)
         resp = self.get(url)
-        cluster = Cluster.new_from_dict(resp, h=self)
+        cluster = self._model(Cluster, resp)
 
         return cluster
 
+    @instrumented
     def terminate_cluster(self, id):
         method_path = 'clusters/%s' % (str(id))
         url = self._join_url(method_path)
         resp = self.delete(url)
-        cluster = Cluster.new_from_dict(resp, h=self)
+        cluster = self._model(Cluster, resp)
 
         return cluster
 
+    @instrumented
     def create_cluster(self, cluster_type, nodes, cluster_name, cluster_description, terminate_on_idle=False, time_to_idle=3600):
         cluster_info = {}
         cluster_info["type"] = cluster_type
@@ -358,27 +689,52 @@ class XplentyClient(object):
         method_path = 'clusters'
         url = self._join_url(method_path)
         resp = self.post(url, cluster_info)
-        cluster = Cluster.new_from_dict(resp, h=self)
+        cluster = self._model(Cluster, resp)
 
         return cluster
 
-    def get_jobs(self):
-        method_path = 'jobs'
+    @instrumented
+    def get_jobs(self, status=None, cluster_id=None, since=None, until=None,
+                 sort=None, direction=None, offset=None, limit=None):
+        """
+        Filters are sent to the API, so only matching jobs are transferred.
+
+        :param status: Only jobs with this status, e.g. ``'running'``.
+        :param cluster_id: Only jobs running on this cluster.
+        :param since: Only jobs updated at or after this datetime.
+        :param until: Only jobs updated before this datetime.
+        :param sort: Field to sort by, e.g. ``'created'`` or ``'updated'``.
+        :param direction: ``'asc'`` or ``'desc'``.
+        :param offset: Number of jobs to skip.
+        :param limit: Maximum number of jobs to return.
+        """
+        method_path = self._list_path(
+            'jobs', status=status, cluster_id=cluster_id, since=since,
+            until=until, sort=sort, direction=direction, offset=offset,
+            limit=limit)
         url = self._join_url(method_path)
         resp = self.get(url)
 
-        jobs = [Job.new_from_dict(item, h=self) for item in resp]
+        jobs = [self._model(Job, item) for item in resp]
 
         return jobs
 
+    def stream_jobs(self, **filters):
+        """Like :meth:`get_jobs`, but yields jobs while the response is read."""
+        path = self._list_path('jobs', **filters)
+        for item in self.stream(self._join_url(path)):
+            yield self._model(Job, item)
+
+    @instrumented
     def get_job(self, id):
         method_path = 'jobs/%s' % (str(id))
         url = self._join_url(method_path)
         resp = self.get(url)
-        job = Job.new_from_dict(resp, h=self)
+        job = self._model(Job, resp)
 
         return job
 
+    @instrumented
     def stop_job(self, id):
         method_path = 'jobs/%s' % (str(id))
         url = self._join_url(method_path)
@@ -386,7 +742,14 @@ class XplentyClient(object):
 
         return resp
 
-    def add_job(self, cluster_id, package_id, vars={}, dynamic_vars={}):
+    @instrumented
+    def add_job(self, cluster_id, package_id, vars={}, dynamic_vars={},
+                idempotency_key=None):
+        """
+        :param idempotency_key: Sent as ``Idempotency-Key`` so the request
+            can be retried safely. Generated when the client's retry policy
+            has ``retry_add_job`` set.
+        """
         job_info = {}
         job_info["cluster_id"] = cluster_id
         job_info["package_id"] = package_id
@@ -395,48 +758,176 @@ class XplentyClient(object):
 
         method_path = 'jobs'
         url = self._join_url(method_path)
-        resp = self.post(url, job_info)
-        job = Job.new_from_dict(resp, h=self)
+        resp = self.post(url, job_info, self._idempotency_headers(idempotency_key))
+        job = self._model(Job, resp)
 
         return job
 
+    @instrumented
     def get_account_limits(self):
 
         method_path = 'rate_limit_status'
         url = self._join_url(method_path)
         resp = self.get(url)
 
-        limit = AccountLimits.new_from_dict(resp['limits'], h=self)
+        limit = self._model(AccountLimits, resp['limits'])
 
         return limit
 
+    @instrumented
     def get_packages(self, offset=0, limit=20):
         method_path = 'packages?offset=%d&limit=%d' % (offset, limit)
         url = self._join_url(method_path)
         resp = self.get(url)
-        packages = [Package.new_from_dict(item, h=self) for item in resp]
+        packages = [self._model(Package, item) for item in resp]
 
         return packages
 
+    @instrumented
     def get_package(self, id):
         method_path = 'packages/%s' % id
         url = self._join_url(method_path)
         resp = self.get(url)
-        package = Package.new_from_dict(resp, h=self)
+        package = self._model(Package, resp)
 
         return package
 
-    def get_schedules(self):
-        method_path = 'schedules'
+    @instrumented
+    def get_schedules(self, status=None, since=None, until=None, sort=None,
+                      direction=None, offset=None, limit=None):
+        """
+        :param status: Only schedules with this status, e.g. ``'enabled'``.
+        :param since: Only schedules updated at or after this datetime.
+        :param until: Only schedules updated before this datetime.
+        :param sort: Field to sort by, e.g. ``'created'`` or ``'updated'``.
+        :param direction: ``'asc'`` or ``'desc'``.
+        :param offset: Number of schedules to skip.
+        :param limit: Maximum number of schedules to return.
+        """
+        method_path = self._list_path(
+            'schedules', status=status, since=since, until=until, sort=sort,
+            direction=direction, offset=offset, limit=limit)
         url = self._join_url(method_path)
         resp = self.get(url)
-        return [Schedule.new_from_dict(item, h=self) for item in resp]
-
+        return [self._model(Schedule, item) for item in resp]
+
+    def stream_schedules(self, **filters):
+        """Like :meth:`get_schedules`, but yields schedules while the response is read."""
+        path = self._list_path('schedules', **filters)
+        for item in self.stream(self._join_url(path)):
+            yield self._model(Schedule, item)
+
+    def get_columns(self, resource, fields=None, page_size=100, **filters):
+        """Lists ``'jobs'``, ``'clusters'``, ``'packages'`` or ``'schedules'``
+        into :class:`Columns`, one typed array per field.
+
+        Records are decoded into the columns while the response is read,
+        without building a model per record. Clusters and packages are
+        listed a page at a time, like :meth:`iter_clusters`, unless an
+        ``offset`` or ``limit`` is given.
+
+        :param fields: Fields to keep; all declared fields by default.
+        :param page_size: Records per request for clusters and packages.
+        :param filters: List parameters, as for :meth:`get_jobs`.
+        """
+        columns = Columns(LIST_MODELS[resource], fields)
+        if (resource not in PAGED_LISTINGS
+                or 'offset' in filters or 'limit' in filters):
+            path = self._list_path(resource, **filters)
+            columns.extend(self.stream(self._join_url(path)))
+            return columns
+        offset = 0
+        while True:
+            path = self._list_path(resource, offset=offset, limit=page_size,
+                                   **filters)
+            before = len(columns)
+            columns.extend(self.stream(self._join_url(path)))
+            if len(columns) == before:
+                return columns
+            offset += len(columns) - before
+
+    @instrumented
     def get_schedule(self, id):
         method_path = 'schedules/%s' % id
         url = self._join_url(method_path)
         resp = self.get(url)
-        return Schedule.new_from_dict(resp, h=self)
+        return self._model(Schedule, resp)
+
+    def _bulk(self, func, ids, max_concurrency):
+        """Calls ``func(id)`` for every ID concurrently, collecting errors per ID."""
+        ids = list(collections.OrderedDict.fromkeys(ids))
+        result = BulkResult()
+        if not ids:
+            return result
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = [(id, executor.submit(func, id)) for id in ids]
+            for id, future in futures:
+                try:
+                    result[id] = future.result()
+                except Exception as error:
+                    # recorded, so one failure does not lose the others
+                    result[id] = error
+        return result
+
+    def get_clusters_by_id(self, ids, max_concurrency=8):
+        return self._bulk(self.get_cluster, ids, max_concurrency)
+
+    def terminate_clusters(self, ids, max_concurrency=8):
+        return self._bulk(self.terminate_cluster, ids, max_concurrency)
+
+    def get_jobs_by_id(self, ids, max_concurrency=8):
+        return self._bulk(self.get_job, ids, max_concurrency)
+
+    def stop_jobs(self, ids, max_concurrency=8):
+        return self._bulk(self.stop_job, ids, max_concurrency)
+
+    def _iter_pages(self, get_page, page_size, prefetch):
+        """Yields items from ``get_page(offset, limit)`` one page at a time.
+
+        With ``prefetch`` the next page is requested in a background thread
+        while the items of the current page are being consumed.
+
+        Each page starts after the items received so far, and the listing
+        ends with the first empty page.
+        """
+        executor = None
+        if prefetch:
+            from concurrent.futures import ThreadPoolExecutor
+            executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            offset = 0
+            page = get_page(offset, page_size)
+            while True:
+                # the server may cap the limit below page_size, so only
+                # an empty page marks the end of the listing
+                offset += len(page)
+                more = bool(page)
+                if more and executor:
+                    next_page = executor.submit(get_page, offset, page_size)
+                for item in page:
+                    yield item
+                if not more:
+                    return
+                if executor:
+                    page = next_page.result()
+                else:
+                    page = get_page(offset, page_size)
+        finally:
+            if executor:
+                executor.shutdown(wait=False)
+
+    def iter_clusters(self, page_size=20, prefetch=False, **filters):
+        """Iterates over all clusters, fetching pages of ``page_size`` lazily.
+
+        ``filters`` are passed on to :meth:`get_clusters`.
+        """
+        return self._iter_pages(functools.partial(self.get_clusters, **filters),
+                                page_size, prefetch)
+
+    def iter_packages(self, page_size=20, prefetch=False):
+        """Iterates over all packages, fetching pages of ``page_size`` lazily."""
+        return self._iter_pages(self.get_packages, page_size, prefetch)
 
     @property
     def clusters(self):